@@ -1,9 +1,11 @@
 import requests
-from bs4 import BeautifulSoup
-import psycopg2
-from db_config import DB_CONFIG  # Database configuration
 from nse500_stock_list import nse500stocklist  # List of stock symbols
-import time
+from atts_nse500_screener_query import mark_load_complete  # Refresh screening store after load
+from atts_nse500_pipeline import parse_section, run_pipeline  # Streaming loader
+from atts_nse500_db_writer import insert_row  # Per-row savepoints and rejects
+from atts_nse500_history import HISTORY_ENABLED, period_values, record_history  # Point-in-time history
+from atts_nse500_fetch import fetch_page  # Rate-controlled fetch
+from atts_nse500_schema import ensure_schema  # Create/migrate tables once per run
 
 # Headers for HTTP requests
 HEADERS = {"User-Agent": "Mozilla/5.0"}
@@ -35,33 +37,37 @@ def clean_numeric(value):
 
 # Function to scrape stock data
 def scrape_stock_data(stock_symbol):
+    """Yield one row per period once the balance-sheet section has been parsed."""
     url = f"https://www.screener.in/company/{stock_symbol}/"
     print(f"Fetching data for {stock_symbol}...")
 
     try:
-        response = requests.get(url, headers=HEADERS)
+        response = fetch_page(url, headers=HEADERS)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         print(f"❌ Request failed for {stock_symbol}: {e}")
-        return None, None
+        return
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    # Parse only the balance-sheet section and drop the raw page straight away
+    soup = parse_section(response.content, "section", id="balance-sheet")
+    response.close()
+    del response
     balance_sheet_section = soup.find("section", {"id": "balance-sheet"})
 
     if not balance_sheet_section:
         print(f"No balance-sheet section found for {stock_symbol}")
-        return None, None
+        return
 
     table = balance_sheet_section.find("table", {"class": "data-table"})
     if not table:
         print(f"No financial data found for {stock_symbol}")
-        return None, None
+        return
 
     # Extract column headers (years)
     headers = [th.text.strip() for th in table.find("thead").find_all("th")]
     if len(headers) < 2:
         print(f"No valid yearly headers found for {stock_symbol}")
-        return None, None
+        return
 
     yearly_headers = headers[1:]  # Skip first column (metric names)
     print(f"Extracted Years: {yearly_headers}")
@@ -83,15 +89,14 @@ def scrape_stock_data(stock_symbol):
         else:
             print(f"⚠️ Metric not matched: {metric_name}")
 
-    # Format stock data for database storage
-    stock_data = []
+    # Release the parsed document before handing rows downstream
+    soup.decompose()
+
     for i, year in enumerate(yearly_headers):
         row_data = [year]
         for metric in REQUIRED_METRICS:
             row_data.append(financial_dict[metric][i] if i < len(financial_dict[metric]) else None)
-        stock_data.append(row_data)
-
-    return yearly_headers, stock_data
+        yield row_data
 
 # Function to format table name
 def format_table_name(stock_symbol):
@@ -99,41 +104,13 @@ def format_table_name(stock_symbol):
         return f"stock_{stock_symbol.lower()}_balance_sheet"
     return f"{stock_symbol.lower()}_balance_sheet"
 
-# Function to create stock table
-def create_stock_table(stock_symbol):
-    table_name = format_table_name(stock_symbol)
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-
-    create_table_query = f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        id SERIAL PRIMARY KEY,
-        yearly VARCHAR(20),
-        equity_capital NUMERIC,
-        reserves NUMERIC,
-        borrowings NUMERIC,
-        other_liabilities NUMERIC,
-        total_liabilities NUMERIC,
-        fixed_assets NUMERIC,
-        cwip NUMERIC,
-        investments NUMERIC,
-        other_assets NUMERIC,
-        total_assets NUMERIC
-    );
-    """
-    cursor.execute(create_table_query)
-    conn.commit()
-    cursor.close()
-    conn.close()
-
 # Function to store data in PostgreSQL
-def store_data_in_postgres(stock_symbol, data):
+def store_data_in_postgres(cursor, stock_symbol, data):
+    """Insert rows with the pipeline's cursor; a refused row goes to the reject table."""
     if not data:
         return
 
     table_name = format_table_name(stock_symbol)
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
 
     insert_query = f"""
     INSERT INTO {table_name} (
@@ -142,26 +119,19 @@ def store_data_in_postgres(stock_symbol, data):
     ) VALUES ( %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
     """
 
+    stored = []
     for row in data:
         row = [None if value == '-' else value for value in row]
+        if insert_row(cursor, stock_symbol, insert_query, tuple(row)):
+            stored.append(row)
 
-        try:
-            cursor.execute(insert_query, tuple(row))
-        except Exception as e:
-            print(f"❌ Error inserting data for {stock_symbol}: {row}\n{e}")
-            conn.rollback()
+    if HISTORY_ENABLED:
+        record_history(cursor, "balance_sheet", stock_symbol, period_values("balance_sheet", stored))
 
-    conn.commit()
-    cursor.close()
-    conn.close()
     print(f"✅ Data stored for {stock_symbol} in {table_name}!")
 
-# Loop through stock symbols
-for stock in nse500stocklist:
-    create_stock_table(stock)
-    yearly_headers, stock_data = scrape_stock_data(stock)
-    if stock_data:
-        store_data_in_postgres(stock, stock_data)
-    time.sleep(2)
-
-print("🎯 Data scraping and database storage completed successfully!")
+if __name__ == "__main__":
+    ensure_schema(["balance_sheet"], nse500stocklist)
+    run_pipeline(nse500stocklist, scrape_stock_data, store_data_in_postgres)
+    mark_load_complete("balance_sheet")
+    print("🎯 Data scraping and database storage completed successfully!")
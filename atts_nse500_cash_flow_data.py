@@ -1,9 +1,11 @@
 import requests
-from bs4 import BeautifulSoup
-import psycopg2
-from db_config import DB_CONFIG
 from nse500_stock_list import nse500stocklist
-import time
+from atts_nse500_screener_query import mark_load_complete  # Refresh screening store after load
+from atts_nse500_pipeline import parse_section, run_pipeline  # Streaming loader
+from atts_nse500_db_writer import insert_row  # Per-row savepoints and rejects
+from atts_nse500_history import HISTORY_ENABLED, period_values, record_history  # Point-in-time history
+from atts_nse500_fetch import fetch_page  # Rate-controlled fetch
+from atts_nse500_schema import ensure_schema  # Create/migrate tables once per run
 
 HEADERS = {"User-Agent": "Mozilla/5.0"}
 
@@ -24,28 +26,36 @@ def clean_numeric(value):
         return None
 
 def scrape_stock_data(stock_symbol):
+    """Yield one row per period once the cash-flow section has been parsed."""
     url = f"https://www.screener.in/company/{stock_symbol}/"
     print(f"Fetching data for {stock_symbol}...")
 
     try:
-        response = requests.get(url, headers=HEADERS)
+        response = fetch_page(url, headers=HEADERS)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         print(f"❌ Request failed for {stock_symbol}: {e}")
-        return None, None
+        return
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    # Parse only the cash-flow section and drop the raw page straight away
+    soup = parse_section(response.content, "section", id="cash-flow")
+    response.close()
+    del response
     shareholding_section = soup.find("section", {"id": "cash-flow"})
+    if not shareholding_section:
+        print(f"⚠️ No cash-flow section found for {stock_symbol}")
+        return
+
     div_class_section = shareholding_section.find("div" ,{"class": "responsive-holder"})
-    table = div_class_section.find("table", {"class": "data-table"})
+    table = div_class_section.find("table", {"class": "data-table"}) if div_class_section else None
     if not table:
         print(f"⚠️ No shareholding table found for {stock_symbol}")
-        return None, None
+        return
 
     headers = [th.get_text(strip=True) for th in table.find("thead").find_all("th")] if table.find("thead") else []
     if len(headers) < 2:
         print(f"⚠️ No valid headers found for {stock_symbol}")
-        return None, None
+        return
 
     yearly_headers = headers[1:]
     rows = table.find("tbody").find_all("tr") if table.find("tbody") else []
@@ -84,14 +94,14 @@ def scrape_stock_data(stock_symbol):
             financial_dict["No. of Shareholders"] = values
         """
 
-    stock_data = []
+    # Release the parsed document before handing rows downstream
+    soup.decompose()
+
     for i, year in enumerate(yearly_headers):
         row_data = [year]
         for metric in REQUIRED_METRICS:
             row_data.append(financial_dict[metric][i] if i < len(financial_dict[metric]) else None)
-        stock_data.append(row_data)
-
-    return yearly_headers, stock_data
+        yield row_data
 
 def format_table_name(stock_symbol):
     table_name = stock_symbol.lower().replace("-", "_").replace(".", "_")
@@ -99,33 +109,12 @@ def format_table_name(stock_symbol):
         table_name = "stock_" + table_name
     return f"{table_name}_cash_flow"
 
-def create_stock_table(stock_symbol):
-    table_name = format_table_name(stock_symbol)
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-
-    create_table_query = f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        id SERIAL PRIMARY KEY,
-        yearly VARCHAR(20),
-        cash_from_operating_activity NUMERIC,
-        cash_from_investing_activity NUMERIC,
-        cash_from_financing_activity NUMERIC,
-        net_cash_flow NUMERIC
-    );
-    """
-    cursor.execute(create_table_query)
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-def store_data_in_postgres(stock_symbol, data):
+def store_data_in_postgres(cursor, stock_symbol, data):
+    """Insert rows with the pipeline's cursor; a refused row goes to the reject table."""
     if not data:
         return
 
     table_name = format_table_name(stock_symbol)
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
 
     insert_query = f"""
     INSERT INTO {table_name} (
@@ -133,24 +122,19 @@ def store_data_in_postgres(stock_symbol, data):
     ) VALUES (%s, %s, %s, %s, %s);
     """
 
+    stored = []
     for row in data:
         row = [None if value == '-' else value for value in row]
-        try:
-            cursor.execute(insert_query, tuple(row))
-        except Exception as e:
-            print(f"❌ Error inserting data for {stock_symbol}: {row}\n{e}")
-            conn.rollback()
-
-    conn.commit()
-    cursor.close()
-    conn.close()
-    print(f"✅ Data stored for {stock_symbol} in {table_name}!")
+        if insert_row(cursor, stock_symbol, insert_query, tuple(row)):
+            stored.append(row)
+
+    if HISTORY_ENABLED:
+        record_history(cursor, "cash_flow", stock_symbol, period_values("cash_flow", stored))
 
-for stock in nse500stocklist:
-    create_stock_table(stock)
-    yearly_headers, stock_data = scrape_stock_data(stock)
-    if stock_data:
-        store_data_in_postgres(stock, stock_data)
-    time.sleep(2)
+    print(f"✅ Data stored for {stock_symbol} in {table_name}!")
 
-print("🎯 Data scraping and database storage completed successfully!")
+if __name__ == "__main__":
+    ensure_schema(["cash_flow"], nse500stocklist)
+    run_pipeline(nse500stocklist, scrape_stock_data, store_data_in_postgres)
+    mark_load_complete("cash_flow")
+    print("🎯 Data scraping and database storage completed successfully!")
@@ -0,0 +1,201 @@
+# atts_nse500_changefeed.py - Change feed for downstream consumers
+#
+# Every commit the loaders make also writes one changelog entry per
+# (dataset, symbol) it touched, listing the periods written, and sends a
+# NOTIFY on CHANGE_CHANNEL in the same transaction. Consumers LISTEN on the
+# channel, then read changelog rows with a batch_id above the last one they
+# processed. Anything sent while a consumer was offline stays in the
+# changelog, so nothing is missed and no one needs to poll or rescan tables.
+#
+# Batch ids are handed out under a transaction-scoped advisory lock that is
+# held until the writer commits, so batches become visible in batch_id order
+# and a consumer's "batch_id > last" cursor can never step over a batch that
+# was still in flight. Writers call record_changes() last, right before
+# commit, which keeps the time they spend serialized on the lock short.
+#
+# Usage:
+#   python atts_nse500_changefeed.py --since 0            # print changes after batch 0
+#   python atts_nse500_changefeed.py --follow             # stream new changes as they commit
+
+import argparse
+import json
+import os
+import select
+import sys
+
+import psycopg2
+from db_config import DB_CONFIG
+from atts_nse500_datasets import DATASETS, LATEST_PERIOD
+
+CHANGELOG_TABLE = "nse500_changelog"
+CHANGE_CHANNEL = "nse500_changes"
+CHANGELOG_LOCK_KEY = "nse500_changelog_batch"
+CHANGE_FEED_ENABLED = os.getenv("ATTS_CHANGE_FEED", "true").lower() == "true"
+MAX_NOTIFY_BYTES = 7900  # Postgres rejects NOTIFY payloads of 8000 bytes or more
+
+_store_datasets = None  # (module, function name) -> dataset
+
+
+# Function to create the changelog table
+def create_changelog_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {CHANGELOG_TABLE} (
+        id BIGSERIAL PRIMARY KEY,
+        batch_id BIGINT NOT NULL,
+        dataset VARCHAR(20) NOT NULL,
+        stock_symbol TEXT NOT NULL,
+        periods TEXT[],
+        row_count INT NOT NULL,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """)
+    cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {CHANGELOG_TABLE}_batch_seq;")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {CHANGELOG_TABLE}_batch_idx ON {CHANGELOG_TABLE} (batch_id);")
+
+
+# Function to find which dataset a store function writes
+def dataset_for_store(store):
+    global _store_datasets
+    if _store_datasets is None:
+        _store_datasets = {(spec["loader"][0], spec["loader"][2]): name for name, spec in DATASETS.items()}
+    # Use the defining file, since a dataset script run directly is "__main__"
+    module = os.path.splitext(os.path.basename(store.__code__.co_filename))[0]
+    return _store_datasets.get((module, store.__name__))
+
+
+# Function to list the periods a group of rows covers
+def row_periods(dataset, rows):
+    if DATASETS[dataset]["period_column"] is None:
+        return [LATEST_PERIOD]
+    return sorted({str(row[0]) for row in rows if row and row[0] is not None})
+
+
+# Function to log changes and notify listeners inside the caller's transaction
+def record_changes(cursor, changes):
+    """Log (dataset, stock_symbol, periods, row_count) entries as one batch; return its id.
+
+    Call it as the last statement before commit: the batch id lock is held
+    until the transaction ends.
+    """
+    if not CHANGE_FEED_ENABLED or not changes:
+        return None
+    # A missing changelog must never cost the caller its data rows
+    cursor.execute("SAVEPOINT change_feed;")
+    try:
+        batch_id = _log_batch(cursor, changes)
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT change_feed;")
+        print(f"⚠️ Change feed not recorded: {e}")
+        return None
+    cursor.execute("RELEASE SAVEPOINT change_feed;")
+    return batch_id
+
+
+def _log_batch(cursor, changes):
+    # Held until commit, so no later batch id can become visible before this one
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (CHANGELOG_LOCK_KEY,))
+    cursor.execute(f"SELECT nextval('{CHANGELOG_TABLE}_batch_seq');")
+    batch_id = cursor.fetchone()[0]
+    values = ", ".join(
+        cursor.mogrify("(%s, %s, %s, %s, %s)", (batch_id, dataset, symbol, periods, row_count)).decode()
+        for dataset, symbol, periods, row_count in changes
+    )
+    cursor.execute(
+        f"INSERT INTO {CHANGELOG_TABLE} (batch_id, dataset, stock_symbol, periods, row_count) VALUES {values};"
+    )
+
+    payload = {
+        "batch_id": batch_id,
+        "datasets": sorted({change[0] for change in changes}),
+        "symbols": sorted({change[1] for change in changes}),
+    }
+    message = json.dumps(payload, separators=(",", ":"))
+    if len(message.encode()) > MAX_NOTIFY_BYTES:
+        # Large batches only announce themselves; details stay in the changelog
+        del payload["symbols"]
+        payload["truncated"] = True
+        message = json.dumps(payload, separators=(",", ":"))
+    cursor.execute("SELECT pg_notify(%s, %s);", (CHANGE_CHANNEL, message))
+    return batch_id
+
+
+# Function to read changelog entries after a batch id
+def changes_since(cursor, batch_id=0, batches=100):
+    """Return the entries of up to `batches` whole batches after batch_id."""
+    cursor.execute(f"""
+    SELECT batch_id, dataset, stock_symbol, periods, row_count, changed_at
+    FROM {CHANGELOG_TABLE}
+    WHERE batch_id IN (
+        SELECT DISTINCT batch_id FROM {CHANGELOG_TABLE} WHERE batch_id > %s ORDER BY batch_id LIMIT %s
+    )
+    ORDER BY batch_id, id;
+    """, (batch_id, batches))
+    return cursor.fetchall()
+
+
+# Function to call handler(entries) for every new batch, resuming after `since`
+def follow(handler, since=0, poll_seconds=60):
+    """LISTEN for change notifications and pass each batch's changelog rows to handler.
+
+    The changelog is re-read on every wake-up (and at least every poll_seconds),
+    so notifications missed while disconnected are still picked up.
+    """
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    create_changelog_table(cursor)
+    cursor.execute(f"LISTEN {CHANGE_CHANNEL};")
+    last = since
+    try:
+        while True:
+            entries = changes_since(cursor, last)
+            batch = []
+            for entry in entries:
+                if batch and entry[0] != batch[0][0]:
+                    handler(batch)
+                    batch = []
+                batch.append(entry)
+            if batch:
+                handler(batch)
+            if entries:
+                last = entries[-1][0]
+                continue  # More batches may be waiting
+            if select.select([conn], [], [], poll_seconds) != ([], [], []):
+                conn.poll()
+                conn.notifies.clear()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def print_batch(entries):
+    for batch_id, dataset, symbol, periods, row_count, changed_at in entries:
+        print(f"{batch_id:>8}  {changed_at:%Y-%m-%d %H:%M:%S}  {dataset:<14} {symbol:<12} "
+              f"{row_count:>4} rows  {', '.join(periods or [])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or follow the NSE500 change feed.")
+    parser.add_argument("--since", type=int, default=0, help="Show batches after this batch id")
+    parser.add_argument("--follow", action="store_true", help="Keep listening for new batches")
+    args = parser.parse_args(argv)
+
+    if args.follow:
+        try:
+            follow(print_batch, args.since)
+        except KeyboardInterrupt:
+            print("\n🛑 Change feed stopped.")
+        return 0
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    create_changelog_table(cursor)
+    conn.commit()
+    print_batch(changes_since(cursor, args.since))
+    cursor.close()
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# atts_nse500_cube.py - Dense symbol x period x metric cube as memory-mapped snapshots
+#
+# Backtests want one float array indexed by (symbol, period, metric) across
+# the yearly ratios, profit-loss, balance-sheet and cash-flow data. After a
+# load, build_cube() materializes that array from the metric store into a
+# versioned .npy file plus a JSON index. load_cube() memory-maps the newest
+# (or a given) snapshot read-only, so loading is near-instant and every
+# worker process shares the same pages.
+#
+# Usage:
+#   python atts_nse500_cube.py            # build a new snapshot
+#   python atts_nse500_cube.py --list     # list snapshots
+#
+#   cube = load_cube()
+#   roce = cube.metric("ratios.roce")     # (symbol, period) view
+#   tcs = cube.symbol("TCS")              # (period, metric) view
+
+import argparse
+import glob
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency; only needed for the cube
+    np = None
+
+import psycopg2
+from db_config import DB_CONFIG
+from atts_nse500_datasets import DATASETS
+
+CUBE_DATASETS = ("ratios", "profit_loss", "balance_sheet", "cash_flow")
+CUBE_DIR = os.getenv("ATTS_CUBE_DIR", "cube_snapshots")
+CUBE_KEEP = int(os.getenv("ATTS_CUBE_KEEP", "3"))  # Snapshots kept on disk
+CUBE_ENABLED = os.getenv("ATTS_BUILD_CUBE", "true").lower() == "true"
+LATEST_FILE = "LATEST"
+
+MONTHS = {name: i for i, name in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1)}
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("numpy is required for the metric cube (pip install numpy)")
+
+
+# Function to sort period labels chronologically ("Mar 2023" < "Mar 2024" < "TTM")
+def period_sort_key(label):
+    parts = label.split()
+    if len(parts) == 2 and parts[0] in MONTHS and parts[1].isdigit():
+        return (0, int(parts[1]) * 12 + MONTHS[parts[0]], label)
+    return (1, 0, label)
+
+
+class Cube:
+    """Read-only view of one cube snapshot."""
+
+    def __init__(self, data, symbols, periods, metrics, version):
+        self.data = data
+        self.symbols = symbols
+        self.periods = periods
+        self.metrics = metrics
+        self.version = version
+        self.symbol_index = {symbol: i for i, symbol in enumerate(symbols)}
+        self.period_index = {period: i for i, period in enumerate(periods)}
+        self.metric_index = {metric: i for i, metric in enumerate(metrics)}
+
+    # Function to get a (symbol, period) view of one "dataset.metric"
+    def metric(self, name):
+        return self.data[:, :, self.metric_index[name]]
+
+    # Function to get a (period, metric) view of one symbol
+    def symbol(self, stock_symbol):
+        return self.data[self.symbol_index[stock_symbol]]
+
+    # Function to get a (symbol, metric) view of one period
+    def period(self, label):
+        return self.data[:, self.period_index[label], :]
+
+    def value(self, stock_symbol, period, metric):
+        return float(self.data[self.symbol_index[stock_symbol], self.period_index[period], self.metric_index[metric]])
+
+
+# Function to build a new snapshot from the metric store
+def build_cube(datasets=CUBE_DATASETS, cube_dir=CUBE_DIR):
+    """Materialize the cube and point LATEST at it; return the snapshot version."""
+    _require_numpy()
+    from atts_nse500_screener_query import METRIC_STORE_TABLE
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT DISTINCT stock_symbol FROM {METRIC_STORE_TABLE} WHERE dataset = ANY(%s);",
+                   (list(datasets),))
+    symbols = sorted(row[0] for row in cursor.fetchall())
+    cursor.execute(f"SELECT DISTINCT period FROM {METRIC_STORE_TABLE} WHERE dataset = ANY(%s);",
+                   (list(datasets),))
+    periods = sorted((row[0] for row in cursor.fetchall()), key=period_sort_key)
+    cursor.close()
+
+    metrics = [f"{dataset}.{metric}" for dataset in datasets for metric in DATASETS[dataset]["metrics"]]
+    symbol_index = {symbol: i for i, symbol in enumerate(symbols)}
+    period_index = {period: i for i, period in enumerate(periods)}
+    metric_index = {metric: i for i, metric in enumerate(metrics)}
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    os.makedirs(cube_dir, exist_ok=True)
+    data_path = os.path.join(cube_dir, f"cube-{version}.npy")
+    tmp_path = data_path + ".tmp"
+
+    shape = (len(symbols), len(periods), len(metrics))
+    data = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float64, shape=shape)
+    data[:] = np.nan
+    # Stream the values through a server-side cursor so memory stays flat
+    # however large the universe is
+    cursor = conn.cursor(name="cube_values")
+    cursor.itersize = 20000
+    cursor.execute(f"""
+    SELECT stock_symbol, period, dataset || '.' || metric, value::float8 FROM {METRIC_STORE_TABLE}
+    WHERE dataset = ANY(%s) AND value IS NOT NULL;
+    """, (list(datasets),))
+    for symbol, period, metric, value in cursor:
+        if metric in metric_index:
+            data[symbol_index[symbol], period_index[period], metric_index[metric]] = value
+    cursor.close()
+    conn.close()
+    data.flush()
+    del data
+    os.replace(tmp_path, data_path)
+
+    index = {"version": version, "symbols": symbols, "periods": periods, "metrics": metrics}
+    with open(os.path.join(cube_dir, f"cube-{version}.json"), "w") as f:
+        json.dump(index, f)
+
+    # Point LATEST at the new snapshot atomically
+    latest_tmp = os.path.join(cube_dir, LATEST_FILE + ".tmp")
+    with open(latest_tmp, "w") as f:
+        f.write(version)
+    os.replace(latest_tmp, os.path.join(cube_dir, LATEST_FILE))
+
+    prune_snapshots(cube_dir)
+    print(f"✅ Cube {version} built: {shape[0]} symbols x {shape[1]} periods x {shape[2]} metrics.")
+    return version
+
+
+# Function to list snapshot versions, oldest first
+def list_snapshots(cube_dir=CUBE_DIR):
+    paths = glob.glob(os.path.join(cube_dir, "cube-*.json"))
+    return sorted(os.path.basename(path)[len("cube-"):-len(".json")] for path in paths)
+
+
+# Function to delete all but the newest CUBE_KEEP snapshots
+def prune_snapshots(cube_dir=CUBE_DIR, keep=CUBE_KEEP):
+    for version in list_snapshots(cube_dir)[:-keep]:
+        for suffix in (".npy", ".json"):
+            try:
+                os.remove(os.path.join(cube_dir, f"cube-{version}{suffix}"))
+            except OSError:
+                pass
+
+
+# Function to memory-map a snapshot (the newest one by default)
+def load_cube(version=None, cube_dir=CUBE_DIR):
+    _require_numpy()
+    if version is None:
+        with open(os.path.join(cube_dir, LATEST_FILE)) as f:
+            version = f.read().strip()
+    with open(os.path.join(cube_dir, f"cube-{version}.json")) as f:
+        index = json.load(f)
+    data = np.load(os.path.join(cube_dir, f"cube-{version}.npy"), mmap_mode="r")
+    return Cube(data, index["symbols"], index["periods"], index["metrics"], version)
+
+
+# Function to rebuild the cube after a load of one of its datasets
+def refresh_cube_after_load(dataset):
+    if not CUBE_ENABLED or dataset not in CUBE_DATASETS:
+        return
+    if np is None:
+        print("⚠️ Skipping metric cube build: numpy is not installed.")
+        return
+    try:
+        build_cube()
+    except Exception as e:
+        print(f"⚠️ Metric cube build failed: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or list metric cube snapshots.")
+    parser.add_argument("--list", action="store_true", help="List snapshots instead of building one")
+    args = parser.parse_args(argv)
+    if args.list:
+        for version in list_snapshots():
+            print(version)
+        return 0
+    build_cube()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
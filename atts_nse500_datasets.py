@@ -0,0 +1,106 @@
+# atts_nse500_datasets.py - Shared description of the seven NSE500 datasets
+#
+# Each atts_nse500_*_data.py script owns its own scraping. This registry
+# describes the per-symbol table layouts (table naming, period column, metric
+# columns) so the schema manager can create them and cross-dataset tools can
+# read them without importing the scripts themselves. "loader" names the
+# script module and its extract/store functions for tools that drive several
+# datasets in one process.
+
+import importlib
+
+DATASETS = {
+    "fundamental": {
+        "loader": ("atts_nse500_fundamental_data", "iter_stock_data", "insert_stock_data"),
+        "suffix": "fundamental",
+        "sanitize": False,
+        "period_column": None,
+        "metrics": [
+            "market_cap", "current_price", "high_52w", "low_52w", "stock_pe", "book_value",
+            "dividend_yield", "roce", "roe", "face_value"
+        ],
+    },
+    "quarterly": {
+        "loader": ("atts_nse500_quarterly_data", "scrape_stock_data", "store_data_in_postgres"),
+        "suffix": "quarterly",
+        "sanitize": False,
+        "period_column": "quarter",
+        "metrics": [
+            "sales", "revenue", "expenses", "financing_profit", "operating_profit",
+            "financing_margin_percent", "opm", "other_income", "interest", "depreciation",
+            "profit_before_tax", "tax", "net_profit", "eps", "gross_npa_percent", "net_npa_percent"
+        ],
+        "extra_columns": {"raw_pdf_link": "TEXT"},
+    },
+    "profit_loss": {
+        "loader": ("atts_nse500_profit_loss_data", "scrape_stock_data", "store_data_in_postgres"),
+        "suffix": "profit_loss",
+        "sanitize": False,
+        "period_column": "yearly",
+        "metrics": [
+            "sales", "revenue", "expenses", "financing_profit", "operating_profit",
+            "financing_margin", "opm", "other_income", "interest", "depreciation",
+            "profit_before_tax", "tax", "net_profit", "eps", "dividend_payout"
+        ],
+    },
+    "balance_sheet": {
+        "loader": ("atts_nse500_balance_sheet_data", "scrape_stock_data", "store_data_in_postgres"),
+        "suffix": "balance_sheet",
+        "sanitize": False,
+        "period_column": "yearly",
+        "metrics": [
+            "equity_capital", "reserves", "borrowings", "other_liabilities", "total_liabilities",
+            "fixed_assets", "cwip", "investments", "other_assets", "total_assets"
+        ],
+    },
+    "cash_flow": {
+        "loader": ("atts_nse500_cash_flow_data", "scrape_stock_data", "store_data_in_postgres"),
+        "suffix": "cash_flow",
+        "sanitize": True,
+        "period_column": "yearly",
+        "metrics": [
+            "cash_from_operating_activity", "cash_from_investing_activity",
+            "cash_from_financing_activity", "net_cash_flow"
+        ],
+    },
+    "ratios": {
+        "loader": ("atts_nse500_ratios_data", "scrape_stock_data", "store_data_in_postgres"),
+        "suffix": "ratios",
+        "sanitize": True,
+        "period_column": "yearly",
+        "metrics": [
+            "debtor_days", "inventory_days", "days_payable", "cash_conversion_cycle",
+            "working_capital_days", "roce", "roe"
+        ],
+    },
+    "shareholding": {
+        "loader": ("atts_nse500_shareholding_data", "scrape_stock_data", "store_data_in_postgres"),
+        "suffix": "shareholding_pattern",
+        "sanitize": True,
+        "period_column": "quarterly",
+        "metrics": [
+            "promoters", "fiis", "diis", "government", "public", "no_of_shareholders"
+        ],
+    },
+}
+
+# Period label used for datasets that keep a single latest row per symbol
+LATEST_PERIOD = "latest"
+
+
+# Function to format a dataset table name the same way its script does
+def table_name(dataset, stock_symbol):
+    spec = DATASETS[dataset]
+    name = stock_symbol.lower()
+    if spec["sanitize"]:
+        name = name.replace("-", "_").replace(".", "_")
+    if name[0].isdigit():
+        name = "stock_" + name
+    return f"{name}_{spec['suffix']}"
+
+
+# Function to import a dataset script and return its (extract, store) functions
+def load_dataset_functions(dataset):
+    module_name, extract_name, store_name = DATASETS[dataset]["loader"]
+    module = importlib.import_module(module_name)
+    return getattr(module, extract_name), getattr(module, store_name)
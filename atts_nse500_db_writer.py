@@ -0,0 +1,297 @@
+# atts_nse500_db_writer.py - Background group-commit writer for parsed rows
+#
+# Scrapers hand (store, stock_symbol, rows) groups to an AsyncWriter, which
+# writes them from its own thread and connection. Groups from any dataset
+# are committed together once either max_rows rows are waiting or the
+# oldest group has waited max_delay seconds. The queue is bounded, so when
+# the database falls behind, submit() blocks and the scrapers slow down
+# instead of piling rows up in memory. Each commit also records what it
+# wrote in the change feed (see atts_nse500_changefeed).
+#
+# Store functions insert each row with insert_row(). write_units() first
+# writes a whole unit under one savepoint with plain inserts. Only if the
+# database refuses a row does it roll the unit back and write it again with a
+# savepoint per row, so the bad rows go to the REJECT_TABLE with their error
+# and every other row is kept. A clean commit therefore opens one
+# subtransaction per unit rather than one per row. submit_unit() queues
+# several groups (e.g. all datasets of one symbol) that are written or
+# discarded together.
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR
+from db_config import DB_CONFIG
+from atts_nse500_changefeed import dataset_for_store, record_changes, row_periods
+from atts_nse500_profiling import profile_symbol
+
+WRITER_MAX_ROWS = int(os.getenv("ATTS_BATCH_SIZE", "500"))  # Rows per group commit
+WRITER_MAX_DELAY = float(os.getenv("ATTS_WRITER_MAX_DELAY", "1.0"))  # Seconds a group may wait
+WRITER_QUEUE_SIZE = int(os.getenv("ATTS_WRITER_QUEUE", "64"))  # Symbol groups buffered
+REJECT_TABLE = "nse500_rejected_rows"
+
+# Savepoint wrapped around each unit of groups inside a commit, so a failed
+# unit only discards its own rows and not the whole batch
+SYMBOL_SAVEPOINT = "symbol_rows"
+# Savepoint wrapped around each row when a unit is retried row by row
+ROW_SAVEPOINT = "row_insert"
+
+_STOP = object()
+_local = threading.local()
+
+
+# Function to create the table that keeps rows the database refused
+def create_reject_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {REJECT_TABLE} (
+        id BIGSERIAL PRIMARY KEY,
+        dataset VARCHAR(20),
+        stock_symbol TEXT NOT NULL,
+        row_data JSONB,
+        error TEXT,
+        rejected_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """)
+
+
+class _RowRefused(Exception):
+    """A plain insert was refused; the unit is retried row by row."""
+
+
+# Function to insert one row, under its own savepoint when write_units is isolating bad rows
+def insert_row(cursor, stock_symbol, query, row):
+    """Return True if the row was inserted; a refused row is kept for the reject table."""
+    if getattr(_local, "row_savepoints", True) is False:
+        try:
+            cursor.execute(query, row)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            raise _RowRefused() from e
+        _local.accepted.append(row)
+        return True
+
+    statement = query.strip().rstrip(";")
+    try:
+        # One round trip: the RELEASE only runs if the insert succeeded
+        cursor.execute(f"SAVEPOINT {ROW_SAVEPOINT}; {statement}; RELEASE SAVEPOINT {ROW_SAVEPOINT};", row)
+        accepted = getattr(_local, "accepted", None)
+        if accepted is not None:
+            accepted.append(row)
+        return True
+    except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+        cursor.execute(f"ROLLBACK TO SAVEPOINT {ROW_SAVEPOINT}; RELEASE SAVEPOINT {ROW_SAVEPOINT};")
+        error = str(e).strip().splitlines()[0]
+        print(f"❌ Rejected row for {stock_symbol}: {error}")
+        rejects = getattr(_local, "rejects", None)
+        if rejects is not None:
+            rejects.append((stock_symbol, row, error))
+        return False
+
+
+def _write_rejects(cursor, dataset, rejects):
+    create_reject_table(cursor)  # No-op after ensure_schema; keeps ad-hoc writers working
+    cursor.executemany(
+        f"INSERT INTO {REJECT_TABLE} (dataset, stock_symbol, row_data, error) VALUES (%s, %s, %s, %s);",
+        [(dataset, stock_symbol, json.dumps(row, default=str), error) for stock_symbol, row, error in rejects],
+    )
+
+
+# Function to write units of (store, stock_symbol, rows) groups in a single transaction
+def write_units(conn, units):
+    """Every group of a unit is kept or discarded together; bad rows alone go to the reject table.
+
+    Return a Counter of rows committed per (dataset, stock_symbol).
+    """
+    cursor = conn.cursor()
+    changes, rejected = [], []
+    committed = Counter()
+    for unit in units:
+        cursor.execute(f"SAVEPOINT {SYMBOL_SAVEPOINT};")
+        result = _store_unit(conn, cursor, unit, row_savepoints=False)
+        if result is None:
+            # A row was refused: start the unit over and isolate the bad rows
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {SYMBOL_SAVEPOINT};")
+            result = _store_unit(conn, cursor, unit, row_savepoints=True)
+        unit_changes, unit_rejects, unit_committed, error = result
+
+        if error is not None:
+            # Nothing of this unit is kept; its rows go to the reject table instead
+            symbols = ", ".join(sorted({group[1] for group in unit}))
+            print(f"❌ Discarding rows for {symbols} after a failed write: {error}")
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {SYMBOL_SAVEPOINT};")
+            unit_rejects = [(dataset_for_store(store), [(stock_symbol, row, error) for row in rows])
+                            for store, stock_symbol, rows in unit]
+            unit_changes, unit_committed = [], Counter()
+        cursor.execute(f"RELEASE SAVEPOINT {SYMBOL_SAVEPOINT};")
+        changes.extend(unit_changes)
+        committed.update(unit_committed)
+        rejected.extend(item for item in unit_rejects if item[1])
+
+    for dataset, rejects in rejected:
+        _write_rejects(cursor, dataset, rejects)
+    record_changes(cursor, changes)  # Committed, and notified, together with the rows
+    conn.commit()
+    cursor.close()
+    return committed
+
+
+# Function to run the store functions of one unit
+def _store_unit(conn, cursor, unit, row_savepoints):
+    """Return (changes, rejects, committed, error), or None if a plain insert was refused."""
+    unit_changes, unit_rejects, unit_committed = [], [], Counter()
+    for store, stock_symbol, rows in unit:
+        dataset = dataset_for_store(store)
+        _local.rejects, _local.accepted, _local.row_savepoints = [], [], row_savepoints
+        error = None
+        try:
+            with profile_symbol(store, stock_symbol, "write"):
+                store(cursor, stock_symbol, rows)
+        except _RowRefused:
+            return None
+        except psycopg2.Error as e:
+            error = str(e).strip().splitlines()[0]
+        finally:
+            group_rejects, _local.rejects = _local.rejects, None
+            group_accepted, _local.accepted = _local.accepted, None
+            _local.row_savepoints = None
+        if error is None and conn.get_transaction_status() == TRANSACTION_STATUS_INERROR:
+            error = "insert failed"
+        if error is not None:
+            return unit_changes, unit_rejects, unit_committed, error
+        unit_rejects.append((dataset, group_rejects))
+        unit_committed[(dataset, stock_symbol)] += len(group_accepted)
+        if dataset and group_accepted:
+            # Only rows the database took; rejected periods were never written
+            unit_changes.append((dataset, stock_symbol, row_periods(dataset, group_accepted),
+                                 len(group_accepted)))
+    return unit_changes, unit_rejects, unit_committed, None
+
+
+# Function to write (store, stock_symbol, rows) groups in a single transaction
+def write_groups(conn, groups):
+    return write_units(conn, [[group] for group in groups])
+
+
+class AsyncWriter:
+    """Write row groups on a background thread with group commit and backpressure."""
+
+    def __init__(self, max_rows=WRITER_MAX_ROWS, max_delay=WRITER_MAX_DELAY, queue_size=WRITER_QUEUE_SIZE):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.commits = 0
+        self.rows_written = 0
+        self.blocked_seconds = 0.0
+        self._committed = Counter()  # (dataset, stock_symbol) -> rows committed
+        self._committed_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="atts-db-writer", daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        self._thread.start()
+
+    # Function to queue a group; blocks while the writer is behind
+    def submit(self, store, stock_symbol, rows):
+        self.submit_unit([(store, stock_symbol, rows)])
+
+    # Function to queue groups that must be committed or discarded together
+    def submit_unit(self, groups):
+        self._put(list(groups))
+
+    def _put(self, item):
+        started = time.monotonic()
+        while True:
+            if self._error is not None:
+                raise RuntimeError("Database writer stopped") from self._error
+            try:
+                self._queue.put(item, timeout=1)
+                break
+            except queue.Full:
+                continue
+        self.blocked_seconds += time.monotonic() - started
+
+    # Function to wait until everything submitted so far is committed
+    def flush(self):
+        done = threading.Event()
+        self._put(done)
+        while not done.wait(timeout=1):
+            if self._error is not None or not self._thread.is_alive():
+                break
+        if self._error is not None:
+            raise RuntimeError("Database writer stopped") from self._error
+
+    # Function to read rows committed so far per symbol; flush() first to include everything submitted
+    def committed_rows(self, dataset, symbols):
+        with self._committed_lock:
+            return Counter({symbol: self._committed[(dataset, symbol)] for symbol in symbols
+                            if self._committed[(dataset, symbol)]})
+
+    # Function to flush everything queued and stop the writer thread
+    def close(self):
+        if self._thread.is_alive():
+            while self._thread.is_alive():
+                try:
+                    self._queue.put(_STOP, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+            self._thread.join()
+        print(f"✅ Writer committed {self.rows_written} rows in {self.commits} commits "
+              f"({self.blocked_seconds:.1f}s of backpressure).")
+        if self._error is not None:
+            raise RuntimeError("Database writer stopped") from self._error
+
+    def _run(self):
+        try:
+            conn = psycopg2.connect(**DB_CONFIG)
+        except Exception as e:
+            self._error = e
+            return
+        pending, pending_rows, deadline = [], 0, None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                stopping = item is _STOP
+                flushed = item if isinstance(item, threading.Event) else None
+                if isinstance(item, list):
+                    pending.append(item)
+                    pending_rows += sum(len(rows) for _, _, rows in item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.max_delay
+
+                if pending and (stopping or flushed is not None or pending_rows >= self.max_rows
+                                or time.monotonic() >= deadline):
+                    committed = write_units(conn, pending)
+                    with self._committed_lock:
+                        self._committed.update(committed)
+                    self.commits += 1
+                    self.rows_written += sum(committed.values())
+                    pending, pending_rows, deadline = [], 0, None
+                if flushed is not None:
+                    flushed.set()
+                if stopping:
+                    return
+        except Exception as e:
+            self._error = e
+            print(f"⚠️ Database writer error: {e}")
+            # Keep draining so producers are not left blocked on a full queue
+            while self._queue.get() is not _STOP:
+                pass
+        finally:
+            conn.close()
@@ -0,0 +1,371 @@
+# atts_nse500_fetch.py - Shared screener.in fetch layer with adaptive rate control
+#
+# Every scraper fetches through fetch_page(). A RateController paces
+# requests and caps how many are in flight. It adjusts both limits by AIMD:
+# after each window of responses the rate and concurrency go up additively
+# if the window was healthy, and are halved if it saw 429/5xx responses,
+# network errors or latency above the target. The rate it settles on is
+# saved to ATTS_RATE_STATE and reused by the next run, so no one has to
+# tune fixed sleeps by hand. The pipelines size their worker pools from
+# FETCH_CONCURRENCY_CEILING, so it is acquire() and not a fixed pool size that
+# decides how many requests actually run at once.
+#
+# All seven datasets read the same company page. When several of them run in
+# one process (see atts_nse500_orchestrator), use_page_cache() lets each page
+# be downloaded once and handed to every dataset that asks for it.
+#
+# ATTS_SCREENER_URL redirects every screener.in request to another origin,
+# such as the synthetic stand-in server used for scale tests.
+#
+# ATTS_EGRESS_ROUTES spreads requests over several egress routes, given as a
+# comma-separated list of "direct", proxy URLs (http://host:port, including
+# socks5:// if requests[socks] is installed) and "source=<local IP>". Each
+# route has its own RateController, so every route learns its own budget.
+# Routes that keep failing are cooled down, and each request goes to the
+# healthy route that can send soonest. Aggregate throughput therefore grows
+# with the number of routes.
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RATE_STATE_FILE = os.getenv("ATTS_RATE_STATE", ".atts_rate_state.json")
+INITIAL_RATE = float(os.getenv("ATTS_RATE_INITIAL", "0.5"))  # Requests per second
+MIN_RATE = float(os.getenv("ATTS_RATE_MIN", "0.1"))
+MAX_RATE = float(os.getenv("ATTS_RATE_MAX", "10"))
+MAX_CONCURRENCY = int(os.getenv("ATTS_MAX_CONCURRENCY", "16"))
+LATENCY_TARGET = float(os.getenv("ATTS_LATENCY_TARGET", "3.0"))  # Seconds
+WINDOW_SIZE = 10  # Responses per adjustment
+RATE_STEP = 0.1  # Additive increase per healthy window
+DECREASE_FACTOR = 0.5  # Multiplicative decrease per unhealthy window
+MAX_COOLDOWN = 120  # Seconds
+SCREENER_ORIGIN = "https://www.screener.in"
+SCREENER_URL = os.getenv("ATTS_SCREENER_URL", SCREENER_ORIGIN).rstrip("/")
+EGRESS_ROUTES = os.getenv("ATTS_EGRESS_ROUTES", "direct")
+ROUTE_FAILURE_LIMIT = int(os.getenv("ATTS_ROUTE_FAILURES", "3"))  # Consecutive failures before cool-down
+ROUTE_COOLDOWN = float(os.getenv("ATTS_ROUTE_COOLDOWN", "30"))  # Seconds, doubled on each repeat
+PAGE_CACHE_SIZE = int(os.getenv("ATTS_PAGE_CACHE_SIZE", "256"))  # Pages held for other datasets
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+
+class RateController:
+    """AIMD controller for request rate and concurrency."""
+
+    def __init__(self, state_file=RATE_STATE_FILE, name=None):
+        self.state_file = state_file
+        self.name = name
+        self.rate, self.concurrency = self._load()
+        self.cooldown = 0.0
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._window = []
+
+    def _load(self):
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+            rate = min(MAX_RATE, max(MIN_RATE, float(state["rate"])))
+            concurrency = min(MAX_CONCURRENCY, max(1, int(state["concurrency"])))
+            return rate, concurrency
+        except (OSError, ValueError, KeyError, TypeError):
+            return INITIAL_RATE, 1
+
+    # Function to save the learned rate for the next run
+    def save(self):
+        state = {"rate": round(self.rate, 3), "concurrency": self.concurrency, "saved_at": time.time()}
+        try:
+            with open(self.state_file, "w") as f:
+                json.dump(state, f)
+        except OSError as e:
+            print(f"⚠️ Could not save rate state to {self.state_file}: {e}")
+
+    # Function to wait for a concurrency slot and the next rate slot
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= self.concurrency:
+                self._cond.wait()
+            self._in_flight += 1
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    # Function to record a finished request and adapt the limits
+    def release(self, latency, status, retry_after=None):
+        throttled = status is None or status == 429 or status >= 500
+        with self._cond:
+            self._in_flight -= 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + min(retry_after, MAX_COOLDOWN))
+            self._window.append((latency, throttled))
+            if throttled and status == 429:
+                self._adjust()  # React to explicit throttling straight away
+            elif len(self._window) >= WINDOW_SIZE:
+                self._adjust()
+            self._cond.notify_all()
+
+    def _adjust(self):
+        window, self._window = self._window, []
+        latencies = sorted(latency for latency, _ in window)
+        median = latencies[len(latencies) // 2]
+        if any(throttled for _, throttled in window) or median > LATENCY_TARGET:
+            self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+            self.concurrency = max(1, int(self.concurrency * DECREASE_FACTOR))
+            self.cooldown = min(MAX_COOLDOWN, max(1.0, self.cooldown * 2))
+            route = f" {self.name}" if self.name else ""
+            print(f"🐢 Backing off{route}: {self.rate:.2f} req/s, concurrency {self.concurrency}")
+        else:
+            self.rate = min(MAX_RATE, self.rate + RATE_STEP)
+            if self.concurrency < MAX_CONCURRENCY and self.rate * median > self.concurrency:
+                self.concurrency += 1
+            self.cooldown = 0.0
+        self.save()
+
+    # Function to suggest how long to wait before retrying failed symbols
+    def retry_delay(self):
+        return max(self.cooldown, 1.0 / self.rate)
+
+    # Function to estimate when acquire() would return
+    def available_at(self):
+        with self._cond:
+            slot = max(time.monotonic(), self._next_slot, self._paused_until)
+            if self._in_flight >= self.concurrency:
+                slot += 1.0 / self.rate  # Has to wait for a request to finish first
+            return slot
+
+
+class _SourceAddressAdapter(HTTPAdapter):
+    """Bind outgoing connections to one local address."""
+
+    def __init__(self, source_address, **kwargs):
+        self.source_address = source_address
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["source_address"] = (self.source_address, 0)
+        super().init_poolmanager(*args, **kwargs)
+
+
+class EgressRoute:
+    """One way out to screener.in with its own session, rate budget and health."""
+
+    def __init__(self, spec, state_file):
+        self.name = spec
+        self.session = requests.Session()
+        if spec.startswith("source="):
+            adapter = _SourceAddressAdapter(spec[len("source="):])
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        elif spec != "direct":
+            self.session.proxies = {"http": spec, "https": spec}
+            self.name = spec.split("@")[-1]  # Keep proxy credentials out of logs
+        self.controller = RateController(state_file, name=None if spec == "direct" else self.name)
+        self.requests = self.errors = 0
+        self.failures = 0  # Consecutive failures
+        self.trips = 0  # Cool-downs so far, for exponential back-off
+        self.cooled_until = 0.0
+
+    # Function to record the health outcome of a request
+    def record(self, status, can_cool=True):
+        self.requests += 1
+        if status is None or status in (403, 407) or status >= 500:
+            self.errors += 1
+            self.failures += 1
+            if can_cool and self.failures >= ROUTE_FAILURE_LIMIT:
+                cooldown = min(MAX_COOLDOWN, ROUTE_COOLDOWN * 2 ** self.trips)
+                self.cooled_until = time.monotonic() + cooldown
+                self.trips += 1
+                self.failures = 0
+                print(f"🧊 Egress route {self.name} cooling down for {cooldown:.0f}s")
+        else:
+            self.failures = 0
+            if status < 400:
+                self.trips = 0
+
+
+class EgressPool:
+    """Spread requests over routes by earliest available slot."""
+
+    def __init__(self, specs, state_file=RATE_STATE_FILE):
+        root, ext = os.path.splitext(state_file)
+        self.routes = []
+        for index, spec in enumerate(specs):
+            # The first route keeps the original state file so existing state carries over
+            route_state = state_file if index == 0 else f"{root}.route{index}{ext}"
+            self.routes.append(EgressRoute(spec, route_state))
+        self._lock = threading.Lock()
+
+    # Function to pick a route and wait for its rate slot
+    def acquire(self, exclude=()):
+        while True:
+            now = time.monotonic()
+            candidates = [route for route in self.routes if route not in exclude] or self.routes
+            healthy = [route for route in candidates if route.cooled_until <= now]
+            if healthy:
+                route = min(healthy, key=lambda route: route.controller.available_at())
+                route.controller.acquire()
+                return route
+            time.sleep(max(0.0, min(route.cooled_until for route in candidates) - now))
+
+    def release(self, route, latency, status, retry_after=None):
+        route.controller.release(latency, status, retry_after)
+        with self._lock:
+            # A lone route has nowhere to shift traffic to; its rate controller backs off instead
+            route.record(status, can_cool=len(self.routes) > 1)
+
+    def save(self):
+        for route in self.routes:
+            route.controller.save()
+
+    def summary(self):
+        return ", ".join(f"{route.name}: {route.requests} requests, {route.errors} errors, "
+                         f"{route.controller.rate:.2f} req/s" for route in self.routes)
+
+
+egress_pool = EgressPool([spec.strip() for spec in EGRESS_ROUTES.split(",") if spec.strip()] or ["direct"])
+rate_controller = egress_pool.routes[0].controller
+# Most requests the controllers could ever allow at once across all routes
+FETCH_CONCURRENCY_CEILING = MAX_CONCURRENCY * len(egress_pool.routes)
+atexit.register(egress_pool.save)
+if len(egress_pool.routes) > 1:
+    atexit.register(lambda: print(f"🌐 Egress routes: {egress_pool.summary()}"))
+
+class CachedResponse:
+    """A fully read response that several datasets can parse in turn."""
+
+    def __init__(self, url, status_code, content, headers):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def close(self):
+        pass
+
+
+class PageCache:
+    """Share each successfully fetched page between `consumers` readers.
+
+    Concurrent requests for the same URL wait for the one already in flight.
+    A page is dropped once every consumer has read it, or when more than
+    max_pages are held; a consumer that arrives after that fetches again.
+    """
+
+    def __init__(self, consumers, max_pages=PAGE_CACHE_SIZE):
+        self.consumers = consumers
+        self.max_pages = max_pages
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()  # url -> [response, reads left]
+        self._in_flight = {}  # url -> threading.Event
+
+    def get(self, url, fetch):
+        while True:
+            with self._lock:
+                entry = self._pages.get(url)
+                if entry is not None:
+                    self.hits += 1
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        del self._pages[url]
+                    return entry[0]
+                waiting = self._in_flight.get(url)
+                if waiting is None:
+                    self._in_flight[url] = threading.Event()
+                    self.misses += 1
+                    break
+            waiting.wait()
+            with self._lock:
+                if url not in self._pages:
+                    waiting = None
+            if waiting is None:
+                return fetch()  # The shared fetch failed; try on our own
+
+        try:
+            response = fetch()
+            if response.status_code == 200 and self.consumers > 1:
+                with self._lock:
+                    self._pages[url] = [response, self.consumers - 1]
+                    while len(self._pages) > self.max_pages:
+                        self._pages.popitem(last=False)
+            return response
+        finally:
+            with self._lock:
+                self._in_flight.pop(url).set()
+
+
+_page_cache = None
+
+
+# Function to share fetched pages between `consumers` datasets within the block
+@contextmanager
+def use_page_cache(consumers):
+    global _page_cache
+    _page_cache = PageCache(consumers)
+    try:
+        yield _page_cache
+    finally:
+        _page_cache = None
+
+
+# Function to fetch a page under the egress pool's rate controllers
+def fetch_page(url, headers=None, timeout=30, stream=False):
+    """GET url like requests.get, paced and recorded on one of the egress routes."""
+    if SCREENER_URL != SCREENER_ORIGIN and url.startswith(SCREENER_ORIGIN):
+        url = SCREENER_URL + url[len(SCREENER_ORIGIN):]
+    cache = _page_cache
+    if cache is not None and not stream:
+        return cache.get(url, lambda: _read_page(url, headers, timeout))
+    return _fetch(url, headers, timeout, stream)
+
+
+def _read_page(url, headers, timeout):
+    response = _fetch(url, headers, timeout, stream=False)
+    try:
+        return CachedResponse(url, response.status_code, response.content, response.headers)
+    finally:
+        response.close()
+
+
+def _fetch(url, headers, timeout, stream):
+    tried = []
+    while True:
+        route = egress_pool.acquire(exclude=tried)
+        started = time.monotonic()
+        status = retry_after = None
+        try:
+            response = route.session.get(url, headers=headers or HEADERS, timeout=timeout, stream=stream)
+            status = response.status_code
+            if status == 429:
+                try:
+                    retry_after = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    retry_after = None
+            return response
+        except requests.ConnectionError:
+            # A broken route (dead proxy, unusable source address) should not
+            # cost the page; try the next route before giving up
+            tried.append(route)
+            if len(tried) >= len(egress_pool.routes):
+                raise
+        finally:
+            egress_pool.release(route, time.monotonic() - started, status, retry_after)
@@ -0,0 +1,177 @@
+# atts_nse500_fingerprint.py - Fast-fail when Screener changes its page layout
+#
+# Every section a loader parses has a structural fingerprint: the element that
+# carries its id, the data table inside it, period-like column headers
+# ("Mar 2024", "TTM") and a few row labels the loader relies on. parse_section
+# checks the raw markup of the section against it before parsing, which costs
+# a few regex scans of a few KB.
+#
+# A page that doesn't match counts as drift. After ATTS_LAYOUT_DRIFT_LIMIT
+# drifting pages in a row for one section (default 5), the breaker for that
+# section trips. Every later parse of the section raises LayoutDriftError, so
+# the load stops instead of printing "No financial data found" for all 500
+# symbols. The first ATTS_LAYOUT_SAMPLES drifting pages of each section
+# (default 3) are saved under ATTS_LAYOUT_SAMPLE_DIR, with the failed checks,
+# for debugging. A matching page resets the count, so one odd company page
+# (a new listing, a bank without some rows) never trips it.
+#
+# Set ATTS_LAYOUT_CHECK=false to turn the check off.
+#
+# Usage:
+#   python atts_nse500_fingerprint.py page.html            # check a saved page
+#   python atts_nse500_fingerprint.py --symbol TCS         # fetch and check one symbol
+
+import argparse
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+
+LAYOUT_CHECK = os.getenv("ATTS_LAYOUT_CHECK", "true").lower() == "true"
+DRIFT_LIMIT = int(os.getenv("ATTS_LAYOUT_DRIFT_LIMIT", "5"))  # Drifting pages in a row before tripping
+SAMPLE_LIMIT = int(os.getenv("ATTS_LAYOUT_SAMPLES", "3"))  # Pages saved per section
+SAMPLE_DIR = os.getenv("ATTS_LAYOUT_SAMPLE_DIR", "layout_samples")
+
+PERIOD_PATTERN = re.compile(rb"^(?:(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) \d{4}|TTM)$")
+HEADER_PATTERN = re.compile(rb"<th[^>]*>(.*?)</th>", re.S)
+TAG_PATTERN = re.compile(rb"<[^>]+>")
+
+# Expected structure per element id. "labels" are row labels of which at
+# least one must appear, since banks and other companies show different rows.
+FINGERPRINTS = {
+    "top-ratios": {"tag": "ul", "table": False, "min_periods": 0, "min_numbers": 5,
+                   "labels": ["Market Cap", "Current Price", "Stock P/E"]},
+    "quarters": {"tag": "section", "table": True, "min_periods": 2, "labels": ["Net Profit", "EPS in Rs"]},
+    "profit-loss": {"tag": "section", "table": True, "min_periods": 2, "labels": ["Net Profit", "EPS in Rs"]},
+    "balance-sheet": {"tag": "section", "table": True, "min_periods": 2,
+                      "labels": ["Total Liabilities", "Total Assets"]},
+    "cash-flow": {"tag": "section", "table": True, "min_periods": 2,
+                  "labels": ["Cash from Operating Activity", "Net Cash Flow"]},
+    "ratios": {"tag": "section", "table": True, "min_periods": 2,
+               "labels": ["Debtor Days", "ROCE %", "ROE %"]},
+    "shareholding": {"tag": "section", "table": True, "min_periods": 2, "labels": ["Promoters", "Public"]},
+}
+
+
+class LayoutDriftError(RuntimeError):
+    """Raised once a section's pages have stopped matching its fingerprint."""
+
+
+# Function to list how a section's markup differs from its fingerprint
+def fingerprint_problems(section_markup, element_id):
+    """Return a list of failed checks; an empty list means the section matches.
+
+    section_markup is the markup of the element alone (see slice_element), or
+    None if no element with this id was found.
+    """
+    spec = FINGERPRINTS[element_id]
+    if section_markup is None:
+        return [f'no element with id="{element_id}"']
+    text = section_markup if isinstance(section_markup, bytes) else section_markup.encode()
+    problems = []
+    if not text.lower().startswith(b"<" + spec["tag"].encode()):
+        problems.append(f"#{element_id} is no longer a <{spec['tag']}>")
+    if spec["table"] and b'class="data-table' not in text:
+        problems.append(f"#{element_id} has no data-table")
+    if spec["min_periods"]:
+        headers = [TAG_PATTERN.sub(b"", header).strip() for header in HEADER_PATTERN.findall(text)]
+        periods = sum(1 for header in headers if PERIOD_PATTERN.match(header))
+        if periods < spec["min_periods"]:
+            problems.append(f"#{element_id} has {periods} period headers, expected at least {spec['min_periods']}")
+    if spec.get("min_numbers") and text.count(b'class="number"') < spec["min_numbers"]:
+        problems.append(f"#{element_id} has fewer than {spec['min_numbers']} number values")
+    if not any(label.encode() in text for label in spec["labels"]):
+        problems.append(f"#{element_id} has none of the rows {', '.join(spec['labels'])}")
+    return problems
+
+
+class LayoutBreaker:
+    """Counts drifting pages per section and trips after DRIFT_LIMIT in a row."""
+
+    def __init__(self, limit=DRIFT_LIMIT, sample_limit=SAMPLE_LIMIT, sample_dir=SAMPLE_DIR):
+        self.limit = limit
+        self.sample_limit = sample_limit
+        self.sample_dir = os.path.join(sample_dir, datetime.now().strftime("%Y%m%d-%H%M%S"))
+        self._lock = threading.Lock()
+        self._drifting = {}  # element id -> drifting pages in a row
+        self._samples = {}  # element id -> samples saved
+        self._tripped = {}  # element id -> reason
+
+    # Function to check one page's section and raise once the section has tripped
+    def check(self, markup, section_markup, element_id):
+        if element_id in self._tripped:
+            raise LayoutDriftError(self._tripped[element_id])
+        problems = fingerprint_problems(section_markup, element_id)
+        with self._lock:
+            if not problems:
+                self._drifting[element_id] = 0
+                return
+            self._drifting[element_id] = self._drifting.get(element_id, 0) + 1
+            saved = self._save_sample(markup, element_id, problems)
+            if self._drifting[element_id] < self.limit or element_id in self._tripped:
+                return
+            reason = (f"Layout drift in #{element_id}: {self._drifting[element_id]} pages in a row failed "
+                      f"({'; '.join(problems)}); samples in {saved or self.sample_dir}")
+            self._tripped[element_id] = reason
+        print(f"🛑 {reason}")
+        raise LayoutDriftError(reason)
+
+    def _save_sample(self, markup, element_id, problems):
+        count = self._samples.get(element_id, 0)
+        if count >= self.sample_limit:
+            return None
+        self._samples[element_id] = count + 1
+        os.makedirs(self.sample_dir, exist_ok=True)
+        path = os.path.join(self.sample_dir, f"{element_id}.{count + 1}.html")
+        with open(path, "wb") as f:
+            f.write(markup if isinstance(markup, bytes) else markup.encode())
+        with open(os.path.join(self.sample_dir, "problems.txt"), "a") as f:
+            f.write(f"{os.path.basename(path)}: {'; '.join(problems)}\n")
+        print(f"⚠️ Page layout for #{element_id} doesn't match ({'; '.join(problems)}); saved {path}")
+        return self.sample_dir
+
+    def tripped(self):
+        return dict(self._tripped)
+
+
+# Shared by every loader in the process
+layout_breaker = LayoutBreaker()
+
+
+# Function to run the fingerprint check from parse_section
+def check_section(markup, section_markup, element_id):
+    if LAYOUT_CHECK and element_id in FINGERPRINTS:
+        layout_breaker.check(markup, section_markup, element_id)
+
+
+def main(argv=None):
+    from atts_nse500_fetch import fetch_page
+    from atts_nse500_pipeline import slice_element
+
+    parser = argparse.ArgumentParser(description="Check Screener pages against the expected section layout.")
+    parser.add_argument("pages", nargs="*", help="Saved page HTML files")
+    parser.add_argument("--symbol", action="append", default=[], help="Fetch and check this symbol's page")
+    args = parser.parse_args(argv)
+
+    pages = []
+    for path in args.pages:
+        with open(path, "rb") as f:
+            pages.append((path, f.read()))
+    for symbol in args.symbol:
+        response = fetch_page(f"https://www.screener.in/company/{symbol}/")
+        response.raise_for_status()
+        pages.append((symbol, response.content))
+
+    drifted = False
+    for name, markup in pages:
+        for element_id in FINGERPRINTS:
+            section = slice_element(markup, element_id)
+            problems = fingerprint_problems(None if section is markup else section, element_id)
+            drifted = drifted or bool(problems)
+            print(f"{'❌' if problems else '✅'} {name} #{element_id}{': ' + '; '.join(problems) if problems else ''}")
+    return 1 if drifted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,81 +1,61 @@
 import requests
-from bs4 import BeautifulSoup
-import psycopg2
 import time
-from db_config import DB_CONFIG  # Import PostgreSQL config
 from nse500_stock_list import nse500stocklist  # Import stock list
+from atts_nse500_screener_query import mark_load_complete  # Refresh screening store after load
 import re
+from datetime import datetime, timezone
+from atts_nse500_history import HISTORY_ENABLED, clean_numeric, record_history  # Point-in-time history
+from atts_nse500_datasets import LATEST_PERIOD
+from atts_nse500_pipeline import parse_section, run_pipeline  # Streaming loader
+from atts_nse500_db_writer import insert_row  # Per-row savepoints and rejects
+from atts_nse500_fetch import fetch_page, rate_controller  # Rate-controlled fetch
+from atts_nse500_schema import ensure_schema  # Create/migrate tables once per run
+
+# Scraped field -> column name; "High / Low" is scraped as separate High and Low fields
+FIELD_COLUMNS = {
+    "Market Cap": "market_cap", "Current Price": "current_price", "High": "high_52w", "Low": "low_52w",
+    "Stock P/E": "stock_pe", "Book Value": "book_value", "Dividend Yield": "dividend_yield",
+    "ROCE": "roce", "ROE": "roe", "Face Value": "face_value"
+}
 
 # Function to sanitize table names
 def get_table_name(stock_symbol):
     return f"stock_{stock_symbol}_fundamental" if stock_symbol[0].isdigit() else f"{stock_symbol}_fundamental"
 
-# Function to create table if not exists
-def create_table(stock_symbol):
-    """Create table dynamically based on stock symbol."""
+# Function to insert data into PostgreSQL
+def insert_stock_data(cursor, stock_symbol, rows):
+    """Upsert fetched stock data with the pipeline's cursor; a refused row goes to the reject table."""
     table_name = get_table_name(stock_symbol)
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        create_query = f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            stock_symbol TEXT PRIMARY KEY,
-            market_cap NUMERIC,
-            current_price NUMERIC,
-            high_low NUMERIC,
-            stock_pe NUMERIC,
-            book_value NUMERIC,
-            dividend_yield NUMERIC,
-            roce NUMERIC,
-            roe NUMERIC,
-            face_value NUMERIC
-        );
-        """
-        cursor.execute(create_query)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print(f"✅ Table '{table_name}' is ready.")
-    except Exception as e:
-        print(f"⚠️ Table creation error for {table_name}: {e}")
+    insert_query = f"""
+    INSERT INTO {table_name} 
+    (stock_symbol, market_cap, current_price, high_52w, low_52w, stock_pe, book_value, 
+     dividend_yield, roce, roe, face_value) 
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (stock_symbol) DO UPDATE SET 
+        market_cap = EXCLUDED.market_cap,
+        current_price = EXCLUDED.current_price,
+        high_52w = EXCLUDED.high_52w,
+        low_52w = EXCLUDED.low_52w,
+        stock_pe = EXCLUDED.stock_pe,
+        book_value = EXCLUDED.book_value,
+        dividend_yield = EXCLUDED.dividend_yield,
+        roce = EXCLUDED.roce,
+        roe = EXCLUDED.roe,
+        face_value = EXCLUDED.face_value,
+        loaded_at = NOW();
+    """
+    for stock_data in rows:
+        # Scraped text such as "12,34,567" or "N/A" would be refused by the NUMERIC columns
+        values = {column: clean_numeric(stock_data.get(field)) for field, column in FIELD_COLUMNS.items()}
+        inserted = insert_row(cursor, stock_symbol, insert_query, (stock_data["Stock"], *values.values()))
+        if not inserted:
+            continue
+
+        if HISTORY_ENABLED:
+            record_history(cursor, "fundamental", stock_data["Stock"], {LATEST_PERIOD: values},
+                           stock_data.get("Fetched At"))
 
-# Function to insert data into PostgreSQL
-def insert_stock_data(stock_data):
-    """Insert stock data into dynamically created table."""
-    table_name = get_table_name(stock_data["Stock"])
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        insert_query = f"""
-        INSERT INTO {table_name} 
-        (stock_symbol, market_cap, current_price, high_low, stock_pe, book_value, 
-         dividend_yield, roce, roe, face_value) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (stock_symbol) DO UPDATE SET 
-            market_cap = EXCLUDED.market_cap,
-            current_price = EXCLUDED.current_price,
-            high_low = EXCLUDED.high_low,
-            stock_pe = EXCLUDED.stock_pe,
-            book_value = EXCLUDED.book_value,
-            dividend_yield = EXCLUDED.dividend_yield,
-            roce = EXCLUDED.roce,
-            roe = EXCLUDED.roe,
-            face_value = EXCLUDED.face_value;
-        """
-        cursor.execute(insert_query, (
-            stock_data["Stock"], stock_data["Market Cap"], stock_data["Current Price"], 
-            stock_data["High / Low"], stock_data["Stock P/E"], stock_data["Book Value"], 
-            stock_data["Dividend Yield"], stock_data["ROCE"], stock_data["ROE"], stock_data["Face Value"]
-        ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
         print(f"✅ Inserted/Updated {stock_data['Stock']} in table {table_name} successfully.")
-    except Exception as e:
-        print(f"⚠️ Database Insert Error for {stock_data['Stock']} in {table_name}: {e}")
 
 # Function to fetch stock data
 def get_stock_data(stock_symbol):
@@ -84,51 +64,62 @@ def get_stock_data(stock_symbol):
     headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = fetch_page(url, headers=headers, timeout=10)
         if response.status_code != 200:
             print(f"❌ Failed to fetch data for {stock_symbol} (Status: {response.status_code})")
             return None  
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        
+        # Parse only the top ratios list and drop the raw page straight away
+        soup = parse_section(response.content, id="top-ratios")
+        response.close()
+        del response
+
         data_points = [
             "Market Cap", "Current Price", "High / Low", "Stock P/E",
             "Book Value", "Dividend Yield", "ROCE", "ROE", "Face Value"
         ]
 
-        stock_data = {"Stock": stock_symbol}
+        stock_data = {"Stock": stock_symbol, "Fetched At": datetime.now(timezone.utc)}
         for point in data_points:
-            element = soup.select_one(f"#top-ratios li:has(span.name:-soup-contains('{point}')) span.number")
-            stock_data[point] = element.text.strip() if element else "N/A"
+            numbers = [element.text.strip() for element in
+                       soup.select(f"#top-ratios li:has(span.name:-soup-contains('{point}')) span.number")]
+            if point == "High / Low":
+                # Two numbers in one entry: the 52-week high, then the low
+                stock_data["High"], stock_data["Low"] = (numbers + ["N/A", "N/A"])[:2]
+            else:
+                stock_data[point] = numbers[0] if numbers else "N/A"
+        soup.decompose()
 
         return stock_data
     except requests.RequestException as e:
         print(f"⚠️ Network error for {stock_symbol}: {e}")
         return None  
 
-# Initialize stock list and storage
-nse500_stock_list = nse500stocklist
-failed_stocks = list(nse500_stock_list)  # Start with all stocks as failed
+# Function to stream fetched stock data into the pipeline
+def iter_stock_data(stock_symbol):
+    stock_info = get_stock_data(stock_symbol)
+    if stock_info:
+        yield stock_info
 
-# Keep retrying until all stocks are fetched
-while failed_stocks:
-    print(f"\n🔄 Fetching data for {len(failed_stocks)} remaining stocks...\n")
-    retry_failed_stocks = []
+if __name__ == "__main__":
+    # Initialize stock list and storage
+    nse500_stock_list = nse500stocklist
+    failed_stocks = list(nse500_stock_list)  # Start with all stocks as failed
 
-    for stock in failed_stocks:
-        create_table(stock)  # Ensure table exists before inserting data
-        stock_info = get_stock_data(stock)
-        if stock_info:
-            insert_stock_data(stock_info)  # Insert into PostgreSQL
-        else:
-            retry_failed_stocks.append(stock)  # Still failing
+    ensure_schema(["fundamental"], nse500_stock_list)  # Ensure tables exist before inserting data
 
-    failed_stocks = retry_failed_stocks  # Update failed stock list
+    # Keep retrying until all stocks are fetched
+    while failed_stocks:
+        print(f"\n🔄 Fetching data for {len(failed_stocks)} remaining stocks...\n")
+        fetched = run_pipeline(failed_stocks, iter_stock_data, insert_stock_data)
+        failed_stocks = [stock for stock in failed_stocks if stock not in fetched]  # Still failing
 
-    print(f"\n✅ Successfully inserted {len(nse500_stock_list) - len(failed_stocks)} stocks. {len(failed_stocks)} remaining...\n")
-    
-    if failed_stocks:
-        print(f"🔄 Retrying {len(failed_stocks)} failed stocks in 10 seconds...\n")
-        time.sleep(10)  # Wait before retrying to avoid IP bans
+        print(f"\n✅ Successfully fetched {len(nse500_stock_list) - len(failed_stocks)} stocks. {len(failed_stocks)} remaining...\n")
+        
+        if failed_stocks:
+            retry_delay = rate_controller.retry_delay()
+            print(f"🔄 Retrying {len(failed_stocks)} failed stocks in {retry_delay:.0f} seconds...\n")
+            time.sleep(retry_delay)  # Back off as far as the rate controller asks
 
-print("\n🎉 All 500 stocks successfully inserted/updated in PostgreSQL!\n")
+    mark_load_complete("fundamental")
+    print("\n🎉 All 500 stocks successfully inserted/updated in PostgreSQL!\n")
@@ -0,0 +1,196 @@
+# atts_nse500_history.py - Append-only point-in-time history of scraped values
+#
+# The per-symbol tables only hold what Screener shows today: the fundamental
+# table is overwritten on every run and restated periods replace earlier
+# numbers. When ATTS_HISTORY_MODE=true the loaders also append every value
+# to nse500_value_history together with the time it was fetched, but only
+# when it differs from the last recorded value for the same
+# (dataset, symbol, metric, period). as_of() then rebuilds what was known at
+# any past moment from one index.
+#
+# Each row carries two times: fetched_at (when Screener showed the value) and
+# recorded_at (when it reached this table). as_of() filters on fetched_at by
+# default; pass known_at to also leave out rows recorded after that moment,
+# e.g. to replay exactly what a report run at known_at could have seen.
+#
+# Usage:
+#   python atts_nse500_history.py TCS --as-of 2025-01-15
+#   python atts_nse500_history.py TCS --as-of "2025-01-15 10:30" --dataset ratios
+#   python atts_nse500_history.py TCS --as-of 2025-01-15 --known-at 2025-02-01 --dataset profit_loss
+
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+
+import psycopg2
+from db_config import DB_CONFIG
+from atts_nse500_datasets import DATASETS, LATEST_PERIOD
+
+HISTORY_ENABLED = os.getenv("ATTS_HISTORY_MODE", "false").lower() == "true"
+HISTORY_TABLE = "nse500_value_history"
+
+
+# Function to clean numeric values
+def clean_numeric(value):
+    """Removes unwanted characters and converts to float."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value = str(value).replace(",", "").replace("%", "").replace("₹", "").strip()
+    if value in ("", "-", "N/A"):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+# Function to create the history table and its as-of index
+def create_history_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+        dataset VARCHAR(20) NOT NULL,
+        stock_symbol TEXT NOT NULL,
+        metric VARCHAR(40) NOT NULL,
+        period VARCHAR(20) NOT NULL,
+        value NUMERIC,
+        fetched_at TIMESTAMPTZ NOT NULL,
+        recorded_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """)
+    cursor.execute(f"""
+    CREATE INDEX IF NOT EXISTS {HISTORY_TABLE}_asof_idx
+        ON {HISTORY_TABLE} (dataset, metric, stock_symbol, period, fetched_at DESC);
+    """)
+
+
+# Function to turn stored period rows into record_history values
+def period_values(dataset, rows):
+    """Map [period, metric values...] rows, in DATASETS column order, to {period: {metric: value}}."""
+    metrics = DATASETS[dataset]["metrics"]
+    return {str(row[0]): dict(zip(metrics, row[1:])) for row in rows if row and row[0] is not None}
+
+
+# Function to append changed values for one symbol
+def record_history(cursor, dataset, stock_symbol, values, fetched_at=None):
+    """Append values that changed since the last recorded fetch.
+
+    values maps period -> {metric: value}; use LATEST_PERIOD for datasets
+    without a period column. The table is created by ensure_schema. Returns
+    the number of rows appended.
+    """
+    fetched_at = fetched_at or datetime.now(timezone.utc)
+    rows = [
+        (dataset, stock_symbol, metric, period, clean_numeric(value), fetched_at)
+        for period, metrics in values.items()
+        for metric, value in metrics.items()
+    ]
+    if not rows:
+        return 0
+
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s::NUMERIC, %s::TIMESTAMPTZ)"] * len(rows))
+    cursor.execute(f"""
+    INSERT INTO {HISTORY_TABLE} (dataset, stock_symbol, metric, period, value, fetched_at)
+    SELECT v.dataset, v.stock_symbol, v.metric, v.period, v.value, v.fetched_at
+    FROM (VALUES {placeholders}) AS v(dataset, stock_symbol, metric, period, value, fetched_at)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM (
+            SELECT h.value FROM {HISTORY_TABLE} h
+            WHERE h.dataset = v.dataset AND h.metric = v.metric
+              AND h.stock_symbol = v.stock_symbol AND h.period = v.period
+              AND h.fetched_at <= v.fetched_at
+            ORDER BY h.fetched_at DESC
+            LIMIT 1
+        ) last
+        WHERE last.value IS NOT DISTINCT FROM v.value
+    );
+    """, [item for row in rows for item in row])
+    return cursor.rowcount
+
+
+def _known_at_filter(known_at):
+    if known_at is None:
+        return "", ()
+    return " AND recorded_at <= %s", (known_at,)
+
+
+# Function to look up what was known about a symbol at a point in time
+def as_of(stock_symbol, when, dataset="fundamental", metrics=None, conn=None, known_at=None):
+    """Return {period: {metric: value}} as fetched at or before `when`.
+
+    known_at also leaves out rows recorded after it.
+    """
+    metrics = metrics or DATASETS[dataset]["metrics"]
+    own_conn = conn is None
+    conn = conn or psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    known_filter, known_params = _known_at_filter(known_at)
+    cursor.execute(f"""
+    SELECT DISTINCT ON (metric, period) period, metric, value
+    FROM {HISTORY_TABLE}
+    WHERE dataset = %s AND metric = ANY(%s) AND stock_symbol = %s AND fetched_at <= %s{known_filter}
+    ORDER BY metric, period, fetched_at DESC;
+    """, (dataset, list(metrics), stock_symbol, when, *known_params))
+    result = {}
+    for period, metric, value in cursor.fetchall():
+        result.setdefault(period, {})[metric] = float(value) if value is not None else None
+    cursor.close()
+    if own_conn:
+        conn.close()
+    return result
+
+
+# Function to look up one metric for every symbol at a point in time
+def universe_as_of(metric, when, dataset="fundamental", period=LATEST_PERIOD, conn=None, known_at=None):
+    """Return {stock_symbol: value} for one metric and period as fetched at `when`.
+
+    known_at also leaves out rows recorded after it.
+    """
+    own_conn = conn is None
+    conn = conn or psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    known_filter, known_params = _known_at_filter(known_at)
+    cursor.execute(f"""
+    SELECT DISTINCT ON (stock_symbol) stock_symbol, value
+    FROM {HISTORY_TABLE}
+    WHERE dataset = %s AND metric = %s AND period = %s AND fetched_at <= %s{known_filter}
+    ORDER BY stock_symbol, fetched_at DESC;
+    """, (dataset, metric, period, when, *known_params))
+    result = {symbol: float(value) if value is not None else None for symbol, value in cursor.fetchall()}
+    cursor.close()
+    if own_conn:
+        conn.close()
+    return result
+
+
+def _parse_timestamp(text):
+    when = datetime.fromisoformat(text)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show point-in-time values for a symbol.")
+    parser.add_argument("symbol")
+    parser.add_argument("--as-of", required=True, help='Timestamp, e.g. "2025-01-15" or "2025-01-15 10:30"')
+    parser.add_argument("--known-at", help="Only use values recorded by this timestamp")
+    parser.add_argument("--dataset", default="fundamental", choices=sorted(DATASETS))
+    args = parser.parse_args(argv)
+
+    when = _parse_timestamp(args.as_of)
+    known_at = _parse_timestamp(args.known_at) if args.known_at else None
+
+    values = as_of(args.symbol, when, args.dataset, known_at=known_at)
+    if not values:
+        print(f"No history recorded for {args.symbol} ({args.dataset}) as of {when}.")
+        return 1
+    for period in sorted(values):
+        print(f"{period}:")
+        for metric, value in sorted(values[period].items()):
+            print(f"    {metric}: {'-' if value is None else value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
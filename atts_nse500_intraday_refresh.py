@@ -0,0 +1,216 @@
+# atts_nse500_intraday_refresh.py - Refresh the price-driven top ratios every N minutes
+#
+# Only Current Price, Market Cap, Stock P/E and Dividend Yield move during the
+# trading day. This mode re-fetches just those four fields for every symbol:
+#   - each page is streamed only until the top-ratios list has arrived
+#   - no DDL runs inside the cycle (the shared table is created once at start)
+#   - each cycle ends in one transaction: one upsert into nse500_intraday_prices,
+#     the matching fields in the per-symbol fundamental tables, and the
+#     screening metric store, logged to the change feed (and, with
+#     ATTS_HISTORY_MODE=true, to the point-in-time history)
+#
+# Usage:
+#   python atts_nse500_intraday_refresh.py --interval 5
+#   python atts_nse500_intraday_refresh.py --once
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import psycopg2
+from db_config import DB_CONFIG
+from nse500_stock_list import nse500stocklist
+from atts_nse500_changefeed import create_changelog_table, record_changes
+from atts_nse500_datasets import LATEST_PERIOD, table_name
+from atts_nse500_fetch import fetch_page
+from atts_nse500_history import HISTORY_ENABLED, create_history_table, record_history
+from atts_nse500_pipeline import FETCH_WORKERS, parse_section
+from atts_nse500_schema import introspect
+from atts_nse500_screener_query import LOAD_STATE_TABLE, METRIC_STORE_TABLE, create_metric_store
+
+INTRADAY_TABLE = "nse500_intraday_prices"
+CHUNK_SIZE = 16 * 1024
+
+# Scraped field -> column name
+PRICE_FIELDS = {
+    "Current Price": "current_price",
+    "Market Cap": "market_cap",
+    "Stock P/E": "stock_pe",
+    "Dividend Yield": "dividend_yield",
+}
+
+
+# Function to clean numeric values
+def clean_numeric(value):
+    """Removes unwanted characters and converts to float."""
+    if value is None:
+        return None
+    value = value.replace(",", "").replace("%", "").replace("₹", "").strip()
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+# Function to fetch only the top ratios of one symbol
+def fetch_price_fields(stock_symbol):
+    """Return {column: value} for PRICE_FIELDS, or None if the page could not be read."""
+    url = f"https://www.screener.in/company/{stock_symbol}/"
+    try:
+        response = fetch_page(url, stream=True)
+    except Exception as e:
+        print(f"⚠️ Network error for {stock_symbol}: {e}")
+        return None
+
+    markup = b""
+    try:
+        if response.status_code != 200:
+            print(f"❌ Failed to fetch data for {stock_symbol} (Status: {response.status_code})")
+            return None
+        # Stop reading once the top ratios list has been received
+        for chunk in response.iter_content(CHUNK_SIZE):
+            markup += chunk
+            start = markup.find(b'id="top-ratios"')
+            if start != -1 and markup.find(b"</ul>", start) != -1:
+                break
+    except Exception as e:
+        print(f"⚠️ Network error for {stock_symbol}: {e}")
+        return None
+    finally:
+        response.close()
+
+    soup = parse_section(markup, id="top-ratios")
+    values = {}
+    for field, column in PRICE_FIELDS.items():
+        element = soup.select_one(f"#top-ratios li:has(span.name:-soup-contains('{field}')) span.number")
+        values[column] = clean_numeric(element.text) if element else None
+    soup.decompose()
+    if all(value is None for value in values.values()):
+        print(f"⚠️ No top ratios found for {stock_symbol}")
+        return None
+    return values
+
+
+# Function to create the shared intraday table once per process
+def create_intraday_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {INTRADAY_TABLE} (
+        stock_symbol TEXT PRIMARY KEY,
+        current_price NUMERIC,
+        market_cap NUMERIC,
+        stock_pe NUMERIC,
+        dividend_yield NUMERIC,
+        fetched_at TIMESTAMPTZ NOT NULL
+    );
+    """)
+    create_metric_store(cursor)
+    create_changelog_table(cursor)
+    if HISTORY_ENABLED:
+        create_history_table(cursor)
+
+
+# Function to write one cycle's prices in a single transaction
+def write_prices(conn, prices, fundamental_tables, fetched_at):
+    columns = list(PRICE_FIELDS.values())
+    cursor = conn.cursor()
+
+    rows = [(symbol, *[values[c] for c in columns], fetched_at) for symbol, values in prices.items()]
+    placeholders = ", ".join(["(" + ", ".join(["%s"] * (len(columns) + 2)) + ")"] * len(rows))
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns + ["fetched_at"])
+    statements = [cursor.mogrify(
+        f"INSERT INTO {INTRADAY_TABLE} (stock_symbol, {', '.join(columns)}, fetched_at) "
+        f"VALUES {placeholders} ON CONFLICT (stock_symbol) DO UPDATE SET {updates};",
+        [item for row in rows for item in row],
+    ).decode()]
+
+    # Keep the per-symbol fundamental rows and the screening store in step
+    fundamental_updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns)
+    for symbol, values in prices.items():
+        name, stamped = fundamental_tables.get(symbol, (None, False))
+        if name:
+            # Tables created before the loaded_at migration are updated without it
+            updates = fundamental_updates + (", loaded_at = NOW()" if stamped else "")
+            statements.append(cursor.mogrify(
+                f"INSERT INTO {name} (stock_symbol, {', '.join(columns)}) VALUES (%s, {', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT (stock_symbol) DO UPDATE SET {updates};",
+                [symbol] + [values[c] for c in columns],
+            ).decode())
+    store_rows = [("fundamental", c, LATEST_PERIOD, symbol, values[c])
+                  for symbol, values in prices.items() for c in columns]
+    statements.append(cursor.mogrify(
+        f"INSERT INTO {METRIC_STORE_TABLE} (dataset, metric, period, stock_symbol, value) VALUES "
+        + ", ".join(["(%s, %s, %s, %s, %s)"] * len(store_rows))
+        + " ON CONFLICT (dataset, metric, period, stock_symbol) DO UPDATE SET value = EXCLUDED.value, loaded_at = NOW();",
+        [item for row in store_rows for item in row],
+    ).decode())
+    statements.append(
+        f"INSERT INTO {LOAD_STATE_TABLE} (dataset, version, completed_at) VALUES ('fundamental', 1, NOW()) "
+        f"ON CONFLICT (dataset) DO UPDATE SET version = {LOAD_STATE_TABLE}.version + 1, completed_at = NOW();"
+    )
+
+    cursor.execute("\n".join(statements))  # One round trip for the whole cycle
+    if HISTORY_ENABLED:
+        for symbol, values in prices.items():
+            record_history(cursor, "fundamental", symbol, {LATEST_PERIOD: values}, fetched_at)
+    record_changes(cursor, [("fundamental", symbol, [LATEST_PERIOD], 1) for symbol in prices])
+    conn.commit()
+    cursor.close()
+
+
+# Function to run one refresh cycle over all symbols
+def run_cycle(conn, symbols, fundamental_tables, workers=FETCH_WORKERS):
+    started = time.monotonic()
+    fetched_at = datetime.now(timezone.utc)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = pool.map(fetch_price_fields, symbols)
+        prices = {symbol: values for symbol, values in zip(symbols, results) if values}
+    fetch_seconds = time.monotonic() - started
+    if prices:
+        try:
+            write_prices(conn, prices, fundamental_tables, fetched_at)
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"⚠️ Intraday write failed: {e}")
+            return 0
+    total_seconds = time.monotonic() - started
+    print(f"✅ Refreshed {len(prices)}/{len(symbols)} symbols in {total_seconds:.1f}s "
+          f"(fetch {fetch_seconds:.1f}s, write {total_seconds - fetch_seconds:.2f}s).")
+    return len(prices)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh intraday price fields for all symbols.")
+    parser.add_argument("--interval", type=float, default=5, help="Minutes between cycle starts")
+    parser.add_argument("--once", action="store_true", help="Run a single cycle and exit")
+    parser.add_argument("--workers", type=int, default=max(FETCH_WORKERS, 8))
+    parser.add_argument("--symbols", nargs="+", default=nse500stocklist)
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    create_intraday_table(cursor)
+    known = introspect(cursor)
+    conn.commit()
+    cursor.close()
+    # symbol -> (table, whether it has loaded_at)
+    fundamental_tables = {symbol: (name, "loaded_at" in known[name]) for symbol in args.symbols
+                          for name in [table_name("fundamental", symbol)] if name in known}
+
+    try:
+        while True:
+            cycle_start = time.monotonic()
+            run_cycle(conn, args.symbols, fundamental_tables, args.workers)
+            if args.once:
+                break
+            time.sleep(max(0.0, args.interval * 60 - (time.monotonic() - cycle_start)))
+    except KeyboardInterrupt:
+        print("\n🛑 Intraday refresh stopped.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+# atts_nse500_maintenance.py - Post-load indexes, statistics and bloat report
+#
+# After a large load the per-symbol tables only have their primary keys, and
+# autovacuum has usually not caught up, so the first queries of the day plan
+# against stale statistics. This stage runs after the loads:
+#   - creates any missing indexes: BTREE on each table's period column and
+#     BRIN on loaded_at (rows arrive in loaded_at order, so a BRIN index stays
+#     a few pages however large the table grows), plus BRIN on the timestamp
+#     columns of the shared history and changelog tables
+#   - runs ANALYZE, or VACUUM (ANALYZE) where dead rows passed
+#     ATTS_VACUUM_DEAD_FRACTION, only on tables that changed. The changelog says
+#     which ones (batches after since_batch); without it, pg_stat_user_tables
+#     does
+#   - prints a per-dataset bloat report (dead row share and size)
+#
+# The orchestrator runs it as the "maintenance" stage when
+# ATTS_POST_LOAD_MAINTENANCE=true.
+#
+# Usage:
+#   python atts_nse500_maintenance.py                    # tables with unanalyzed changes
+#   python atts_nse500_maintenance.py --since-batch 1200  # tables changed after a changelog batch
+#   python atts_nse500_maintenance.py --all --datasets ratios
+#   python atts_nse500_maintenance.py --report
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import psycopg2
+from db_config import DB_CONFIG
+from atts_nse500_changefeed import CHANGE_FEED_ENABLED, CHANGELOG_TABLE
+from atts_nse500_datasets import DATASETS, table_name
+from atts_nse500_history import HISTORY_TABLE
+from atts_nse500_schema import SCHEMA_CHUNK, SCHEMA_LOCK_KEY, introspect
+from atts_nse500_screener_query import METRIC_STORE_TABLE
+
+MAINTENANCE_ENABLED = os.getenv("ATTS_POST_LOAD_MAINTENANCE", "false").lower() == "true"
+VACUUM_DEAD_FRACTION = float(os.getenv("ATTS_VACUUM_DEAD_FRACTION", "0.1"))  # Dead share that triggers VACUUM
+TABLES_PER_STATEMENT = 200  # ANALYZE/VACUUM accept a list of tables
+REPORT_WORST = 10  # Most bloated tables listed in the report
+MAX_IDENTIFIER = 63  # Postgres truncates longer names
+
+# Shared tables written by every load; analyzed whenever they exist
+SHARED_TABLES = [METRIC_STORE_TABLE, HISTORY_TABLE, CHANGELOG_TABLE]
+SHARED_INDEXES = [
+    (HISTORY_TABLE, "fetched_at", "brin"),
+    (CHANGELOG_TABLE, "changed_at", "brin"),
+]
+
+
+# Function to list the indexes a dataset table should have as (column, method) pairs
+def dataset_indexes(dataset):
+    spec = DATASETS[dataset]
+    indexes = [(spec["period_column"], "btree")] if spec["period_column"] else []
+    return indexes + [("loaded_at", "brin")]
+
+
+def _index_name(table, column, method):
+    suffix = f"_{column}_{'brin' if method == 'brin' else 'idx'}"
+    if len(table) + len(suffix) <= MAX_IDENTIFIER:
+        return table + suffix
+    # Keep truncated names apart: two long tables must not share one index name
+    digest = hashlib.sha1(table.encode()).hexdigest()[:8]
+    return f"{table[:MAX_IDENTIFIER - len(suffix) - len(digest) - 1]}_{digest}{suffix}"
+
+
+# Function to map every existing dataset table to its dataset
+def dataset_tables(cursor, datasets):
+    cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname = current_schema();")
+    existing = {row[0] for row in cursor.fetchall()}
+    suffixes = {f"_{DATASETS[dataset]['suffix']}": dataset for dataset in datasets}
+    tables = {}
+    for name in existing:
+        for suffix, dataset in suffixes.items():
+            if name.endswith(suffix):
+                tables[name] = dataset
+                break
+    return tables, existing
+
+
+# Function to create whichever of the planned indexes are missing
+def ensure_indexes(conn, tables, existing):
+    cursor = conn.cursor()
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema();")
+    indexes = {row[0] for row in cursor.fetchall()}
+    # Tables not migrated yet (e.g. symbols outside this run) may lack loaded_at
+    columns = introspect(cursor)
+
+    planned = [(name, column, method) for name, dataset in sorted(tables.items())
+               for column, method in dataset_indexes(dataset)]
+    planned += [index for index in SHARED_INDEXES if index[0] in existing]
+    planned = [index for index in planned if index[1] in columns.get(index[0], ())]
+    missing = [index for index in planned if _index_name(*index) not in indexes]
+
+    # Each CREATE INDEX holds locks until commit, so commit in chunks like ensure_schema
+    for offset in range(0, len(missing), SCHEMA_CHUNK):
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (SCHEMA_LOCK_KEY,))
+        for table, column, method in missing[offset:offset + SCHEMA_CHUNK]:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {_index_name(table, column, method)} "
+                           f"ON {table} USING {method} ({column});")
+        conn.commit()
+    cursor.close()
+    return len(missing)
+
+
+# Function to list tables changed after a changelog batch
+def changed_tables(cursor, since_batch, tables):
+    cursor.execute(f"""
+    SELECT DISTINCT dataset, stock_symbol FROM {CHANGELOG_TABLE} WHERE batch_id > %s;
+    """, (since_batch,))
+    changed = {table_name(dataset, stock_symbol) for dataset, stock_symbol in cursor.fetchall()
+               if dataset in DATASETS}
+    return sorted(changed & set(tables))
+
+
+# Function to list tables with modifications or dead rows the statistics don't reflect yet
+def stale_tables(cursor, tables):
+    cursor.execute("""
+    SELECT relname FROM pg_stat_user_tables
+    WHERE schemaname = current_schema() AND (n_mod_since_analyze > 0 OR n_dead_tup > 0);
+    """)
+    return sorted({row[0] for row in cursor.fetchall()} & set(tables))
+
+
+# Function to read live/dead row counts and sizes for a set of tables
+def table_stats(cursor, tables):
+    cursor.execute("""
+    SELECT relname, n_live_tup, n_dead_tup, pg_total_relation_size(relid)
+    FROM pg_stat_user_tables
+    WHERE schemaname = current_schema() AND relname = ANY(%s);
+    """, (list(tables),))
+    return {name: (live, dead, size) for name, live, dead, size in cursor.fetchall()}
+
+
+# Function to ANALYZE or VACUUM (ANALYZE) the given tables
+def refresh_statistics(conn, targets):
+    """Return (analyzed, vacuumed) table counts."""
+    cursor = conn.cursor()
+    stats = table_stats(cursor, targets)
+    vacuum, analyze = [], []
+    for name in targets:
+        live, dead, _ = stats.get(name, (0, 0, 0))
+        if dead and dead > VACUUM_DEAD_FRACTION * (live + dead):
+            vacuum.append(name)
+        else:
+            analyze.append(name)
+
+    # VACUUM can't run inside a transaction block
+    conn.commit()
+    conn.autocommit = True
+    try:
+        for command, names in (("VACUUM (ANALYZE)", vacuum), ("ANALYZE", analyze)):
+            for offset in range(0, len(names), TABLES_PER_STATEMENT):
+                cursor.execute(f"{command} {', '.join(names[offset:offset + TABLES_PER_STATEMENT])};")
+    finally:
+        conn.autocommit = False
+        cursor.close()
+    return len(analyze), len(vacuum)
+
+
+# Function to print dead row share and size per dataset and the worst tables
+def bloat_report(cursor, tables):
+    stats = table_stats(cursor, tables)
+    print(f"{'dataset':<14} {'tables':>7} {'live rows':>11} {'dead rows':>10} {'dead %':>7} {'size MB':>9}")
+    for dataset in sorted(set(tables.values())):
+        rows = [stats[name] for name, owner in tables.items() if owner == dataset and name in stats]
+        live = sum(row[0] for row in rows)
+        dead = sum(row[1] for row in rows)
+        size = sum(row[2] for row in rows)
+        share = dead / (live + dead) if live + dead else 0.0
+        print(f"{dataset:<14} {len(rows):>7} {live:>11} {dead:>10} {share:>7.1%} {size / 2 ** 20:>9.1f}")
+
+    worst = sorted(((dead / (live + dead), name, dead, size) for name, (live, dead, size) in stats.items()
+                    if dead), reverse=True)[:REPORT_WORST]
+    if worst:
+        print("Most bloated tables:")
+        for share, name, dead, size in worst:
+            print(f"  {name:<40} {dead:>8} dead rows ({share:.0%}), {size / 1024:.0f} KB")
+
+
+# Function to run the whole post-load maintenance stage
+def run_maintenance(datasets=None, since_batch=None, all_tables=False, report=True):
+    """Index, analyze and report on dataset tables.
+
+    since_batch limits ANALYZE/VACUUM to tables with changelog batches after
+    it; all_tables refreshes every dataset table.
+    """
+    started = time.monotonic()
+    datasets = list(datasets or DATASETS)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cursor = conn.cursor()
+        tables, existing = dataset_tables(cursor, datasets)
+        created = ensure_indexes(conn, tables, existing)
+
+        if all_tables:
+            targets = sorted(tables)
+        elif since_batch is not None and CHANGE_FEED_ENABLED and CHANGELOG_TABLE in existing:
+            targets = changed_tables(cursor, since_batch, tables)
+        else:
+            targets = stale_tables(cursor, tables)
+        targets += [name for name in SHARED_TABLES if name in existing]
+        conn.commit()
+        analyzed, vacuumed = refresh_statistics(conn, targets)
+
+        if report:
+            bloat_report(cursor, tables)
+        cursor.close()
+    finally:
+        conn.close()
+    print(f"✅ Maintenance done in {time.monotonic() - started:.1f}s: {created} indexes created, "
+          f"{analyzed} tables analyzed, {vacuumed} vacuumed.")
+    return {"indexes": created, "analyzed": analyzed, "vacuumed": vacuumed}
+
+
+# Function to read the latest changelog batch, to pass as since_batch after a load
+def latest_batch():
+    # Batch ids commit in order (see atts_nse500_changefeed), so every batch
+    # committed after this read has a larger id, even one already in flight
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (CHANGELOG_TABLE,))
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute(f"SELECT COALESCE(MAX(batch_id), 0) FROM {CHANGELOG_TABLE};")
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index, analyze and vacuum NSE500 tables after a load.")
+    parser.add_argument("--datasets", nargs="+", choices=sorted(DATASETS), default=list(DATASETS))
+    parser.add_argument("--since-batch", type=int, help="Refresh tables changed after this changelog batch")
+    parser.add_argument("--all", action="store_true", help="Refresh every dataset table")
+    parser.add_argument("--report", action="store_true", help="Only print the bloat report")
+    args = parser.parse_args(argv)
+
+    if args.report:
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        bloat_report(cursor, dataset_tables(cursor, args.datasets)[0])
+        conn.close()
+        return 0
+    run_maintenance(args.datasets, args.since_batch, args.all)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
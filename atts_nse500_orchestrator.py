@@ -0,0 +1,291 @@
+# atts_nse500_orchestrator.py - Run every dataset load as one dependency graph
+#
+# Instead of seven cron entries with their own loops and connections, this
+# runs all datasets as stages of one DAG in a single process:
+#
+#   schema -> load:<dataset> (all seven in parallel) -> cube (after the yearly datasets)
+#                           \-> pdfs (after quarterly, when ATTS_DOWNLOAD_PDFS is set)
+#                           \-> maintenance (after every load, when ATTS_POST_LOAD_MAINTENANCE is set)
+#
+# The load stages share one rate-controlled fetch layer, one page cache (every
+# dataset reads the same company page, so each page is fetched once), and one
+# background database writer. Total run time therefore tracks the slowest
+# stage rather than the sum of all seven. Each stage's status, duration, row
+# count and failures are recorded in the nse500_run_ledger table.
+#
+# With --atomic (or ATTS_ATOMIC_SYMBOLS=true) the seven loads run as a single
+# "load" stage instead, which writes all datasets of a symbol in one
+# transaction: whatever was extracted for a symbol is committed or discarded
+# together. A dataset whose fetch or parse came back empty is simply absent
+# from that symbol's unit.
+#
+# Usage:
+#   python atts_nse500_orchestrator.py
+#   python atts_nse500_orchestrator.py --datasets ratios cash_flow --symbols TCS INFY
+#   python atts_nse500_orchestrator.py --dry-run
+#   python atts_nse500_orchestrator.py --atomic
+#   python atts_nse500_orchestrator.py --ledger 5
+
+import argparse
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import psycopg2
+from db_config import DB_CONFIG
+from nse500_stock_list import nse500stocklist
+from atts_nse500_cube import CUBE_DATASETS, CUBE_ENABLED, build_cube, np
+from atts_nse500_datasets import DATASETS, load_dataset_functions
+from atts_nse500_db_writer import AsyncWriter
+from atts_nse500_fetch import use_page_cache
+from atts_nse500_fingerprint import LayoutDriftError
+from atts_nse500_maintenance import MAINTENANCE_ENABLED, latest_batch, run_maintenance
+from atts_nse500_pipeline import ATOMIC_SYMBOLS, FETCH_WORKERS, run_pipeline, run_symbol_pipeline
+from atts_nse500_quarterly_pdfs import DOWNLOAD_ENABLED, download_quarterly_pdfs
+from atts_nse500_schema import ensure_schema
+from atts_nse500_screener_query import mark_load_complete
+import atts_nse500_profiling as profiling
+
+LEDGER_TABLE = "nse500_run_ledger"
+
+
+# Function to create the run ledger
+def create_ledger_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+        run_id BIGINT NOT NULL,
+        stage VARCHAR(40) NOT NULL,
+        status VARCHAR(10) NOT NULL,
+        started_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ,
+        duration_seconds NUMERIC,
+        row_count INT,
+        symbol_count INT,
+        failed_symbols TEXT[],
+        error TEXT,
+        PRIMARY KEY (run_id, stage)
+    );
+    """)
+    cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {LEDGER_TABLE}_run_seq;")
+
+
+class RunLedger:
+    """Records stage progress for one run on its own connection."""
+
+    def __init__(self, stages):
+        self._conn = psycopg2.connect(**DB_CONFIG)
+        self._conn.autocommit = True
+        cursor = self._conn.cursor()
+        create_ledger_table(cursor)
+        cursor.execute(f"SELECT nextval('{LEDGER_TABLE}_run_seq');")
+        self.run_id = cursor.fetchone()[0]
+        cursor.executemany(
+            f"INSERT INTO {LEDGER_TABLE} (run_id, stage, status) VALUES (%s, %s, 'pending');",
+            [(self.run_id, stage) for stage in stages],
+        )
+        cursor.close()
+
+    def started(self, stage):
+        self._execute(
+            f"UPDATE {LEDGER_TABLE} SET status = 'running', started_at = NOW() WHERE run_id = %s AND stage = %s;",
+            (self.run_id, stage),
+        )
+
+    def finished(self, stage, status, seconds=None, rows=None, symbols=None, failed=None, error=None):
+        self._execute(f"""
+        UPDATE {LEDGER_TABLE} SET status = %s, finished_at = NOW(), duration_seconds = %s,
+            row_count = %s, symbol_count = %s, failed_symbols = %s, error = %s
+        WHERE run_id = %s AND stage = %s;
+        """, (status, None if seconds is None else round(seconds, 3), rows, symbols, failed, error,
+              self.run_id, stage))
+
+    def _execute(self, sql, params):
+        # Serialised by the orchestrator thread; ledger problems never stop the run
+        try:
+            cursor = self._conn.cursor()
+            cursor.execute(sql, params)
+            cursor.close()
+        except psycopg2.Error as e:
+            print(f"⚠️ Run ledger update failed: {e}")
+
+    def close(self):
+        self._conn.close()
+
+
+# Function to describe the stages and their dependencies
+def build_dag(datasets, atomic=ATOMIC_SYMBOLS):
+    """Return {stage: [dependencies]} for the requested datasets."""
+    dag = {"schema": []}
+    if atomic:
+        dag["load"] = ["schema"]
+    else:
+        for dataset in datasets:
+            dag[f"load:{dataset}"] = ["schema"]
+
+    def loaded(dataset):
+        return "load" if atomic else f"load:{dataset}"
+
+    yearly = sorted({loaded(dataset) for dataset in datasets if dataset in CUBE_DATASETS})
+    if yearly and CUBE_ENABLED and np is not None:
+        dag["cube"] = yearly
+    if DOWNLOAD_ENABLED and "quarterly" in datasets:
+        dag["pdfs"] = [loaded("quarterly")]
+    if MAINTENANCE_ENABLED:
+        dag["maintenance"] = sorted({loaded(dataset) for dataset in datasets})
+    return dag
+
+
+# Function to list stages in an order that respects dependencies
+def topological_order(dag):
+    order, done = [], set()
+    while len(order) < len(dag):
+        ready = sorted(stage for stage, deps in dag.items() if stage not in done and all(d in done for d in deps))
+        if not ready:
+            raise ValueError("Stage dependencies contain a cycle")
+        order.extend(ready)
+        done.update(ready)
+    return order
+
+
+# Function to run one load stage through the shared writer
+def load_dataset(dataset, symbols, writer, workers):
+    extract, store = load_dataset_functions(dataset)
+    run_pipeline(symbols, extract, store, workers=workers, writer=writer)
+    writer.flush()  # Rows must be committed before the metric store is refreshed
+    mark_load_complete(dataset, symbols, build_cube=False)
+    # Rejected or discarded rows don't count; a symbol with nothing committed failed
+    counts = writer.committed_rows(dataset, symbols)
+    failed = [symbol for symbol in symbols if not counts.get(symbol)]
+    return {"rows": sum(counts.values()), "symbols": len(symbols) - len(failed), "failed": failed}
+
+
+# Function to load every dataset with one transaction per symbol
+def load_all(datasets, symbols, writer, workers):
+    loaders = {dataset: load_dataset_functions(dataset) for dataset in datasets}
+    run_symbol_pipeline(symbols, loaders, workers=workers, writer=writer)
+    writer.flush()
+    for dataset in datasets:
+        mark_load_complete(dataset, symbols, build_cube=False)
+    counts = {dataset: writer.committed_rows(dataset, symbols) for dataset in datasets}
+    failed = [symbol for symbol in symbols if not any(counts[dataset].get(symbol) for dataset in datasets)]
+    rows = sum(sum(dataset_counts.values()) for dataset_counts in counts.values())
+    return {"rows": rows, "symbols": len(symbols) - len(failed), "failed": failed}
+
+
+# Function to run the DAG with independent stages in parallel
+def run(datasets, symbols, workers=FETCH_WORKERS, atomic=ATOMIC_SYMBOLS):
+    dag = build_dag(datasets, atomic)
+    ledger = RunLedger(topological_order(dag))
+    print(f"🚀 Run {ledger.run_id}: {len(dag)} stages for {len(symbols)} symbols.")
+    started = time.monotonic()
+    since_batch = latest_batch() if "maintenance" in dag else None
+
+    actions = {
+        "schema": lambda: ensure_schema(datasets, symbols),
+        "cube": build_cube,
+        "pdfs": lambda: download_quarterly_pdfs(symbols),
+        "maintenance": lambda: run_maintenance(datasets, since_batch),
+    }
+    status = {}
+    with AsyncWriter() as writer, use_page_cache(len(datasets)) as page_cache, \
+            ThreadPoolExecutor(max_workers=len(dag)) as pool:
+        actions["load"] = lambda: load_all(datasets, symbols, writer, workers)
+        for dataset in datasets:
+            actions[f"load:{dataset}"] = lambda dataset=dataset: load_dataset(dataset, symbols, writer, workers)
+
+        running = {}  # future -> (stage, start time)
+        while len(status) < len(dag):
+            in_flight = {stage for stage, _ in running.values()}
+            for stage, deps in dag.items():
+                if stage in status or stage in in_flight:
+                    continue
+                if any(status.get(dep) in ("failed", "skipped") for dep in deps):
+                    status[stage] = "skipped"
+                    ledger.finished(stage, "skipped", error="A dependency did not succeed")
+                    print(f"⏭️ {stage} skipped")
+                elif all(status.get(dep) == "done" for dep in deps):
+                    ledger.started(stage)
+                    running[pool.submit(actions[stage])] = (stage, time.monotonic())
+                    in_flight.add(stage)
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, stage_started = running.pop(future)
+                seconds = time.monotonic() - stage_started
+                try:
+                    result = future.result()
+                except Exception as e:
+                    status[stage] = "failed"
+                    if not isinstance(e, LayoutDriftError):  # The breaker has already explained itself
+                        traceback.print_exc()
+                    ledger.finished(stage, "failed", seconds, error=str(e))
+                    print(f"❌ {stage} failed after {seconds:.1f}s: {e}")
+                    continue
+                status[stage] = "done"
+                result = result if isinstance(result, dict) else {}
+                failed = result.get("failed") or None
+                ledger.finished(stage, "done", seconds, result.get("rows"), result.get("symbols"), failed)
+                summary = f", {result['rows']} rows committed, {len(result['failed'])} symbols missing" if "rows" in result else ""
+                print(f"✅ {stage} done in {seconds:.1f}s{summary}")
+
+    ledger.close()
+    elapsed = time.monotonic() - started
+    failed_stages = [stage for stage, state in status.items() if state != "done"]
+    print(f"🎯 Run {ledger.run_id} finished in {elapsed:.1f}s "
+          f"({page_cache.misses} pages fetched, {page_cache.hits} served from cache); "
+          f"{len(failed_stages)} stages failed or skipped.")
+    return not failed_stages
+
+
+# Function to print the stages of recent runs
+def show_ledger(runs):
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    create_ledger_table(cursor)
+    cursor.execute(f"""
+    SELECT run_id, stage, status, duration_seconds, row_count, symbol_count,
+           COALESCE(array_length(failed_symbols, 1), 0), error
+    FROM {LEDGER_TABLE}
+    WHERE run_id IN (SELECT DISTINCT run_id FROM {LEDGER_TABLE} ORDER BY run_id DESC LIMIT %s)
+    ORDER BY run_id DESC, started_at NULLS LAST, stage;
+    """, (runs,))
+    for run_id, stage, state, seconds, rows, symbol_count, failed, error in cursor.fetchall():
+        print(f"{run_id:>6}  {stage:<20} {state:<8} {seconds or 0:>9.1f}s  "
+              f"{rows or 0:>8} rows  {symbol_count or 0:>5} ok  {failed:>5} failed  {error or ''}")
+    cursor.close()
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run all NSE500 dataset loads as one DAG.")
+    parser.add_argument("--datasets", nargs="+", choices=sorted(DATASETS), default=list(DATASETS))
+    parser.add_argument("--symbols", nargs="+", default=nse500stocklist)
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS, help="Symbols fetched in parallel per dataset")
+    parser.add_argument("--atomic", action="store_true", default=ATOMIC_SYMBOLS,
+                        help="Write all datasets of a symbol in one transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Print the stages and their dependencies")
+    parser.add_argument("--ledger", type=int, metavar="RUNS", help="Show the ledger of the last RUNS runs")
+    parser.add_argument("--profile", action="store_true", help="Profile a sample of symbols per stage")
+    parser.add_argument("--profile-sample", type=float, default=profiling.SAMPLE_RATE,
+                        help="Fraction of symbols to profile")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        profiling.enable(args.profile_sample)
+
+    if args.ledger:
+        show_ledger(args.ledger)
+        return 0
+    if args.dry_run:
+        dag = build_dag(args.datasets, args.atomic)
+        for stage in topological_order(dag):
+            print(f"{stage:<20} <- {', '.join(dag[stage]) or '-'}")
+        return 0
+    return 0 if run(args.datasets, args.symbols, args.workers, args.atomic) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+# atts_nse500_pipeline.py - Streaming scrape -> load pipeline with bounded memory
+#
+# Each dataset script supplies two functions:
+#   extract(stock_symbol)              -> generator of rows for that symbol
+#   store(cursor, stock_symbol, rows)  -> inserts rows using the given cursor
+# run_pipeline() pulls rows lazily and hands each symbol's rows to a
+# background AsyncWriter, which group-commits them while the next pages are
+# being fetched (set ATTS_ASYNC_WRITER=false to write fixed-size batches
+# inline instead). At most `workers` symbols are worked on at once and each
+# page is released as soon as its section has been parsed, so memory stays
+# flat however long the stock list is. By default `workers` is the rate
+# controllers' concurrency ceiling, and the controllers decide how many of
+# those workers may have a request in flight at any moment. parse_section
+# checks each section against its layout fingerprint first (see
+# atts_nse500_fingerprint), so a Screener markup change stops the load after
+# a few pages.
+#
+# run_symbol_pipeline() is the atomic variant: it extracts every dataset for
+# a symbol and writes them as one unit, so a failed write never leaves a
+# symbol with some datasets loaded and others not. A dataset that extracted
+# nothing is left out of the unit rather than holding back the others.
+
+import os
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby, islice
+
+import psycopg2
+from bs4 import BeautifulSoup, SoupStrainer
+from db_config import DB_CONFIG
+from atts_nse500_db_writer import AsyncWriter, write_groups, write_units
+from atts_nse500_fetch import FETCH_CONCURRENCY_CEILING
+from atts_nse500_fingerprint import LayoutDriftError, check_section
+from atts_nse500_profiling import profile_symbol
+
+BATCH_SIZE = int(os.getenv("ATTS_BATCH_SIZE", "500"))  # Rows per commit
+# Symbols fetched in parallel; 0 (the default) sizes the pool for the rate
+# controllers' ceiling and lets them gate requests with AIMD
+FETCH_WORKERS = int(os.getenv("ATTS_FETCH_WORKERS", "0")) or FETCH_CONCURRENCY_CEILING
+ASYNC_WRITES = os.getenv("ATTS_ASYNC_WRITER", "true").lower() == "true"
+ATOMIC_SYMBOLS = os.getenv("ATTS_ATOMIC_SYMBOLS", "false").lower() == "true"  # One transaction per symbol
+
+
+# Function to parse only the part of a page a dataset needs
+def parse_section(markup, *args, **kwargs):
+    """Build a soup containing only elements matching SoupStrainer(*args, **kwargs)."""
+    if isinstance(kwargs.get("id"), str):
+        section = slice_element(markup, kwargs["id"])
+        check_section(markup, None if section is markup else section, kwargs["id"])
+        markup = section
+    return BeautifulSoup(markup, "html.parser", parse_only=SoupStrainer(*args, **kwargs))
+
+
+# Function to cut the element with a given id out of raw markup
+def slice_element(markup, element_id):
+    """Return just the markup of the element with this id, or all of markup if it can't be isolated.
+
+    Tokenizing a whole ~250 KB page is most of the parse cost, and every
+    dataset only needs one section of it.
+    """
+    text = markup if isinstance(markup, bytes) else markup.encode()
+    needle = b'id="' + element_id.encode() + b'"'
+    position = text.find(needle)
+    while position > 0 and not text[position - 1:position].isspace():
+        position = text.find(needle, position + 1)  # Skip data-id="..." and the like
+    start = text.rfind(b"<", 0, position) if position != -1 else -1
+    if start == -1:
+        return markup
+    name_end = start + 1
+    while name_end < len(text) and text[name_end:name_end + 1].isalnum():
+        name_end += 1
+    tag = text[start + 1:name_end].lower()
+    if not tag:
+        return markup
+
+    # Walk matching open/close tags so nested elements of the same kind are kept
+    opening, closing = b"<" + tag, b"</" + tag + b">"
+    depth, cursor = 1, name_end
+    while depth:
+        next_close = text.find(closing, cursor)
+        if next_close == -1:
+            return markup
+        next_open = text.find(opening, cursor, next_close)
+        while next_open != -1 and text[next_open + len(opening):next_open + len(opening) + 1].isalnum():
+            next_open = text.find(opening, next_open + 1, next_close)  # e.g. <section> vs <sectionx>
+        if next_open != -1:
+            depth += 1
+            cursor = next_open + len(opening)
+        else:
+            depth -= 1
+            cursor = next_close + len(closing)
+    return text[start:cursor]
+
+
+# Function to split an iterable into lists of at most `size` items
+def iter_batches(items, size):
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _extract_symbol(extract, stock_symbol):
+    """Return the symbol's rows; a failure other than layout drift only costs this symbol."""
+    try:
+        with profile_symbol(extract, stock_symbol, "extract"):
+            return list(extract(stock_symbol))
+    except LayoutDriftError:
+        raise  # Every later page would fail the same way
+    except Exception as e:
+        # The symbol yields nothing, which the callers count as a failure
+        print(f"❌ Extraction failed for {stock_symbol}: {type(e).__name__}: {e}")
+        return []
+
+
+# Function to stream (stock_symbol, row) pairs with at most `workers` symbols in progress
+def iter_symbol_rows(symbols, extract, workers=FETCH_WORKERS):
+    """Request pacing and concurrency are left to the rate controllers in atts_nse500_fetch."""
+    if workers <= 1:
+        for stock_symbol in symbols:
+            # Drained up front so a symbol that fails halfway contributes no rows
+            for row in _extract_symbol(extract, stock_symbol):
+                yield stock_symbol, row
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for stock_symbol in symbols:
+            pending.append((stock_symbol, pool.submit(_extract_symbol, extract, stock_symbol)))
+            if len(pending) >= workers:
+                done_symbol, future = pending.popleft()
+                for row in future.result():
+                    yield done_symbol, row
+        while pending:
+            done_symbol, future = pending.popleft()
+            for row in future.result():
+                yield done_symbol, row
+
+
+# Function to write one batch of (stock_symbol, row) pairs in a single transaction
+def write_batch(conn, batch, store):
+    write_groups(conn, [
+        (store, stock_symbol, [row for _, row in pairs])
+        for stock_symbol, pairs in groupby(batch, key=lambda pair: pair[0])
+    ])
+
+
+# Function to run extract -> batch -> store for a list of symbols
+def run_pipeline(symbols, extract, store, batch_size=BATCH_SIZE, workers=FETCH_WORKERS, writer=None):
+    """Stream rows from extract() into store(); return rows seen per symbol.
+
+    Rows seen are not rows committed: the writer may still reject or discard
+    them. AsyncWriter.committed_rows() reports what actually landed.
+
+    Pass a running AsyncWriter to share one writer between several datasets.
+    """
+    counts = Counter()
+    pairs = iter_symbol_rows(symbols, extract, workers)
+
+    if writer is None and not ASYNC_WRITES:
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            for batch in iter_batches(pairs, batch_size):
+                write_batch(conn, batch, store)
+                counts.update(stock_symbol for stock_symbol, _ in batch)
+        finally:
+            conn.close()
+        return counts
+
+    own_writer = writer is None
+    if own_writer:
+        writer = AsyncWriter(max_rows=batch_size)
+        writer.start()
+    try:
+        for stock_symbol, symbol_pairs in groupby(pairs, key=lambda pair: pair[0]):
+            rows = [row for _, row in symbol_pairs]
+            writer.submit(store, stock_symbol, rows)
+            counts[stock_symbol] += len(rows)
+    finally:
+        if own_writer:
+            writer.close()
+    return counts
+
+
+def _extract_all(loaders, stock_symbol):
+    return [(store, _extract_symbol(extract, stock_symbol)) for extract, store in loaders.values()]
+
+
+# Function to extract every dataset for each symbol and write each symbol as one unit
+def run_symbol_pipeline(symbols, loaders, batch_size=BATCH_SIZE, workers=FETCH_WORKERS, writer=None):
+    """loaders is {dataset: (extract, store)}; return {dataset: rows seen per symbol}.
+
+    All of a symbol's extracted datasets are committed or discarded together, and
+    units from several symbols share a commit.
+    """
+    counts = {dataset: Counter() for dataset in loaders}
+    datasets = list(loaders)
+
+    def units():
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            pending = deque()
+            for stock_symbol in symbols:
+                pending.append((stock_symbol, pool.submit(_extract_all, loaders, stock_symbol)))
+                if len(pending) >= workers:
+                    done_symbol, future = pending.popleft()
+                    yield done_symbol, future.result()
+            while pending:
+                done_symbol, future = pending.popleft()
+                yield done_symbol, future.result()
+
+    if writer is None and not ASYNC_WRITES:
+        conn = psycopg2.connect(**DB_CONFIG)
+        batch, batch_rows = [], 0
+        try:
+            for stock_symbol, extracted in units():
+                unit = [(store, stock_symbol, rows) for store, rows in extracted if rows]
+                if unit:
+                    batch.append(unit)
+                batch_rows += sum(len(rows) for _, rows in extracted)
+                for dataset, (_, rows) in zip(datasets, extracted):
+                    counts[dataset][stock_symbol] += len(rows)
+                if batch_rows >= batch_size:
+                    write_units(conn, batch)
+                    batch, batch_rows = [], 0
+            if batch:
+                write_units(conn, batch)
+        finally:
+            conn.close()
+        return counts
+
+    own_writer = writer is None
+    if own_writer:
+        writer = AsyncWriter(max_rows=batch_size)
+        writer.start()
+    try:
+        for stock_symbol, extracted in units():
+            unit = [(store, stock_symbol, rows) for store, rows in extracted if rows]
+            if unit:
+                writer.submit_unit(unit)
+            for dataset, (_, rows) in zip(datasets, extracted):
+                counts[dataset][stock_symbol] += len(rows)
+    finally:
+        if own_writer:
+            writer.close()
+    return counts
@@ -0,0 +1,206 @@
+# atts_nse500_profiling.py - Low-overhead per-stage profiling of the loaders
+#
+# Run any loader with --profile (or ATTS_PROFILE=true) to find out whether
+# fetching, parsing, cleaning or writing is the slow part. Only a sample of
+# symbols is profiled (ATTS_PROFILE_SAMPLE, default 5%). Sampling is by a
+# hash of the symbol, so a symbol is either profiled on both the scraping
+# side and the writer side or not at all. Unsampled symbols pay for one
+# dictionary lookup, which keeps the mode cheap enough to leave on in
+# production.
+#
+# For each sampled symbol:
+#   - cProfile records the extract (fetch + parse + clean) and the write,
+#     accumulated per dataset module
+#   - a stack sampler takes a stack every ATTS_PROFILE_INTERVAL seconds and
+#     files it under a stage: fetch, parse (BeautifulSoup), clean, write or other
+# At exit, ATTS_PROFILE_DIR receives <module>.<side>.prof (pstats) and
+# <module>.<stage>.collapsed files (feed these to flamegraph.pl or speedscope),
+# and a per-module summary of stage shares and top hotspots is printed.
+
+import atexit
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_ENABLED = os.getenv("ATTS_PROFILE", "false").lower() == "true" or "--profile" in sys.argv[1:]
+SAMPLE_RATE = float(os.getenv("ATTS_PROFILE_SAMPLE", "0.05"))  # Fraction of symbols profiled
+SAMPLE_INTERVAL = float(os.getenv("ATTS_PROFILE_INTERVAL", "0.005"))  # Seconds between stack samples
+PROFILE_DIR = os.getenv("ATTS_PROFILE_DIR", "profiles")
+TOP_HOTSPOTS = 8
+
+# Innermost matching frame decides the stage of a stack sample
+STAGE_FUNCTIONS = {
+    "fetch_page": "fetch",
+    "fetch_price_fields": "fetch",
+    "clean_numeric": "clean",
+    "store_data_in_postgres": "write",
+    "insert_stock_data": "write",
+    "write_groups": "write",
+    "write_units": "write",
+    "insert_row": "write",
+    "parse_section": "parse",
+}
+STAGES = ("fetch", "parse", "clean", "write", "other")
+
+_enabled = False
+_lock = threading.Lock()
+_active = {}  # thread id -> module label while a sampled symbol is being profiled
+_profiles = defaultdict(list)  # (module, side) -> [cProfile.Profile]
+_stacks = defaultdict(Counter)  # (module, stage) -> Counter of collapsed stacks
+_symbols = defaultdict(set)  # module -> sampled symbols
+_local = threading.local()
+_sampler = None
+
+
+# Function to turn profiling on for this process
+def enable(sample_rate=None, output_dir=None):
+    global _enabled, SAMPLE_RATE, PROFILE_DIR
+    if sample_rate is not None:
+        SAMPLE_RATE = sample_rate
+    if output_dir is not None:
+        PROFILE_DIR = output_dir
+    if not _enabled:
+        _enabled = True
+        atexit.register(report)
+        print(f"🔬 Profiling {SAMPLE_RATE:.0%} of symbols; results go to {PROFILE_DIR}/ at exit.")
+
+
+# Function to decide whether a symbol is in the profiled sample
+def sampled(stock_symbol):
+    return _enabled and zlib.crc32(stock_symbol.encode()) % 10000 < SAMPLE_RATE * 10000
+
+
+# Function to name the dataset module a loader function comes from
+def module_label(function):
+    return os.path.splitext(os.path.basename(function.__code__.co_filename))[0]
+
+
+# Function to profile one symbol's extract or write on the current thread
+@contextmanager
+def profile_symbol(function, stock_symbol, side):
+    """side is "extract" or "write"; a no-op unless the symbol is sampled."""
+    if not sampled(stock_symbol) or getattr(_local, "profiling", False):
+        yield
+        return
+    label = module_label(function)
+    profiler = _thread_profiler(label, side)
+    _local.profiling = True
+    with _lock:
+        _active[threading.get_ident()] = label
+        _symbols[label].add(stock_symbol)
+    _start_sampler()
+    started = False
+    try:
+        try:
+            profiler.enable()
+            started = True
+        except ValueError:
+            pass  # Another profiler owns this interpreter; keep the stack samples only
+        yield
+    finally:
+        if started:
+            profiler.disable()
+        with _lock:
+            _active.pop(threading.get_ident(), None)
+        _local.profiling = False
+
+
+def _thread_profiler(label, side):
+    # cProfile objects are not shared across threads; keep one per thread
+    profilers = getattr(_local, "profilers", None)
+    if profilers is None:
+        profilers = _local.profilers = {}
+    profiler = profilers.get((label, side))
+    if profiler is None:
+        profiler = profilers[(label, side)] = cProfile.Profile()
+        with _lock:
+            _profiles[(label, side)].append(profiler)
+    return profiler
+
+
+def _start_sampler():
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_stacks, name="atts-profiler", daemon=True)
+            _sampler.start()
+
+
+# Function to classify and record the stacks of threads being profiled
+def _sample_stacks():
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        with _lock:
+            active = dict(_active)
+        if not active:
+            continue
+        frames = sys._current_frames()
+        for thread_id, label in active.items():
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            names, stage = [], None
+            while frame is not None:
+                code = frame.f_code
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                names.append(f"{module}:{code.co_name}")
+                if stage is None:
+                    if code.co_name in STAGE_FUNCTIONS:
+                        stage = STAGE_FUNCTIONS[code.co_name]
+                    elif f"{os.sep}bs4{os.sep}" in code.co_filename:
+                        stage = "parse"
+                frame = frame.f_back
+            with _lock:
+                _stacks[(label, stage or "other")][";".join(reversed(names))] += 1
+
+
+# Function to write profile files and print the hotspot summary
+def report():
+    if not _profiles and not _stacks:
+        return
+    with _lock:
+        profiles = {key: list(value) for key, value in _profiles.items()}
+        stacks = {key: Counter(value) for key, value in _stacks.items()}
+    output_dir = os.path.join(PROFILE_DIR, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(output_dir, exist_ok=True)
+
+    for (label, stage), counter in stacks.items():
+        with open(os.path.join(output_dir, f"{label}.{stage}.collapsed"), "w") as f:
+            for stack, count in counter.most_common():
+                f.write(f"{stack} {count}\n")
+
+    for label in sorted({label for label, _ in profiles} | {label for label, _ in stacks}):
+        stage_samples = {stage: sum(stacks.get((label, stage), Counter()).values()) for stage in STAGES}
+        total_samples = sum(stage_samples.values())
+        print(f"\n🔬 {label}: {len(_symbols[label])} symbols profiled")
+        if total_samples:
+            shares = ", ".join(f"{stage} {count / total_samples:.0%}"
+                               for stage, count in stage_samples.items() if count)
+            print(f"   Stages: {shares}")
+
+        for side in ("extract", "write"):
+            profilers = [p for p in profiles.get((label, side), []) if p.getstats()]
+            if not profilers:
+                continue
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            path = os.path.join(output_dir, f"{label}.{side}.prof")
+            stats.dump_stats(path)
+            hotspots = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_HOTSPOTS]
+            print(f"   Top {side} hotspots (own time):")
+            for (filename, line, name), (_, calls, own, cumulative, _) in hotspots:
+                print(f"     {own:8.3f}s own {cumulative:8.3f}s cum {calls:>8} calls  "
+                      f"{os.path.basename(filename)}:{line}({name})")
+    print(f"\n🔬 Profiles written to {output_dir}/")
+
+
+if PROFILE_ENABLED:
+    enable()
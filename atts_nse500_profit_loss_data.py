@@ -1,9 +1,10 @@
-import requests
-from bs4 import BeautifulSoup
-import psycopg2
-from db_config import DB_CONFIG  # Import database configuration
 from nse500_stock_list import nse500stocklist  # Import stock symbols
-import time
+from atts_nse500_screener_query import mark_load_complete  # Refresh screening store after load
+from atts_nse500_pipeline import parse_section, run_pipeline  # Streaming loader
+from atts_nse500_db_writer import insert_row  # Per-row savepoints and rejects
+from atts_nse500_history import HISTORY_ENABLED, period_values, record_history  # Point-in-time history
+from atts_nse500_fetch import fetch_page  # Rate-controlled fetch
+from atts_nse500_schema import ensure_schema  # Create/migrate tables once per run
 
 # Headers for web requests
 headers = {"User-Agent": "Mozilla/5.0"}
@@ -28,30 +29,33 @@ def clean_numeric(value):
 
 # Function to scrape stock data
 def scrape_stock_data(stock_symbol):
+    """Yield one row per period once the profit-loss section has been parsed."""
     url = f"https://www.screener.in/company/{stock_symbol}/"
     print(f"Fetching data for {stock_symbol}...")
-    response = requests.get(url, headers=headers)
+    response = fetch_page(url, headers=headers)
 
     if response.status_code != 200:
         print(f"Failed to retrieve data for {stock_symbol}")
-        return None
+        return
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    # Parse only the profit-loss section and drop the raw page straight away
+    soup = parse_section(response.content, "section", id="profit-loss")
+    response.close()
+    del response
     profit_loss_section = soup.find("section", {"id": "profit-loss"})
     if not profit_loss_section:
         print(f"No profit-loss section found for {stock_symbol}")
-        return None
+        return
 
     table = profit_loss_section.find("table", {"class": "data-table"})
     if not table:
         print(f"No financial data found for {stock_symbol}")
-        return None
+        return
 
     rows = table.find("tbody").find_all("tr")
     header_row = table.find("thead").find_all("th")[1:]  # Skip first column (metric name)
     yearly = [th.get_text(strip=True) for th in header_row]
 
-    stock_data = []
     financial_dict = {metric: ["-"] * len(yearly) for metric in required_metrics}
 
     for row in rows:
@@ -61,13 +65,14 @@ def scrape_stock_data(stock_symbol):
             values = [col.get_text(strip=True) for col in cols[1:]]
             financial_dict[metric_name] = values
 
+    # Release the parsed document before handing rows downstream
+    soup.decompose()
+
     for i, yearly_val in enumerate(yearly):
         row_data = [yearly_val]
         for metric in required_metrics:
             row_data.append(clean_numeric(financial_dict[metric][i]) if i < len(financial_dict[metric]) else None)
-        stock_data.append(row_data)
-
-    return stock_data
+        yield row_data
 
 # Function to format table name
 def format_table_name(stock_symbol):
@@ -75,46 +80,13 @@ def format_table_name(stock_symbol):
         return f"stock_{stock_symbol.lower()}_profit_loss"
     return f"{stock_symbol.lower()}_profit_loss"
 
-# Function to create stock table
-def create_stock_table(stock_symbol):
-    table_name = format_table_name(stock_symbol)
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    
-    create_table_query = f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        id SERIAL PRIMARY KEY,
-        yearly VARCHAR(20),
-        sales NUMERIC,
-        revenue NUMERIC,
-        expenses NUMERIC,
-        financing_profit NUMERIC,
-        operating_profit NUMERIC,
-        financing_margin NUMERIC,
-        opm NUMERIC,
-        other_income NUMERIC,
-        interest NUMERIC,
-        depreciation NUMERIC,
-        profit_before_tax NUMERIC,
-        tax NUMERIC,
-        net_profit NUMERIC,
-        eps NUMERIC,
-        dividend_payout NUMERIC
-    );
-    """
-    cursor.execute(create_table_query)
-    conn.commit()
-    cursor.close()
-    conn.close()
-
 # Function to store data in PostgreSQL
-def store_data_in_postgres(stock_symbol, data):
+def store_data_in_postgres(cursor, stock_symbol, data):
+    """Insert rows with the pipeline's cursor; a refused row goes to the reject table."""
     if not data:
         return
-    
+
     table_name = format_table_name(stock_symbol)
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
     
     insert_query = f"""
 INSERT INTO {table_name} (
@@ -124,6 +96,7 @@ INSERT INTO {table_name} (
 ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
 """
     
+    stored = []
     for row in data:
         while len(row) < 16:
             row.append(None)
@@ -132,23 +105,18 @@ INSERT INTO {table_name} (
             print(f"❌ Data mismatch for {stock_symbol}: Expected 16, Got {len(row)}\n{row}")
             continue  
 
-        try:
-            print(f"Inserting data for {stock_symbol}: {row}")  # Debugging line
-            cursor.execute(insert_query, tuple(row))  # Ensure it's passed as a tuple
-        except Exception as e:
-            print(f"❌ Error inserting data for {stock_symbol}: {row}\n{e}")
+        print(f"Inserting data for {stock_symbol}: {row}")  # Debugging line
+        if insert_row(cursor, stock_symbol, insert_query, tuple(row)):  # Ensure it's passed as a tuple
+            stored.append(row)
+
+    if HISTORY_ENABLED:
+        record_history(cursor, "profit_loss", stock_symbol, period_values("profit_loss", stored))
 
-    conn.commit()
-    cursor.close()
-    conn.close()
     print(f"✅ Data stored for {stock_symbol} in {table_name}!")
 
 # Loop through stock symbols
-for stock in nse500stocklist:
-    create_stock_table(stock)
-    stock_data = scrape_stock_data(stock)
-    if stock_data:
-        store_data_in_postgres(stock, stock_data)
-    time.sleep(2)
-
-print("🎯 Data scraping and database storage completed successfully!")
+if __name__ == "__main__":
+    ensure_schema(["profit_loss"], nse500stocklist)
+    run_pipeline(nse500stocklist, scrape_stock_data, store_data_in_postgres)
+    mark_load_complete("profit_loss")
+    print("🎯 Data scraping and database storage completed successfully!")
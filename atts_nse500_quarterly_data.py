@@ -1,9 +1,11 @@
-import requests
-from bs4 import BeautifulSoup
-import psycopg2
-from db_config import DB_CONFIG  # Import database configuration
 from nse500_stock_list import nse500stocklist  # Import stock symbols
-import time
+from atts_nse500_screener_query import mark_load_complete  # Refresh screening store after load
+from atts_nse500_pipeline import parse_section, run_pipeline  # Streaming loader
+from atts_nse500_db_writer import insert_row  # Per-row savepoints and rejects
+from atts_nse500_history import HISTORY_ENABLED, period_values, record_history  # Point-in-time history
+from atts_nse500_fetch import fetch_page  # Rate-controlled fetch
+from atts_nse500_schema import ensure_schema  # Create/migrate tables once per run
+from atts_nse500_quarterly_pdfs import DOWNLOAD_ENABLED, download_quarterly_pdfs  # Optional PDF stage
 
 # Headers for web requests
 headers = {"User-Agent": "Mozilla/5.0"}
@@ -27,19 +29,23 @@ def clean_numeric(value):
 
 # Function to scrape stock data
 def scrape_stock_data(stock_symbol):
+    """Yield one row per period once the quarters section has been parsed."""
     url = f"https://www.screener.in/company/{stock_symbol}/"
     print(f"Fetching data for {stock_symbol}...")
-    response = requests.get(url, headers=headers)
+    response = fetch_page(url, headers=headers)
 
     if response.status_code != 200:
         print(f"Failed to retrieve data for {stock_symbol}")
-        return None
+        return
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    # Parse only the quarters section and drop the raw page straight away
+    soup = parse_section(response.content, "section", id="quarters")
+    response.close()
+    del response
     table = soup.find("table", class_="data-table")
     if not table:
         print(f"No financial data found for {stock_symbol}")
-        return None
+        return
 
     rows = table.find("tbody").find_all("tr")
     header_row = table.find("thead").find_all("th")[1:]
@@ -53,7 +59,6 @@ def scrape_stock_data(stock_symbol):
             for a in pdf_section.find_all("a", href=True)
         ]
 
-    stock_data = []
     financial_dict = {metric: ["-"] * len(quarters) for metric in required_metrics}
 
     for row in rows:
@@ -63,61 +68,27 @@ def scrape_stock_data(stock_symbol):
             values = [col.get_text(strip=True) for col in cols[1:]]
             financial_dict[metric_name] = values
 
+    # Release the parsed document before handing rows downstream
+    soup.decompose()
+
     for i, quarter in enumerate(quarters):
         row_data = [quarter]
         for metric in required_metrics:
             row_data.append(clean_numeric(financial_dict[metric][i]) if i < len(financial_dict[metric]) else None)
         row_data.append(pdf_links[i] if i < len(pdf_links) else None)
-        stock_data.append(row_data)
-    
-    return stock_data
+        yield row_data
 
 # Function to format table name
 def format_table_name(stock_symbol):
     return f"stock_{stock_symbol.lower()}_quarterly" if stock_symbol[0].isdigit() else f"{stock_symbol.lower()}_quarterly"
 
-# Function to create a table
-def create_stock_table(stock_symbol):
-    table_name = format_table_name(stock_symbol)
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    
-    create_table_query = f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        id SERIAL PRIMARY KEY,
-        quarter VARCHAR(20),
-        sales NUMERIC,
-        revenue NUMERIC,
-        expenses NUMERIC,
-        financing_profit NUMERIC,
-        operating_profit NUMERIC,
-        financing_margin_percent NUMERIC,
-        opm NUMERIC,
-        other_income NUMERIC,
-        interest NUMERIC,
-        depreciation NUMERIC,
-        profit_before_tax NUMERIC,
-        tax NUMERIC,
-        net_profit NUMERIC,
-        eps NUMERIC,
-        gross_npa_percent NUMERIC,
-        net_npa_percent NUMERIC,
-        raw_pdf_link TEXT
-    );
-    """
-    cursor.execute(create_table_query)
-    conn.commit()
-    cursor.close()
-    conn.close()
-
 # Function to store data
-def store_data_in_postgres(stock_symbol, data):
+def store_data_in_postgres(cursor, stock_symbol, data):
+    """Insert rows with the pipeline's cursor; a refused row goes to the reject table."""
     if not data:
         return
 
     table_name = format_table_name(stock_symbol)
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
 
     insert_query = f"""
     INSERT INTO {table_name} (
@@ -127,6 +98,7 @@ def store_data_in_postgres(stock_symbol, data):
     ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
     """
 
+    stored = []
     for row in data:
         while len(row) < 18:
             row.append(None)
@@ -135,23 +107,20 @@ def store_data_in_postgres(stock_symbol, data):
             print(f"❌ Data mismatch for {stock_symbol}: {row}")
             continue  
 
-        try:
-            clean_row = [None if (val in ["", "-"]) else val for val in row]
-            cursor.execute(insert_query, clean_row)
-        except Exception as e:
-            print(f"❌ Error inserting data for {stock_symbol}: {row}\n{e}")
+        clean_row = [None if (val in ["", "-"]) else val for val in row]
+        if insert_row(cursor, stock_symbol, insert_query, clean_row):
+            stored.append(clean_row)
+
+    if HISTORY_ENABLED:
+        record_history(cursor, "quarterly", stock_symbol, period_values("quarterly", stored))
 
-    conn.commit()
-    cursor.close()
-    conn.close()
     print(f"✅ Data stored for {stock_symbol} in {table_name}!")
 
 # Main execution
-for stock in nse500stocklist:
-    create_stock_table(stock)
-    stock_data = scrape_stock_data(stock)
-    if stock_data:
-        store_data_in_postgres(stock, stock_data)
-    time.sleep(2)
-
-print("🎯 Data scraping and database storage completed successfully!")
+if __name__ == "__main__":
+    ensure_schema(["quarterly"], nse500stocklist)
+    run_pipeline(nse500stocklist, scrape_stock_data, store_data_in_postgres)
+    mark_load_complete("quarterly")
+    if DOWNLOAD_ENABLED:
+        download_quarterly_pdfs(nse500stocklist)
+    print("🎯 Data scraping and database storage completed successfully!")
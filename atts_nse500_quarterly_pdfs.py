@@ -0,0 +1,168 @@
+# atts_nse500_quarterly_pdfs.py - Download quarterly result PDFs into a local object store
+#
+# atts_nse500_quarterly_data.py stores each quarter's raw_pdf_link. This stage
+# downloads those links concurrently, resumes interrupted transfers with HTTP
+# Range requests, stores each file once under its SHA-256 and records every
+# URL in a manifest table so later runs skip what is already on disk.
+#
+# Downloads go through fetch_page, so they share the rate controllers, the
+# egress routes and the ATTS_SCREENER_URL redirect with the page scrapers,
+# and a response that is not a PDF is never stored.
+#
+# Runs after the quarterly load when ATTS_DOWNLOAD_PDFS=true, or standalone:
+#   python atts_nse500_quarterly_pdfs.py [SYMBOL ...]
+
+import hashlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import psycopg2
+import requests
+from db_config import DB_CONFIG
+from nse500_stock_list import nse500stocklist
+from atts_nse500_datasets import table_name
+from atts_nse500_fetch import fetch_page  # Rate-controlled fetch
+
+DOWNLOAD_ENABLED = os.getenv("ATTS_DOWNLOAD_PDFS", "false").lower() == "true"
+PDF_STORE = os.getenv("ATTS_PDF_STORE", "quarterly_pdfs")
+PDF_WORKERS = int(os.getenv("ATTS_PDF_WORKERS", "4"))
+MANIFEST_TABLE = "nse500_quarterly_pdf_manifest"
+CHUNK_SIZE = 64 * 1024
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+
+# Function to create the manifest table
+def create_manifest_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+        url TEXT PRIMARY KEY,
+        stock_symbol TEXT NOT NULL,
+        quarter VARCHAR(20),
+        sha256 CHAR(64) NOT NULL,
+        size_bytes BIGINT NOT NULL,
+        object_path TEXT NOT NULL,
+        downloaded_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {MANIFEST_TABLE}_sha256_idx ON {MANIFEST_TABLE} (sha256);")
+
+
+# Function to list PDF links not yet in the manifest
+def pending_links(cursor, symbols):
+    cursor.execute(f"SELECT url FROM {MANIFEST_TABLE};")
+    done = {row[0] for row in cursor.fetchall()}
+    links = []
+    for stock_symbol in symbols:
+        source = table_name("quarterly", stock_symbol)
+        cursor.execute("SELECT to_regclass(%s);", (source,))
+        if cursor.fetchone()[0] is None:
+            continue
+        cursor.execute(f"""
+        SELECT DISTINCT ON (raw_pdf_link) raw_pdf_link, quarter FROM {source}
+        WHERE raw_pdf_link IS NOT NULL ORDER BY raw_pdf_link, id DESC;
+        """)
+        links.extend((url, stock_symbol, quarter) for url, quarter in cursor.fetchall() if url not in done)
+    return links
+
+
+# Function to map a content hash to its path in the object store
+def object_path(sha256):
+    return os.path.join(PDF_STORE, "objects", sha256[:2], f"{sha256}.pdf")
+
+
+# Function to download one URL, resuming a partial file if one exists
+def download_pdf(url):
+    """Download url into the object store; return (sha256, size_bytes, path).
+
+    Raises ValueError if the server answers with something other than a PDF.
+    """
+    partial_dir = os.path.join(PDF_STORE, "partial")
+    os.makedirs(partial_dir, exist_ok=True)
+    partial_path = os.path.join(partial_dir, hashlib.sha1(url.encode()).hexdigest() + ".part")
+
+    digest = hashlib.sha256()
+    offset = 0
+    if os.path.exists(partial_path):
+        with open(partial_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                offset += len(chunk)
+
+    headers = dict(HEADERS)
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    response = fetch_page(url, headers=headers, stream=True)
+    with response:
+        content_type = response.headers.get("Content-Type", "")
+        if response.status_code in (200, 206) and "pdf" not in content_type.lower():
+            # e.g. a login or error page served with 200
+            raise ValueError(f"not a PDF (Content-Type: {content_type or 'missing'})")
+        if response.status_code == 416:
+            pass  # Partial file already holds the whole body
+        elif response.status_code == 206 and offset:
+            with open(partial_path, "ab") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    offset += len(chunk)
+        else:
+            response.raise_for_status()
+            # Server ignored the Range header; start over
+            digest = hashlib.sha256()
+            offset = 0
+            with open(partial_path, "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    offset += len(chunk)
+
+    sha256 = digest.hexdigest()
+    path = object_path(sha256)
+    if os.path.exists(path):
+        os.remove(partial_path)  # Same content already stored under another URL
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(partial_path, path)
+    return sha256, offset, path
+
+
+# Function to download all pending PDFs for the given symbols
+def download_quarterly_pdfs(symbols=None, workers=PDF_WORKERS):
+    symbols = symbols or nse500stocklist
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    create_manifest_table(cursor)
+    conn.commit()
+
+    links = pending_links(cursor, symbols)
+    print(f"📄 {len(links)} quarterly PDFs to download.")
+    downloaded = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(download_pdf, url): (url, stock_symbol, quarter)
+                   for url, stock_symbol, quarter in links}
+        for future in as_completed(futures):
+            url, stock_symbol, quarter = futures[future]
+            try:
+                sha256, size_bytes, path = future.result()
+            except (requests.RequestException, OSError, ValueError) as e:
+                failed += 1
+                print(f"❌ PDF download failed for {stock_symbol} {quarter}: {e}")
+                continue
+            cursor.execute(f"""
+            INSERT INTO {MANIFEST_TABLE} (url, stock_symbol, quarter, sha256, size_bytes, object_path)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (url) DO NOTHING;
+            """, (url, stock_symbol, quarter, sha256, size_bytes, path))
+            conn.commit()
+            downloaded += 1
+
+    cursor.close()
+    conn.close()
+    print(f"✅ Downloaded {downloaded} quarterly PDFs ({failed} failed) into {PDF_STORE}.")
+    return downloaded, failed
+
+
+if __name__ == "__main__":
+    download_quarterly_pdfs(sys.argv[1:] or None)
@@ -0,0 +1,152 @@
+# atts_nse500_scale_harness.py - Measure how a full run scales with the universe size
+#
+# For each universe size this starts the synthetic stand-in server, recreates
+# a scratch database, and runs the orchestrator over that many synthetic
+# symbols in a child process. It records:
+#   - wall time, pages/s and rows/s (from the run ledger)
+#   - peak resident memory of the child
+#   - database size and table count afterwards
+# The results are printed as a Markdown table and appended to a CSV, so
+# curves from different machines or commits can be compared. Seconds and
+# bytes per symbol staying flat as the size grows means linear scaling.
+#
+# Linux only: the child's peak memory comes from os.wait4() and ru_maxrss,
+# which is reported in KB on Linux (macOS reports bytes, Windows has neither).
+#
+# Usage:
+#   python atts_nse500_scale_harness.py --sizes 500 1000 2500 5000 --latency 0.05
+
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import psycopg2
+from psycopg2 import sql
+from db_config import DB_CONFIG
+from atts_nse500_synthetic import start_server, synthetic_symbols
+
+SCRATCH_DB = os.getenv("ATTS_SCALE_DB", "ATTS_ScaleTest")
+RESULT_COLUMNS = ["symbols", "seconds", "pages_per_second", "rows", "rows_per_second", "peak_rss_mb",
+                  "db_size_mb", "tables", "seconds_per_symbol", "kb_per_symbol", "failed_stages"]
+
+
+# Function to drop and recreate the scratch database
+def reset_database(name):
+    conn = psycopg2.connect(**{**DB_CONFIG, "dbname": "postgres"})
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {};").format(sql.Identifier(name)))
+    cursor.execute(sql.SQL("CREATE DATABASE {};").format(sql.Identifier(name)))
+    cursor.close()
+    conn.close()
+
+
+# Function to read sizes and ledger totals from the scratch database
+def database_stats(name):
+    conn = psycopg2.connect(**{**DB_CONFIG, "dbname": name})
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_database_size(current_database());")
+    size = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = 'public';")
+    tables = cursor.fetchone()[0]
+    cursor.execute("""
+    SELECT COALESCE(SUM(row_count), 0), COUNT(*) FILTER (WHERE status <> 'done')
+    FROM nse500_run_ledger WHERE run_id = (SELECT MAX(run_id) FROM nse500_run_ledger);
+    """)
+    rows, failed_stages = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return size, tables, int(rows), failed_stages
+
+
+# Function to run one full load over `count` synthetic symbols
+def run_size(count, server_url, workers, log_dir):
+    reset_database(SCRATCH_DB)
+    env = dict(os.environ)
+    env.update({
+        "PG_DBNAME": SCRATCH_DB,
+        "ATTS_SCREENER_URL": server_url,
+        "ATTS_RATE_STATE": os.path.join(log_dir, "rate_state.json"),
+        "ATTS_RATE_INITIAL": env.get("ATTS_RATE_INITIAL", "200"),
+        "ATTS_RATE_MAX": env.get("ATTS_RATE_MAX", "1000"),
+        "ATTS_CUBE_DIR": os.path.join(log_dir, "cube"),
+    })
+    command = [sys.executable, "atts_nse500_orchestrator.py", "--workers", str(workers),
+               "--symbols", *synthetic_symbols(count)]
+    log_path = os.path.join(log_dir, f"run_{count}.log")
+    started = time.monotonic()
+    with open(log_path, "w") as log:
+        child = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+        _, status, usage = os.wait4(child.pid, 0)
+        child.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.monotonic() - started
+    if child.returncode not in (0, 1):
+        raise RuntimeError(f"Run for {count} symbols crashed; see {log_path}")
+
+    size, tables, rows, failed_stages = database_stats(SCRATCH_DB)
+    return {
+        "symbols": count,
+        "seconds": round(seconds, 1),
+        "pages_per_second": round(count / seconds, 1),
+        "rows": rows,
+        "rows_per_second": round(rows / seconds),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),  # ru_maxrss is in KB on Linux
+        "db_size_mb": round(size / 2 ** 20, 1),
+        "tables": tables,
+        "seconds_per_symbol": round(seconds / count, 4),
+        "kb_per_symbol": round(size / 1024 / count, 1),
+        "failed_stages": failed_stages,
+    }
+
+
+def print_table(results):
+    print("| " + " | ".join(RESULT_COLUMNS) + " |")
+    print("|" + "---|" * len(RESULT_COLUMNS))
+    for result in results:
+        print("| " + " | ".join(str(result[column]) for column in RESULT_COLUMNS) + " |")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure run time, memory and DB size against universe size.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[500, 1000, 2500, 5000])
+    parser.add_argument("--workers", type=int, default=8, help="Symbols fetched in parallel per dataset")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in server latency in seconds")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", default="scale_results.csv", help="CSV file to append results to")
+    args = parser.parse_args(argv)
+
+    server = start_server(port=args.port, latency=args.latency, throttle=args.throttle)
+    server_url = f"http://127.0.0.1:{args.port}"
+    results = []
+    with tempfile.TemporaryDirectory(prefix="atts_scale_") as log_dir:
+        try:
+            for count in args.sizes:
+                print(f"⏱️ Running {count} symbols...")
+                result = run_size(count, server_url, args.workers, log_dir)
+                results.append(result)
+                print(f"✅ {count} symbols: {result['seconds']}s, {result['peak_rss_mb']} MB peak, "
+                      f"{result['db_size_mb']} MB database")
+        finally:
+            server.shutdown()
+
+    write_header = not os.path.exists(args.output)
+    with open(args.output, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["measured_at", "latency", "workers"] + RESULT_COLUMNS)
+        if write_header:
+            writer.writeheader()
+        for result in results:
+            writer.writerow({"measured_at": time.strftime("%Y-%m-%d %H:%M:%S"), "latency": args.latency,
+                             "workers": args.workers, **result})
+    print()
+    print_table(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
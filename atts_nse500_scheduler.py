@@ -0,0 +1,251 @@
+# atts_nse500_scheduler.py - Run symbol x dataset jobs in priority order under a deadline
+#
+# The dataset scripts walk nse500stocklist alphabetically, so a run that is
+# cut short always drops the same end of the alphabet. This scheduler scores
+# every (symbol, dataset) job and runs the most valuable ones first:
+#   - market cap (from the fundamental data in the metric store)
+#   - staleness (latest loaded_at in the symbol's table, or never loaded)
+#   - fresh results (listed with --announced, or the symbol's latest stored
+#     quarter lags the rest of the universe)
+# With --deadline it stops starting jobs that would not finish in time.
+#
+# Usage:
+#   python atts_nse500_scheduler.py --deadline 30m
+#   python atts_nse500_scheduler.py --datasets quarterly ratios --announced TCS INFY --dry-run
+#   python atts_nse500_scheduler.py --deadline 2h --profile --profile-sample 0.1
+
+import argparse
+import math
+import re
+import sys
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import psycopg2
+from db_config import DB_CONFIG
+from nse500_stock_list import nse500stocklist
+from atts_nse500_datasets import DATASETS, LATEST_PERIOD, load_dataset_functions, table_name
+from atts_nse500_db_writer import AsyncWriter
+from atts_nse500_fingerprint import LayoutDriftError
+from atts_nse500_pipeline import FETCH_WORKERS, iter_batches
+from atts_nse500_schema import ensure_schema, introspect
+from atts_nse500_screener_query import METRIC_STORE_TABLE, mark_load_complete
+import atts_nse500_profiling as profiling
+
+# Score weights; each component is scaled to 0..1
+MARKET_CAP_WEIGHT = 0.5
+STALENESS_WEIGHT = 0.3
+ANNOUNCED_WEIGHT = 0.2
+STALE_AFTER_HOURS = 24 * 7  # Data this old counts as fully stale
+PERIODIC_DATASETS = ("quarterly", "profit_loss", "balance_sheet", "cash_flow", "ratios", "shareholding")
+
+DURATION_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*$")
+MONTHS = {name: i for i, name in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1)}
+
+
+# Function to parse a duration such as "30m", "2h" or "90s" into seconds
+def parse_duration(text):
+    match = DURATION_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Invalid duration '{text}' (expected e.g. 30m, 2h, 90s)")
+    value, unit = float(match.group(1)), match.group(2) or "s"
+    return value * {"s": 1, "m": 60, "h": 3600}[unit]
+
+
+# Function to turn a period label such as "Dec 2024" into a sortable month number
+def period_month(label):
+    parts = (label or "").split()
+    if len(parts) != 2 or parts[0] not in MONTHS or not parts[1].isdigit():
+        return None
+    return int(parts[1]) * 12 + MONTHS[parts[0]]
+
+
+# Function to read market caps for all symbols in one query
+def market_caps(cursor):
+    cursor.execute("SELECT to_regclass(%s);", (METRIC_STORE_TABLE,))
+    if cursor.fetchone()[0] is None:
+        return {}
+    cursor.execute(f"""
+    SELECT stock_symbol, value FROM {METRIC_STORE_TABLE}
+    WHERE dataset = 'fundamental' AND metric = 'market_cap' AND period = %s AND value > 0;
+    """, (LATEST_PERIOD,))
+    return {symbol: float(value) for symbol, value in cursor.fetchall()}
+
+
+# Function to find symbols whose latest stored quarter lags the universe
+def lagging_quarters(cursor, symbols):
+    cursor.execute("SELECT to_regclass(%s);", (METRIC_STORE_TABLE,))
+    if cursor.fetchone()[0] is None:
+        return set()
+    cursor.execute(f"""
+    SELECT stock_symbol, period FROM {METRIC_STORE_TABLE}
+    WHERE dataset = 'quarterly' AND metric = 'sales';
+    """)
+    latest = {}
+    for symbol, period in cursor.fetchall():
+        month = period_month(period)
+        if month is not None:
+            latest[symbol] = max(latest.get(symbol, 0), month)
+    if not latest:
+        return set()
+    newest = max(latest.values())
+    return {symbol for symbol in symbols if symbol in latest and latest[symbol] < newest}
+
+
+# Function to read the last load time of every symbol x dataset table
+def last_loaded(cursor, datasets, symbols):
+    known = introspect(cursor)
+    queries = []
+    for dataset in datasets:
+        for symbol in symbols:
+            name = table_name(dataset, symbol)
+            if "loaded_at" in known.get(name, ()):
+                queries.append((f"SELECT %s, %s, MAX(loaded_at) FROM {name}", (dataset, symbol)))
+
+    loaded = {}
+    for chunk in iter_batches(queries, 500):
+        cursor.execute(" UNION ALL ".join(sql for sql, _ in chunk), [p for _, params in chunk for p in params])
+        for dataset, symbol, loaded_at in cursor.fetchall():
+            if loaded_at is not None:
+                loaded[(symbol, dataset)] = loaded_at
+    return loaded
+
+
+# Function to score and order all jobs, most valuable first
+def plan_jobs(datasets, symbols, announced=()):
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    caps = market_caps(cursor)
+    fresh_results = set(announced) | lagging_quarters(cursor, symbols)
+    loaded = last_loaded(cursor, datasets, symbols)
+    cursor.close()
+    conn.close()
+
+    missing_caps = [symbol for symbol in symbols if symbol not in caps]
+    if len(missing_caps) == len(symbols) and symbols:
+        print("⚠️ No market caps in the metric store; every symbol gets the same market-cap score. "
+              "Load the fundamental dataset first.")
+    elif missing_caps:
+        print(f"⚠️ No market cap for {len(missing_caps)}/{len(symbols)} symbols "
+              f"(e.g. {', '.join(missing_caps[:5])}); they get a neutral market-cap score.")
+
+    log_caps = {symbol: math.log10(cap) for symbol, cap in caps.items()}
+    low, high = (min(log_caps.values()), max(log_caps.values())) if log_caps else (0, 0)
+    now = datetime.now(timezone.utc)
+
+    jobs = []
+    for symbol in symbols:
+        if symbol in log_caps and high > low:
+            cap_score = (log_caps[symbol] - low) / (high - low)
+        else:
+            cap_score = 0.5 if symbol not in log_caps else 1.0
+        for dataset in datasets:
+            loaded_at = loaded.get((symbol, dataset))
+            if loaded_at is None:
+                stale_score = 1.0
+            else:
+                age_hours = (now - loaded_at).total_seconds() / 3600
+                stale_score = min(max(age_hours, 0) / STALE_AFTER_HOURS, 1.0)
+            announced_score = 1.0 if symbol in fresh_results and dataset in PERIODIC_DATASETS else 0.0
+            score = (MARKET_CAP_WEIGHT * cap_score + STALENESS_WEIGHT * stale_score
+                     + ANNOUNCED_WEIGHT * announced_score)
+            jobs.append((round(score, 4), symbol, dataset))
+
+    jobs.sort(key=lambda job: (-job[0], job[1], job[2]))
+    return jobs
+
+
+def _run_job(extract, symbol):
+    started = time.monotonic()
+    with profiling.profile_symbol(extract, symbol, "extract"):
+        rows = list(extract(symbol))
+    return rows, time.monotonic() - started
+
+
+# Function to run jobs in order, skipping any that would overrun the deadline
+def run_jobs(jobs, deadline=None, workers=FETCH_WORKERS):
+    """Run (score, symbol, dataset) jobs; return (completed, skipped, failed) job lists.
+
+    A job that raises is logged and counted as failed; the rest still run.
+    """
+    started = time.monotonic()
+    stop_at = started + deadline if deadline else None
+    functions = {dataset: load_dataset_functions(dataset) for dataset in {job[2] for job in jobs}}
+    durations = {}  # dataset -> moving average of seconds per job
+    completed, skipped, failed = [], [], []
+    workers = max(1, workers)
+
+    def finish(job, future, writer):
+        _, symbol, dataset = job
+        try:
+            rows, seconds = future.result()
+        except Exception as e:
+            if not isinstance(e, LayoutDriftError):  # The breaker has already explained itself
+                traceback.print_exc()
+            print(f"❌ {dataset} for {symbol} failed: {e}")
+            failed.append(job)
+            return
+        durations[dataset] = seconds if dataset not in durations else 0.7 * durations[dataset] + 0.3 * seconds
+        if rows:
+            writer.submit(functions[dataset][1], symbol, rows)
+        completed.append(job)
+
+    with AsyncWriter() as writer, ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for job in jobs:
+            if stop_at is not None:
+                # Jobs already in flight share the workers, so wait for their share too
+                estimate = durations.get(job[2], 0) * (1 + len(pending) / workers)
+                if time.monotonic() + estimate > stop_at:
+                    skipped.append(job)
+                    continue
+            pending.append((job, pool.submit(_run_job, functions[job[2]][0], job[1])))
+            if len(pending) >= workers:
+                finish(*pending.popleft(), writer)
+        while pending:
+            finish(*pending.popleft(), writer)
+
+    elapsed = time.monotonic() - started
+    print(f"✅ Ran {len(completed)} jobs in {elapsed:.0f}s; {len(failed)} failed, "
+          f"skipped {len(skipped)} to meet the deadline.")
+    return completed, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run NSE500 dataset jobs by priority within a time budget.")
+    parser.add_argument("--deadline", type=parse_duration, help="Wall-clock budget, e.g. 30m, 2h, 90s")
+    parser.add_argument("--datasets", nargs="+", choices=sorted(DATASETS), default=list(DATASETS))
+    parser.add_argument("--symbols", nargs="+", default=nse500stocklist)
+    parser.add_argument("--announced", nargs="*", default=[], help="Symbols that just announced results")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="Print the job order without running it")
+    parser.add_argument("--profile", action="store_true", help="Profile a sample of symbols per stage")
+    parser.add_argument("--profile-sample", type=float, default=profiling.SAMPLE_RATE,
+                        help="Fraction of symbols to profile")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        profiling.enable(args.profile_sample)
+
+    if not args.dry_run:
+        ensure_schema(args.datasets, args.symbols)
+    jobs = plan_jobs(args.datasets, args.symbols, args.announced)
+    if args.dry_run:
+        for score, symbol, dataset in jobs:
+            print(f"{score:.3f}  {symbol:<12} {dataset}")
+        return 0
+
+    completed, _, failed = run_jobs(jobs, args.deadline, args.workers)
+    for dataset in args.datasets:
+        touched = [symbol for _, symbol, job_dataset in completed if job_dataset == dataset]
+        if touched:
+            mark_load_complete(dataset, touched)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
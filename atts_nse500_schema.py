@@ -0,0 +1,196 @@
+# atts_nse500_schema.py - Create and migrate the per-symbol tables once per run
+#
+# Instead of running CREATE TABLE IF NOT EXISTS plus a commit before every
+# symbol, the loaders call ensure_schema() once at startup. It reads
+# information_schema in a single query, creates whatever tables are missing,
+# applies MIGRATIONS, and remembers what exists so the rest of the run never
+# touches the catalog again.
+#
+# SCHEMA_VERSIONS_TABLE keeps the migration version of every per-symbol
+# table. A table only runs the migrations newer than its version, in version
+# order; new tables are created at the latest version. Tables of symbols that
+# are not in a run keep their version and catch up the next time they are.
+
+import os
+
+import psycopg2
+from db_config import DB_CONFIG
+from nse500_stock_list import nse500stocklist
+from atts_nse500_changefeed import create_changelog_table
+from atts_nse500_datasets import DATASETS, table_name
+from atts_nse500_db_writer import create_reject_table
+from atts_nse500_history import HISTORY_ENABLED, create_history_table
+
+SCHEMA_VERSIONS_TABLE = "nse500_schema_versions"
+SCHEMA_LOCK_KEY = "nse500_schema"
+SCHEMA_CHUNK = int(os.getenv("ATTS_SCHEMA_CHUNK", "500"))  # Tables created per transaction
+
+# Column additions applied to existing tables. "datasets" lists the datasets
+# a migration touches (None means all of them). New tables are created with
+# every migrated column already in place.
+MIGRATIONS = [
+    {
+        "version": 1,
+        "description": "Record when each row was loaded",
+        "datasets": None,
+        "columns": {"loaded_at": "TIMESTAMPTZ DEFAULT NOW()"},
+    },
+    {
+        "version": 2,
+        "description": "Split High / Low into numeric 52-week high and low (high_low is no longer written)",
+        "datasets": ["fundamental"],
+        "columns": {"high_52w": "NUMERIC", "low_52w": "NUMERIC"},
+    },
+]
+
+_known_columns = None  # table name -> set of column names
+_ensured = set()
+
+
+# Function to list the migrations that touch a dataset, in version order
+def dataset_migrations(dataset):
+    return sorted((migration for migration in MIGRATIONS
+                   if migration["datasets"] is None or dataset in migration["datasets"]),
+                  key=lambda migration: migration["version"])
+
+
+# Function to list the full column layout of a dataset table
+def table_columns(dataset):
+    spec = DATASETS[dataset]
+    if spec["period_column"]:
+        columns = [("id", "SERIAL PRIMARY KEY"), (spec["period_column"], "VARCHAR(20)")]
+    else:
+        columns = [("stock_symbol", "TEXT PRIMARY KEY")]
+    columns += [(metric, "NUMERIC") for metric in spec["metrics"]]
+    columns += list(spec.get("extra_columns", {}).items())
+    for migration in dataset_migrations(dataset):
+        # Migrations may add columns that are metrics by now
+        columns += [(column, definition) for column, definition in migration["columns"].items()
+                    if column not in {name for name, _ in columns}]
+    return columns
+
+
+# Function to read every table and column in the schema with one query
+def introspect(cursor):
+    cursor.execute("""
+    SELECT table_name, column_name FROM information_schema.columns
+    WHERE table_schema = current_schema();
+    """)
+    known = {}
+    for table, column in cursor.fetchall():
+        known.setdefault(table, set()).add(column)
+    return known
+
+
+# Function to create the per-table migration version ledger
+def create_schema_versions_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA_VERSIONS_TABLE} (
+        table_name TEXT PRIMARY KEY,
+        dataset VARCHAR(20) NOT NULL,
+        version INT NOT NULL,
+        migrated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """)
+
+
+# Function to read the migration version of every table
+def read_versions(cursor):
+    cursor.execute(f"SELECT table_name, version FROM {SCHEMA_VERSIONS_TABLE};")
+    return dict(cursor.fetchall())
+
+
+# Function to create missing tables and run pending migrations for one dataset
+def apply_dataset(cursor, dataset, symbols, known, versions):
+    columns = table_columns(dataset)
+    migrations = dataset_migrations(dataset)
+    latest = migrations[-1]["version"] if migrations else 0
+    created = altered = 0
+    stamped = []
+    for stock_symbol in symbols:
+        name = table_name(dataset, stock_symbol)
+        existing = known.get(name)
+        if existing is None:
+            column_sql = ",\n        ".join(f"{column} {definition}" for column, definition in columns)
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} (\n        {column_sql}\n    );")
+            known[name] = {column for column, _ in columns}
+            stamped.append(name)
+            created += 1
+            continue
+        applied = versions.get(name, 0)
+        if applied >= latest:
+            continue
+        for migration in migrations:
+            if migration["version"] <= applied:
+                continue
+            for column, definition in migration["columns"].items():
+                # Tables migrated before the ledger existed may have the column already
+                if column not in existing:
+                    cursor.execute(f"ALTER TABLE {name} ADD COLUMN IF NOT EXISTS {column} {definition};")
+                    existing.add(column)
+                    altered += 1
+        stamped.append(name)
+
+    if stamped:
+        values = ", ".join(cursor.mogrify("(%s, %s, %s)", (name, dataset, latest)).decode() for name in stamped)
+        cursor.execute(f"""
+        INSERT INTO {SCHEMA_VERSIONS_TABLE} (table_name, dataset, version) VALUES {values}
+        ON CONFLICT (table_name) DO UPDATE SET version = EXCLUDED.version, migrated_at = NOW();
+        """)
+        versions.update((name, latest) for name in stamped)
+    return created, altered
+
+
+# Function to make sure every dataset table exists with its current layout
+def ensure_schema(datasets=None, symbols=None):
+    """Create or migrate all tables for the given datasets in one pass per run."""
+    global _known_columns
+    datasets = [dataset for dataset in (datasets or DATASETS) if dataset not in _ensured]
+    if not datasets:
+        return
+    symbols = list(symbols or nse500stocklist)
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (SCHEMA_LOCK_KEY,))
+        create_schema_versions_table(cursor)
+        create_changelog_table(cursor)
+        create_reject_table(cursor)
+        if HISTORY_ENABLED:
+            create_history_table(cursor)
+        versions = read_versions(cursor)
+        conn.commit()
+        if _known_columns is None:
+            _known_columns = introspect(cursor)
+        # Every new table holds several locks until commit, so commit every
+        # SCHEMA_CHUNK symbols to stay under max_locks_per_transaction
+        for dataset in datasets:
+            created = altered = 0
+            for offset in range(0, len(symbols), SCHEMA_CHUNK):
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (SCHEMA_LOCK_KEY,))
+                chunk_created, chunk_altered = apply_dataset(
+                    cursor, dataset, symbols[offset:offset + SCHEMA_CHUNK], _known_columns, versions
+                )
+                conn.commit()
+                created += chunk_created
+                altered += chunk_altered
+            _ensured.add(dataset)
+            print(f"✅ Schema ready for {dataset} ({created} tables created, {altered} columns added).")
+    except Exception as e:
+        conn.rollback()
+        _known_columns = None  # Re-read the catalog next time
+        print(f"⚠️ Schema setup error: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# Function to check the cached catalog for a table
+def table_exists(name):
+    return _known_columns is not None and name in _known_columns
+
+
+if __name__ == "__main__":
+    ensure_schema()
@@ -0,0 +1,331 @@
+# atts_nse500_screener_query.py - Cross-sectional screening over the stored NSE500 data
+#
+# The scraper scripts write one table per symbol per dataset, which makes
+# questions like "top 50 by ROCE with D/E < 0.5" a hand-written UNION over
+# hundreds of tables. This module keeps a long-format metric store
+# (dataset, metric, period, symbol, value) indexed on period/metric, refreshed
+# when a load finishes, and answers screens from it through a small LRU cache.
+#
+# Usage:
+#   python atts_nse500_screener_query.py --period "Mar 2024" \
+#       --filter "debt_to_equity<0.5" --sort ratios.roce --limit 50
+#   python atts_nse500_screener_query.py --refresh ratios balance_sheet
+
+import argparse
+import re
+import sys
+import time
+from functools import lru_cache
+
+import psycopg2
+from db_config import DB_CONFIG
+from nse500_stock_list import nse500stocklist
+from atts_nse500_datasets import DATASETS, LATEST_PERIOD, table_name
+
+METRIC_STORE_TABLE = "nse500_metric_store"
+LOAD_STATE_TABLE = "nse500_load_state"
+CACHE_SIZE = 256
+
+# Metrics computed from stored metrics; {dataset.metric} placeholders are
+# replaced with the joined values.
+DERIVED_METRICS = {
+    "debt_to_equity": "{balance_sheet.borrowings} / NULLIF({balance_sheet.equity_capital} + {balance_sheet.reserves}, 0)",
+    "net_margin": "{profit_loss.net_profit} / NULLIF({profit_loss.sales}, 0) * 100",
+    "earnings_yield": "{profit_loss.eps} / NULLIF({fundamental.current_price}, 0) * 100",
+}
+
+OPERATORS = (">=", "<=", "!=", "=", ">", "<")
+FILTER_PATTERN = re.compile(r"^\s*([\w.]+)\s*(>=|<=|!=|=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$")
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+\.\w+)\}")
+
+_conn = None
+_cache_version = None
+
+
+# Function to get the shared read connection
+def get_connection():
+    global _conn
+    if _conn is None or _conn.closed:
+        _conn = psycopg2.connect(**DB_CONFIG)
+        _conn.autocommit = True
+    return _conn
+
+
+# Function to create the metric store and load state tables
+def create_metric_store(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {METRIC_STORE_TABLE} (
+        dataset VARCHAR(20) NOT NULL,
+        metric VARCHAR(40) NOT NULL,
+        period VARCHAR(20) NOT NULL,
+        stock_symbol TEXT NOT NULL,
+        value NUMERIC,
+        loaded_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (dataset, metric, period, stock_symbol)
+    );
+    """)
+    cursor.execute(f"""
+    CREATE INDEX IF NOT EXISTS {METRIC_STORE_TABLE}_period_metric_idx
+        ON {METRIC_STORE_TABLE} (period, dataset, metric, value);
+    """)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {LOAD_STATE_TABLE} (
+        dataset VARCHAR(20) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        completed_at TIMESTAMPTZ
+    );
+    """)
+
+
+# Function to copy the latest row per period of one symbol table into the store
+def refresh_symbol(cursor, dataset, stock_symbol):
+    spec = DATASETS[dataset]
+    source = table_name(dataset, stock_symbol)
+    cursor.execute("SELECT to_regclass(%s);", (source,))
+    if cursor.fetchone()[0] is None:
+        return False
+
+    columns = ", ".join(spec["metrics"])
+    period_column = spec["period_column"]
+    if period_column:
+        latest_rows = (
+            f"SELECT DISTINCT ON ({period_column}) {period_column} AS period, {columns} "
+            f"FROM {source} WHERE {period_column} IS NOT NULL ORDER BY {period_column}, id DESC"
+        )
+        period_params = ()
+    else:
+        latest_rows = f"SELECT %s AS period, {columns} FROM {source}"
+        period_params = (LATEST_PERIOD,)
+
+    unpivot = ", ".join(f"('{metric}', t.{metric})" for metric in spec["metrics"])
+    cursor.execute(f"""
+    INSERT INTO {METRIC_STORE_TABLE} (dataset, metric, period, stock_symbol, value, loaded_at)
+    SELECT %s, m.metric, t.period, %s, m.value, NOW()
+    FROM ({latest_rows}) t
+    CROSS JOIN LATERAL (VALUES {unpivot}) AS m(metric, value)
+    ON CONFLICT (dataset, metric, period, stock_symbol) DO UPDATE SET
+        value = EXCLUDED.value,
+        loaded_at = EXCLUDED.loaded_at;
+    """, (dataset, stock_symbol) + period_params)
+    return True
+
+
+# Function to rebuild the store for a dataset and bump its load version
+def mark_load_complete(dataset, symbols=None, build_cube=True):
+    """Refresh the metric store after a load so cached screens are invalidated.
+
+    Pass build_cube=False when the caller builds the metric cube itself once
+    several datasets have loaded.
+    """
+    symbols = symbols or nse500stocklist
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        # Loads finishing together would otherwise deadlock on the store's DDL locks
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (METRIC_STORE_TABLE,))
+        create_metric_store(cursor)
+        refreshed = sum(1 for symbol in symbols if refresh_symbol(cursor, dataset, symbol))
+        cursor.execute(f"""
+        INSERT INTO {LOAD_STATE_TABLE} (dataset, version, completed_at)
+        VALUES (%s, 1, NOW())
+        ON CONFLICT (dataset) DO UPDATE SET
+            version = {LOAD_STATE_TABLE}.version + 1,
+            completed_at = EXCLUDED.completed_at;
+        """, (dataset,))
+        conn.commit()
+        cursor.close()
+        conn.close()
+        invalidate_cache()
+        print(f"✅ Metric store refreshed for {dataset} ({refreshed} symbols).")
+    except Exception as e:
+        print(f"⚠️ Metric store refresh failed for {dataset}: {e}")
+        return
+    if build_cube:
+        from atts_nse500_cube import refresh_cube_after_load
+        refresh_cube_after_load(dataset)
+
+
+# Function to clear cached screen results
+def invalidate_cache():
+    global _cache_version
+    _cache_version = None
+    _run_screen.cache_clear()
+
+
+# Function to read the combined load version, clearing the cache when it moves
+def current_version():
+    global _cache_version
+    cursor = get_connection().cursor()
+    cursor.execute(f"SELECT COALESCE(SUM(version), 0) FROM {LOAD_STATE_TABLE};")
+    version = cursor.fetchone()[0]
+    cursor.close()
+    if version != _cache_version:
+        _run_screen.cache_clear()
+        _cache_version = version
+    return version
+
+
+# Function to validate a metric name and list the stored metrics it needs
+def base_metrics(metric):
+    if metric in DERIVED_METRICS:
+        return PLACEHOLDER_PATTERN.findall(DERIVED_METRICS[metric])
+    dataset, _, column = metric.partition(".")
+    if dataset not in DATASETS or column not in DATASETS[dataset]["metrics"]:
+        raise ValueError(f"Unknown metric '{metric}'")
+    return [metric]
+
+
+# Function to parse a filter string such as "ratios.roce>20"
+def parse_filter(text):
+    match = FILTER_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Invalid filter '{text}' (expected e.g. ratios.roce>20)")
+    metric, op, value = match.groups()
+    base_metrics(metric)
+    return metric, op, float(value)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _run_screen(version, period, filters, sort_by, descending, limit, columns):
+    required = []
+    for metric in [f[0] for f in filters] + ([sort_by] if sort_by else []):
+        required.extend(m for m in base_metrics(metric) if m not in required)
+    optional = []
+    for metric in columns:
+        optional.extend(m for m in base_metrics(metric) if m not in required + optional)
+    if not required and not optional:
+        raise ValueError("Screen needs at least one filter, sort or column")
+
+    aliases = {}
+    joins = []
+    params = []
+    for i, metric in enumerate(required + optional):
+        alias = f"m{i}"
+        aliases[metric] = alias
+        dataset, _, column = metric.partition(".")
+        metric_period = period if DATASETS[dataset]["period_column"] else LATEST_PERIOD
+        condition = "s.dataset = %s AND s.metric = %s AND s.period = %s"
+        if i == 0:
+            joins.append(f"FROM (SELECT stock_symbol, value FROM {METRIC_STORE_TABLE} s WHERE {condition}) {alias}")
+        else:
+            kind = "JOIN" if metric in required else "LEFT JOIN"
+            joins.append(
+                f"{kind} (SELECT stock_symbol, value FROM {METRIC_STORE_TABLE} s WHERE {condition}) {alias} "
+                f"ON {alias}.stock_symbol = m0.stock_symbol"
+            )
+        params.extend([dataset, column, metric_period])
+
+    def expression(metric):
+        if metric in DERIVED_METRICS:
+            return "(" + PLACEHOLDER_PATTERN.sub(lambda m: f"{aliases[m.group(1)]}.value", DERIVED_METRICS[metric]) + ")"
+        return f"{aliases[metric]}.value"
+
+    output = list(dict.fromkeys([f[0] for f in filters] + ([sort_by] if sort_by else []) + list(columns)))
+    select = ["m0.stock_symbol"] + [f'{expression(metric)} AS "{metric}"' for metric in output]
+    where = []
+    for metric, op, value in filters:
+        where.append(f"{expression(metric)} {op} %s")
+        params.append(value)
+
+    query = f"SELECT {', '.join(select)}"
+    if sort_by:
+        direction = "DESC" if descending else "ASC"
+        query += f", RANK() OVER (ORDER BY {expression(sort_by)} {direction} NULLS LAST) AS rank"
+    query += " " + " ".join(joins)
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    if sort_by:
+        query += f" ORDER BY {expression(sort_by)} {direction} NULLS LAST, m0.stock_symbol"
+    else:
+        query += " ORDER BY m0.stock_symbol"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+
+    cursor = get_connection().cursor()
+    cursor.execute(query, params)
+    names = tuple(desc[0] for desc in cursor.description)
+    rows = tuple(tuple(float(v) if v is not None and not isinstance(v, (str, int)) else v for v in row)
+                 for row in cursor.fetchall())
+    cursor.close()
+    return names, rows
+
+
+# Function to screen the whole universe for one period
+def screen(period, filters=(), sort_by=None, descending=True, limit=50, columns=()):
+    """Filter, sort and rank all symbols for one period.
+
+    filters is a sequence of (metric, operator, value) tuples or strings such as
+    "ratios.roce>20"; metrics are "dataset.column" names or DERIVED_METRICS keys.
+    """
+    parsed = []
+    for item in filters:
+        if isinstance(item, str):
+            parsed.append(parse_filter(item))
+        else:
+            metric, op, value = item
+            if op not in OPERATORS:
+                raise ValueError(f"Invalid operator '{op}'")
+            base_metrics(metric)
+            parsed.append((metric, op, float(value)))
+    if sort_by:
+        base_metrics(sort_by)
+
+    names, rows = _run_screen(current_version(), period, tuple(parsed), sort_by,
+                              descending, limit, tuple(columns))
+    return [dict(zip(names, row)) for row in rows]
+
+
+# Function to list the periods available for a metric
+def available_periods(metric):
+    dataset, _, column = base_metrics(metric)[0].partition(".")
+    cursor = get_connection().cursor()
+    cursor.execute(
+        f"SELECT DISTINCT period FROM {METRIC_STORE_TABLE} WHERE dataset = %s AND metric = %s ORDER BY period;",
+        (dataset, column),
+    )
+    periods = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return periods
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen the NSE500 universe for one period.")
+    parser.add_argument("--period", help='Period label, e.g. "Mar 2024" or "Dec 2024"')
+    parser.add_argument("--filter", action="append", default=[], help='Filter such as "ratios.roce>20" (repeatable)')
+    parser.add_argument("--sort", help="Metric to sort and rank by")
+    parser.add_argument("--asc", action="store_true", help="Sort ascending instead of descending")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--show", action="append", default=[], help="Extra metric column to display (repeatable)")
+    parser.add_argument("--refresh", nargs="*", metavar="DATASET", help="Rebuild the metric store (all datasets if none given)")
+    args = parser.parse_args(argv)
+
+    if args.refresh is not None:
+        for dataset in args.refresh or DATASETS:
+            mark_load_complete(dataset)
+        return 0
+
+    if not args.period:
+        parser.error("--period is required unless --refresh is given")
+
+    start = time.perf_counter()
+    try:
+        results = screen(args.period, args.filter, args.sort, not args.asc, args.limit, args.show)
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if not results:
+        print(f"No symbols matched for {args.period}.")
+    else:
+        headers = list(results[0].keys())
+        print(" | ".join(headers))
+        for row in results:
+            print(" | ".join("-" if row[h] is None else (f"{row[h]:.2f}" if isinstance(row[h], float) else str(row[h]))
+                             for h in headers))
+    print(f"\n{len(results)} symbols in {elapsed_ms:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# atts_nse500_snapshot_service.py - Read-only HTTP service for the latest NSE500 values
+#
+# Dashboards used to query the per-symbol tables directly, fanning every page
+# load out into hundreds of queries. This service reads the metric store once
+# per load version, keeps the latest period of every dataset for every symbol
+# in memory, and serves it as JSON or CSV with ETags. It checks the load
+# version every ATTS_SNAPSHOT_POLL seconds and, when a load has completed,
+# builds a new snapshot and swaps it in atomically; requests always see one
+# complete snapshot.
+#
+# Endpoints:
+#   GET /datasets                              -> datasets, metrics and snapshot version
+#   GET /latest/<dataset>[?symbols=TCS,INFY]   -> latest row per symbol
+#   GET /symbol/<SYMBOL>                       -> latest rows of every dataset for one symbol
+#   GET /health
+# Add ?format=csv (or Accept: text/csv) for CSV.
+#
+# Usage:
+#   python atts_nse500_snapshot_service.py --port 8500
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import psycopg2
+from db_config import DB_CONFIG
+from atts_nse500_cube import MONTHS
+from atts_nse500_datasets import DATASETS
+from atts_nse500_screener_query import LOAD_STATE_TABLE, METRIC_STORE_TABLE
+
+SERVICE_HOST = os.getenv("ATTS_SNAPSHOT_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("ATTS_SNAPSHOT_PORT", "8500"))
+POLL_SECONDS = float(os.getenv("ATTS_SNAPSHOT_POLL", "30"))
+SNAPSHOT_ITERSIZE = 20000  # Rows fetched per round trip while building a snapshot
+
+# Newest period first, ranked like atts_nse500_cube.period_sort_key: labels
+# that are not "Mon YYYY" (TTM, latest) above months, months by date, then by label
+MONTH_PATTERN = "^(" + "|".join(MONTHS) + ") [0-9]+$"
+LATEST_PERIOD_ORDER = f"""(period !~ '{MONTH_PATTERN}') DESC,
+            CASE WHEN period ~ '{MONTH_PATTERN}' THEN split_part(period, ' ', 2)::int * 12
+                 + array_position(%(months)s::text[], split_part(period, ' ', 1)) END DESC NULLS LAST,
+            period DESC"""
+
+
+class Snapshot:
+    """Latest values of every dataset at one load version."""
+
+    def __init__(self, version, datasets, loaded_at):
+        self.version = version
+        self.datasets = datasets  # dataset -> {symbol: (period, values tuple)}
+        self.loaded_at = loaded_at
+        self._rendered = {}  # (path, csv?) -> (body, content type)
+        self._lock = threading.Lock()
+
+    # Function to render a response body once per snapshot and reuse it
+    def render(self, key, build):
+        with self._lock:
+            cached = self._rendered.get(key)
+        if cached is None:
+            cached = build()
+            with self._lock:
+                self._rendered[key] = cached
+        return cached
+
+
+# Function to read the combined load version
+def read_version(cursor):
+    cursor.execute("SELECT to_regclass(%s);", (LOAD_STATE_TABLE,))
+    if cursor.fetchone()[0] is None:
+        return 0
+    cursor.execute(f"SELECT COALESCE(SUM(version), 0) FROM {LOAD_STATE_TABLE};")
+    return int(cursor.fetchone()[0])
+
+
+# Function to build a snapshot from the metric store in one query
+def load_snapshot():
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    version = read_version(cursor)
+    cursor.close()
+    rows = {}  # (dataset, symbol) -> (period, {metric: value})
+    if version:
+        # Only the latest period of each (dataset, symbol) leaves the server,
+        # streamed through a server-side cursor so memory stays flat
+        cursor = conn.cursor(name="snapshot_values")
+        cursor.itersize = SNAPSHOT_ITERSIZE
+        cursor.execute(f"""
+        WITH latest AS (
+            SELECT DISTINCT ON (dataset, stock_symbol) dataset, stock_symbol, period
+            FROM {METRIC_STORE_TABLE} WHERE dataset = ANY(%(datasets)s)
+            ORDER BY dataset, stock_symbol, {LATEST_PERIOD_ORDER}
+        )
+        SELECT s.dataset, s.stock_symbol, s.period, s.metric, s.value::float8
+        FROM {METRIC_STORE_TABLE} s JOIN latest USING (dataset, stock_symbol, period);
+        """, {"datasets": list(DATASETS), "months": list(MONTHS)})
+        for dataset, symbol, period, metric, value in cursor:
+            rows.setdefault((dataset, symbol), (period, {}))[1][metric] = value
+        cursor.close()
+    conn.close()
+
+    datasets = {dataset: {} for dataset in DATASETS}
+    for (dataset, symbol), (period, values) in rows.items():
+        datasets[dataset][symbol] = (period, tuple(values.get(m) for m in DATASETS[dataset]["metrics"]))
+    return Snapshot(version, datasets, datetime.now(timezone.utc).isoformat())
+
+
+class SnapshotStore:
+    """Holds the current snapshot and swaps in a new one after each load."""
+
+    def __init__(self, poll_seconds=POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.current = load_snapshot()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="snapshot-reloader", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # Function to reload when the load version moves
+    def reload_if_changed(self):
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        version = read_version(cursor)
+        cursor.close()
+        conn.close()
+        if version != self.current.version:
+            started = time.monotonic()
+            snapshot = load_snapshot()
+            self.current = snapshot  # Single reference swap; readers keep the old one until done
+            print(f"🔄 Snapshot reloaded at version {snapshot.version} in {time.monotonic() - started:.2f}s.")
+            return True
+        return False
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                print(f"⚠️ Snapshot reload failed: {e}")
+
+
+# Function to turn dataset rows into (header, rows) for output
+def table_rows(snapshot, dataset, symbols=None):
+    metrics = DATASETS[dataset]["metrics"]
+    data = snapshot.datasets[dataset]
+    chosen = sorted(data) if symbols is None else [s for s in symbols if s in data]
+    return ["stock_symbol", "period"] + metrics, [[s, data[s][0], *data[s][1]] for s in chosen]
+
+
+def to_json(payload):
+    return json.dumps(payload, separators=(",", ":")).encode(), "application/json"
+
+
+def to_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode(), "text/csv; charset=utf-8"
+
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+    store = None  # Set by serve()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        want_csv = query.get("format", [""])[0] == "csv" or "text/csv" in self.headers.get("Accept", "")
+        snapshot = self.store.current
+        parts = [p for p in url.path.split("/") if p]
+
+        if parts == ["health"]:
+            return self._send(200, *to_json({"status": "ok", "version": snapshot.version}))
+
+        etag = f'"{snapshot.version}-{zlib.crc32(repr((url.path, url.query, want_csv)).encode()):08x}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, b"", None, etag)
+
+        if parts == ["datasets"]:
+            body = snapshot.render(("datasets",), lambda: to_json({
+                "version": snapshot.version,
+                "loaded_at": snapshot.loaded_at,
+                "datasets": {name: {"metrics": spec["metrics"], "symbols": len(snapshot.datasets[name])}
+                             for name, spec in DATASETS.items()},
+            }))
+            return self._send(200, *body, etag)
+
+        if len(parts) == 2 and parts[0] == "latest" and parts[1] in DATASETS:
+            dataset = parts[1]
+            symbols = None
+            if "symbols" in query:
+                symbols = [s.strip().upper() for s in ",".join(query["symbols"]).split(",") if s.strip()]
+
+            def build():
+                header, rows = table_rows(snapshot, dataset, symbols)
+                if want_csv:
+                    return to_csv(header, rows)
+                return to_json({"version": snapshot.version, "dataset": dataset,
+                                "columns": header, "rows": rows})
+            if symbols is not None:
+                return self._send(200, *build(), etag)  # Arbitrary symbol lists are not cached
+            return self._send(200, *snapshot.render((url.path, want_csv), build), etag)
+
+        if len(parts) == 2 and parts[0] == "symbol":
+            symbol = parts[1].upper()
+            if not any(symbol in rows for rows in snapshot.datasets.values()):
+                return self._send(404, *to_json({"error": f"Unknown symbol {symbol}"}))
+
+            def build():
+                if want_csv:
+                    header, rows = ["dataset", "period", "metric", "value"], []
+                    for dataset, data in snapshot.datasets.items():
+                        if symbol in data:
+                            period, values = data[symbol]
+                            rows.extend([dataset, period, m, v]
+                                        for m, v in zip(DATASETS[dataset]["metrics"], values))
+                    return to_csv(header, rows)
+                return to_json({"version": snapshot.version, "stock_symbol": symbol, "datasets": {
+                    dataset: {"period": data[symbol][0],
+                              "values": dict(zip(DATASETS[dataset]["metrics"], data[symbol][1]))}
+                    for dataset, data in snapshot.datasets.items() if symbol in data
+                }})
+            return self._send(200, *snapshot.render((url.path, want_csv), build), etag)
+
+        return self._send(404, *to_json({"error": "Not found"}))
+
+    def _send(self, status, body, content_type, etag=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep the console for reload messages
+
+
+# Function to start the service and block until interrupted
+def serve(host=SERVICE_HOST, port=SERVICE_PORT, poll_seconds=POLL_SECONDS):
+    store = SnapshotStore(poll_seconds)
+    store.start()
+    SnapshotHandler.store = store
+    server = ThreadingHTTPServer((host, port), SnapshotHandler)
+    print(f"✅ Serving snapshot version {store.current.version} on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Snapshot service stopped.")
+    finally:
+        store.stop()
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the latest NSE500 values over HTTP.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="Seconds between load version checks")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.poll)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# atts_nse500_synthetic.py - Synthetic Screener pages and a local stand-in server
+#
+# Scale and load tests must not hit screener.in. This module generates
+# deterministic company pages with every section the loaders parse
+# (top-ratios, quarters, profit-loss, balance-sheet, cash-flow, ratios,
+# shareholding) for any symbol. It also serves them from a local HTTP server
+# that can add latency and simulated throttling. Point the loaders at the
+# server with ATTS_SCREENER_URL (see atts_nse500_fetch).
+#
+# The server also accepts absolute-form proxy requests, so extra instances
+# can stand in for egress proxies in ATTS_EGRESS_ROUTES.
+#
+# Usage:
+#   python atts_nse500_synthetic.py --port 8765 --latency 0.2 --throttle 0.01
+#   python atts_nse500_synthetic.py --port 8801 8802 8803   # three stand-in proxies
+#   python atts_nse500_synthetic.py --drift   # changed markup, see atts_nse500_fingerprint
+#   ATTS_SCREENER_URL=http://127.0.0.1:8765 \
+#   ATTS_EGRESS_ROUTES=http://127.0.0.1:8801,http://127.0.0.1:8802,http://127.0.0.1:8803 \
+#       python atts_nse500_orchestrator.py --symbols $(python atts_nse500_synthetic.py --symbols 500)
+#   ATTS_SCREENER_URL=http://127.0.0.1:8765 python atts_nse500_orchestrator.py \
+#       --symbols $(python atts_nse500_synthetic.py --symbols 5000)
+
+import argparse
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+QUARTER_MONTHS = ("Mar", "Jun", "Sep", "Dec")
+FIRST_YEAR, LAST_YEAR = 2014, 2024
+PAGE_PATTERN = re.compile(r"^/company/([A-Za-z0-9&._-]+)/?(?:consolidated/)?$")
+
+TOP_RATIOS = ["Market Cap", "Current Price", "High / Low", "Stock P/E", "Book Value",
+              "Dividend Yield", "ROCE", "ROE", "Face Value"]
+QUARTER_ROWS = ["Sales", "Expenses", "Operating Profit", "OPM %", "Other Income", "Interest",
+                "Depreciation", "Profit before tax", "Tax %", "Net Profit", "EPS in Rs"]
+PROFIT_LOSS_ROWS = QUARTER_ROWS + ["Dividend Payout %"]
+BALANCE_SHEET_ROWS = ["Equity Capital", "Reserves", "Borrowings", "Other Liabilities", "Total Liabilities",
+                      "Fixed Assets", "CWIP", "Investments", "Other Assets", "Total Assets"]
+CASH_FLOW_ROWS = ["Cash from Operating Activity", "Cash from Investing Activity",
+                  "Cash from Financing Activity", "Net Cash Flow"]
+RATIO_ROWS = ["Debtor Days", "Inventory Days", "Days Payable", "Cash Conversion Cycle",
+              "Working Capital Days", "ROCE %"]
+SHAREHOLDING_ROWS = ["Promoters", "FIIs", "DIIs", "Government", "Public", "No. of Shareholders"]
+EXPANDABLE_ROWS = {"Sales", "Expenses", "Other Income", "Net Profit", "Borrowings", "Other Liabilities",
+                   "Fixed Assets", "Other Assets", "Cash from Operating Activity",
+                   "Cash from Investing Activity", "Cash from Financing Activity"}
+
+
+# Function to produce a universe of `count` synthetic symbols
+def synthetic_symbols(count):
+    return [f"SYN{i:05d}" for i in range(count)]
+
+
+def _table(rows, periods, rnd, buttons=False):
+    header = "".join(f"<th>{period}</th>" for period in periods)
+    body = []
+    for name in rows:
+        if buttons or name in EXPANDABLE_ROWS:
+            label = f'<button class="button-plain" onclick="Company.showSchedule(\'{name}\')">{name}&nbsp;<span class="blue-icon">+</span></button>'
+        else:
+            label = name
+        cells = "".join(f"<td>{rnd.uniform(-500, 25000):,.2f}</td>" for _ in periods)
+        body.append(f'<tr><td class="text">{label}</td>{cells}</tr>')
+    return (f'<table class="data-table responsive-text-nowrap"><thead><tr><th class="text"></th>{header}</tr></thead>'
+            f'<tbody>{"".join(body)}</tbody></table>')
+
+
+# Function to generate a deterministic company page for a symbol
+def company_page(stock_symbol, revision=0):
+    """Return page HTML; change `revision` to get different values for the same symbol."""
+    rnd = random.Random(f"{stock_symbol}:{revision}")
+    quarters = [f"{month} {year}" for year in (LAST_YEAR - 1, LAST_YEAR) for month in QUARTER_MONTHS]
+    years = [f"Mar {year}" for year in range(FIRST_YEAR, LAST_YEAR + 1)]
+
+    top = []
+    for name in TOP_RATIOS:
+        if name == "High / Low":
+            value = f'<span class="number">{rnd.uniform(500, 5000):,.0f}</span> / <span class="number">{rnd.uniform(100, 500):,.0f}</span>'
+        else:
+            value = f'<span class="number">{rnd.uniform(1, 90000):,.2f}</span>'
+        top.append(f'<li class="flex flex-space-between"><span class="name">{name}</span>'
+                   f'<span class="nowrap value">₹ {value}</span></li>')
+
+    company_id = rnd.randint(1000, 99999)
+    pdf_links = "".join(
+        f'<td><a href="/company/source/quarter/{company_id}/{i}/" target="_blank">Raw PDF</a></td>'
+        for i in range(len(quarters))
+    )
+    quarter_table = _table(QUARTER_ROWS, quarters, rnd).replace(
+        "</tbody>", f'<tr class="font-size-14 ink-600"><td class="text">Raw PDF</td>{pdf_links}</tr></tbody>'
+    )
+    # Pad the page roughly to the size of a real one (~250 KB) with peer and news markup
+    filler = "".join(f'<div class="sub"><a href="/company/PEER{i}/">Peer {i}</a> {"x" * 180}</div>' for i in range(900))
+
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{stock_symbol} share price</title></head><body>
+<main class="flex-column">
+<div class="company-ratios"><ul id="top-ratios">{"".join(top)}</ul></div>
+<section id="peers" class="card"><div id="peers-table-placeholder">{filler}</div></section>
+<section id="quarters" class="card">{quarter_table}</section>
+<section id="profit-loss" class="card"><div class="responsive-holder">{_table(PROFIT_LOSS_ROWS, years + ["TTM"], rnd)}</div></section>
+<section id="balance-sheet" class="card"><div class="responsive-holder">{_table(BALANCE_SHEET_ROWS, years, rnd)}</div></section>
+<section id="cash-flow" class="card"><div class="responsive-holder">{_table(CASH_FLOW_ROWS, years, rnd)}</div></section>
+<section id="ratios" class="card"><div class="responsive-holder">{_table(RATIO_ROWS, years, rnd)}</div></section>
+<section id="shareholding" class="card"><div id="quarterly-shp">{_table(SHAREHOLDING_ROWS, quarters, rnd, buttons=True)}</div></section>
+</main></body></html>"""
+
+
+# Function to turn a page into a redesigned layout that no loader understands
+def drift_page(page):
+    return page.replace(' id="', ' id="v2-').replace('data-table', 'grid-table')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    latency = 0.0  # Seconds added to every response
+    throttle = 0.0  # Fraction of requests answered with 429
+    revision = 0
+    drift = False  # Serve a redesigned layout that no loader understands
+    requests_served = 0
+    _count_lock = threading.Lock()
+
+    def do_GET(self):
+        with self._count_lock:
+            type(self).requests_served += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.throttle and random.random() < self.throttle:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        match = PAGE_PATTERN.match(urlsplit(self.path).path)  # Plain or proxy (absolute-form) request
+        if not match:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = company_page(match.group(1).upper(), self.revision)
+        if self.drift:
+            body = drift_page(body)
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to start the stand-in server on a background thread
+def start_server(host="127.0.0.1", port=8765, latency=0.0, throttle=0.0, drift=False):
+    """Return the running server; call server.shutdown() to stop it."""
+    # A subclass per server lets several instances run with their own settings
+    handler = type("StandInHandler", (StandInHandler,), {"latency": latency, "throttle": throttle, "drift": drift})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="screener-stand-in", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve synthetic Screener pages or list synthetic symbols.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, nargs="+", default=[8765], help="One server per port")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--drift", action="store_true", help="Serve a changed layout to test the drift breaker")
+    parser.add_argument("--symbols", type=int, metavar="N", help="Print N synthetic symbols and exit")
+    args = parser.parse_args(argv)
+
+    if args.symbols is not None:
+        print(" ".join(synthetic_symbols(args.symbols)))
+        return 0
+    servers = [start_server(args.host, port, args.latency, args.throttle, args.drift) for port in args.port]
+    for port in args.port:
+        print(f"✅ Serving synthetic pages on http://{args.host}:{port}/company/<SYMBOL>/")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\n🛑 Stand-in server stopped.")
+        for server in servers:
+            server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
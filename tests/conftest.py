@@ -0,0 +1,10 @@
+# tests/conftest.py - Make the top-level atts_nse500_* modules importable
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The shared rate controllers save their state at exit; keep it out of the checkout
+os.environ.setdefault("ATTS_RATE_STATE", os.path.join(tempfile.mkdtemp(prefix="atts-tests-"), "rate_state.json"))
@@ -0,0 +1,77 @@
+# tests/test_changefeed.py - Change feed cursor against a live PostgreSQL
+#
+# Needs psycopg2 and the database in db_config.py; skipped otherwise.
+
+import os
+import sys
+import threading
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from db_config import DB_CONFIG  # noqa: E402
+import atts_nse500_changefeed as changefeed  # noqa: E402
+
+
+def _connect():
+    try:
+        return psycopg2.connect(**DB_CONFIG)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL not reachable: {e}")
+
+
+@pytest.fixture
+def conns(monkeypatch):
+    monkeypatch.setattr(changefeed, "CHANGE_FEED_ENABLED", True)
+    opened = [_connect() for _ in range(3)]
+    cursor = opened[0].cursor()
+    changefeed.create_changelog_table(cursor)
+    opened[0].commit()
+    yield opened
+    for conn in opened:
+        conn.rollback()
+        conn.close()
+
+
+def test_batches_become_visible_in_batch_id_order(conns):
+    first, second, reader = conns
+    symbol = f"TEST{uuid.uuid4().hex[:8].upper()}"
+    read = reader.cursor()
+    read.execute(f"SELECT COALESCE(MAX(batch_id), 0) FROM {changefeed.CHANGELOG_TABLE};")
+    last = read.fetchone()[0]
+    reader.commit()
+
+    # The first writer allocates its batch and keeps its transaction open
+    first_batch = changefeed.record_changes(first.cursor(), [("ratios", symbol, ["Mar 2024"], 1)])
+
+    # The second writer starts later but tries to commit first
+    result = {}
+
+    def write_second():
+        cursor = second.cursor()
+        result["batch"] = changefeed.record_changes(cursor, [("ratios", symbol, ["Mar 2025"], 1)])
+        second.commit()
+
+    thread = threading.Thread(target=write_second)
+    thread.start()
+    thread.join(timeout=1)
+    assert thread.is_alive(), "second batch committed while an earlier batch was still open"
+
+    # A consumer polling now must not advance past the open batch
+    assert [e for e in changefeed.changes_since(read, last) if e[2] == symbol] == []
+    reader.commit()
+
+    first.commit()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert first_batch < result["batch"]
+
+    seen = [e[0] for e in changefeed.changes_since(read, last) if e[2] == symbol]
+    assert seen == [first_batch, result["batch"]]
+
+    read.execute(f"DELETE FROM {changefeed.CHANGELOG_TABLE} WHERE stock_symbol = %s;", (symbol,))
+    reader.commit()
@@ -0,0 +1,69 @@
+# tests/test_db_writer.py - Unit savepoints and row-by-row retry in write_units
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE  # noqa: E402
+import atts_nse500_db_writer as db_writer  # noqa: E402
+
+INSERT = "INSERT INTO t (period, value) VALUES (%s, %s);"
+
+
+class FakeCursor:
+    def __init__(self, log):
+        self.log = log
+
+    def execute(self, sql, params=None):
+        self.log.append(sql)
+        if "INSERT INTO t " in sql and params and params[1] == "bad":
+            raise psycopg2.DataError("invalid input syntax for type numeric")
+
+    def executemany(self, sql, rows):
+        self.log.append(sql)
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.log = []
+
+    def cursor(self):
+        return FakeCursor(self.log)
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+
+def store(cursor, stock_symbol, rows):
+    for row in rows:
+        db_writer.insert_row(cursor, stock_symbol, INSERT, row)
+
+
+def count(log, text):
+    return sum(text in sql for sql in log)
+
+
+def test_clean_units_use_one_savepoint_each():
+    conn = FakeConn()
+    committed = db_writer.write_units(conn, [[(store, "AAA", [("Mar 2024", 1), ("Mar 2025", 2)])],
+                                             [(store, "BBB", [("Mar 2025", 3)])]])
+    assert count(conn.log, f"SAVEPOINT {db_writer.SYMBOL_SAVEPOINT}") == 4  # SAVEPOINT + RELEASE per unit
+    assert count(conn.log, db_writer.ROW_SAVEPOINT) == 0
+    assert committed[(None, "AAA")] == 2 and committed[(None, "BBB")] == 1
+
+
+def test_refused_row_retries_unit_row_by_row():
+    conn = FakeConn()
+    committed = db_writer.write_units(conn, [[(store, "AAA", [("Mar 2024", 1), ("Mar 2025", "bad")])]])
+    assert count(conn.log, f"ROLLBACK TO SAVEPOINT {db_writer.SYMBOL_SAVEPOINT}") == 1
+    row_savepoints = [sql for sql in conn.log if sql.startswith(f"SAVEPOINT {db_writer.ROW_SAVEPOINT};")]
+    assert len(row_savepoints) == 2  # One per row, on the retry only
+    assert committed[(None, "AAA")] == 1
+    assert count(conn.log, f"INSERT INTO {db_writer.REJECT_TABLE}") == 1
+    assert conn.log[-1] == "COMMIT"
@@ -0,0 +1,205 @@
+# tests/test_fetch.py - AIMD rate control, the shared page cache and egress route cool-down
+
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+import atts_nse500_fetch as fetch  # noqa: E402
+
+
+def _controller(tmp_path, rate=1.0, concurrency=4):
+    state_file = tmp_path / "state.json"
+    state_file.write_text(json.dumps({"rate": rate, "concurrency": concurrency}))
+    return fetch.RateController(str(state_file))
+
+
+def test_rate_controller_loads_saved_state(tmp_path):
+    controller = _controller(tmp_path, rate=2.0, concurrency=3)
+    assert (controller.rate, controller.concurrency) == (2.0, 3)
+
+
+def test_rate_controller_starts_at_initial_rate_without_state(tmp_path):
+    controller = fetch.RateController(str(tmp_path / "missing.json"))
+    assert (controller.rate, controller.concurrency) == (fetch.INITIAL_RATE, 1)
+
+
+def test_adjust_increases_additively_after_healthy_window(tmp_path):
+    controller = _controller(tmp_path, rate=1.0, concurrency=1)
+    controller._window = [(2.0, False)] * fetch.WINDOW_SIZE
+    controller._adjust()
+    assert controller.rate == pytest.approx(1.0 + fetch.RATE_STEP)
+    # rate * median latency is above the concurrency, so one more request may be in flight
+    assert controller.concurrency == 2
+    assert controller.cooldown == 0.0
+    assert controller._window == []
+    saved = json.loads((tmp_path / "state.json").read_text())
+    assert saved["rate"] == round(controller.rate, 3)
+
+
+def test_adjust_keeps_concurrency_when_rate_does_not_need_it(tmp_path):
+    controller = _controller(tmp_path, rate=1.0, concurrency=4)
+    controller._window = [(0.5, False)] * fetch.WINDOW_SIZE
+    controller._adjust()
+    assert controller.concurrency == 4
+
+
+def test_adjust_backs_off_on_throttling(tmp_path):
+    controller = _controller(tmp_path, rate=2.0, concurrency=4)
+    controller._window = [(0.5, False)] * (fetch.WINDOW_SIZE - 1) + [(0.5, True)]
+    controller._adjust()
+    assert controller.rate == pytest.approx(2.0 * fetch.DECREASE_FACTOR)
+    assert controller.concurrency == 2
+    assert controller.cooldown == 1.0
+    controller._window = [(0.5, True)]
+    controller._adjust()
+    assert controller.cooldown == 2.0  # Doubles while the throttling lasts
+
+
+def test_adjust_backs_off_on_slow_responses(tmp_path):
+    controller = _controller(tmp_path, rate=2.0, concurrency=1)
+    controller._window = [(fetch.LATENCY_TARGET + 1, False)] * fetch.WINDOW_SIZE
+    controller._adjust()
+    assert controller.rate == pytest.approx(2.0 * fetch.DECREASE_FACTOR)
+    assert controller.concurrency == 1
+
+
+def test_adjust_never_drops_below_min_rate(tmp_path):
+    controller = _controller(tmp_path, rate=fetch.MIN_RATE)
+    controller._window = [(0.5, True)]
+    controller._adjust()
+    assert controller.rate == fetch.MIN_RATE
+
+
+def test_release_reacts_to_429_before_the_window_fills(tmp_path):
+    controller = _controller(tmp_path, rate=2.0)
+    controller.acquire()
+    controller.release(0.1, 429)
+    assert controller.rate == pytest.approx(2.0 * fetch.DECREASE_FACTOR)
+
+
+class FakeResponse:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+
+
+def test_page_cache_serves_each_consumer_once():
+    cache = fetch.PageCache(consumers=3)
+    fetched = []
+
+    def get():
+        fetched.append(1)
+        return FakeResponse()
+
+    responses = [cache.get("u", get) for _ in range(3)]
+    assert len(fetched) == 1
+    assert all(response is responses[0] for response in responses)
+    assert (cache.hits, cache.misses) == (2, 1)
+    # Every consumer has read the page, so a fourth reader fetches again
+    cache.get("u", get)
+    assert len(fetched) == 2
+
+
+def test_page_cache_does_not_keep_failed_pages():
+    cache = fetch.PageCache(consumers=2)
+    fetched = []
+
+    def get():
+        fetched.append(1)
+        return FakeResponse(503)
+
+    cache.get("u", get)
+    cache.get("u", get)
+    assert len(fetched) == 2
+
+
+def test_page_cache_evicts_oldest_page_over_max_pages():
+    cache = fetch.PageCache(consumers=2, max_pages=1)
+    fetched = []
+
+    def get():
+        fetched.append(1)
+        return FakeResponse()
+
+    cache.get("a", get)
+    cache.get("b", get)
+    cache.get("a", get)
+    assert len(fetched) == 3
+
+
+def test_page_cache_waits_for_fetch_in_flight():
+    cache = fetch.PageCache(consumers=2)
+    started, go = threading.Event(), threading.Event()
+    fetched = []
+
+    def get():
+        fetched.append(1)
+        started.set()
+        go.wait(5)
+        return FakeResponse()
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get("u", get)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(cache.get("u", get)))
+    second.start()
+    go.set()
+    first.join(5)
+    second.join(5)
+    assert len(fetched) == 1
+    assert len(results) == 2 and results[0] is results[1]
+
+
+def _pool(tmp_path, specs):
+    state_file = tmp_path / "state.json"
+    for index in range(len(specs)):
+        path = state_file if index == 0 else tmp_path / f"state.route{index}.json"
+        path.write_text(json.dumps({"rate": fetch.MAX_RATE, "concurrency": 1}))
+    return fetch.EgressPool(specs, state_file=str(state_file))
+
+
+def test_egress_route_cools_down_after_repeated_failures(tmp_path):
+    pool = _pool(tmp_path, ["direct", "http://127.0.0.1:9"])
+    proxy = pool.routes[1]
+    for _ in range(fetch.ROUTE_FAILURE_LIMIT):
+        proxy.controller.acquire()
+        pool.release(proxy, 0.01, 503)
+    assert proxy.cooled_until > time.monotonic()
+    assert proxy.cooled_until <= time.monotonic() + fetch.ROUTE_COOLDOWN
+    assert proxy.trips == 1 and proxy.failures == 0
+
+    # Requests go to the healthy route while the proxy cools down
+    for _ in range(3):
+        route = pool.acquire()
+        assert route is pool.routes[0]
+        pool.release(route, 0.01, 200)
+
+
+def test_egress_route_cooldown_doubles_on_repeat(tmp_path):
+    pool = _pool(tmp_path, ["direct", "http://127.0.0.1:9"])
+    proxy = pool.routes[1]
+    for status in [None] * fetch.ROUTE_FAILURE_LIMIT * 2:
+        proxy.record(status)
+    expected = min(fetch.MAX_COOLDOWN, fetch.ROUTE_COOLDOWN * 2)
+    assert proxy.cooled_until - time.monotonic() == pytest.approx(expected, abs=1)
+
+
+def test_egress_route_success_resets_failures(tmp_path):
+    pool = _pool(tmp_path, ["direct", "http://127.0.0.1:9"])
+    proxy = pool.routes[1]
+    for status in [503] * (fetch.ROUTE_FAILURE_LIMIT - 1) + [200, 503]:
+        proxy.record(status)
+    assert proxy.cooled_until == 0.0
+    assert proxy.failures == 1
+
+
+def test_lone_egress_route_never_cools_down(tmp_path):
+    pool = _pool(tmp_path, ["direct"])
+    for _ in range(fetch.ROUTE_FAILURE_LIMIT * 2):
+        route = pool.acquire()
+        pool.release(route, 0.01, 503)
+    assert pool.routes[0].cooled_until == 0.0
@@ -0,0 +1,73 @@
+# tests/test_fingerprint.py - Section slicing and the layout drift breaker
+
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("psycopg2")
+
+from bs4 import BeautifulSoup, SoupStrainer  # noqa: E402
+from atts_nse500_fingerprint import FINGERPRINTS, LayoutBreaker, LayoutDriftError, fingerprint_problems  # noqa: E402
+from atts_nse500_pipeline import slice_element  # noqa: E402
+from atts_nse500_synthetic import company_page, drift_page  # noqa: E402
+
+PAGE = company_page("TESTCO")
+DRIFT_PAGE = drift_page(PAGE)
+
+
+@pytest.mark.parametrize("element_id", sorted(FINGERPRINTS))
+def test_slice_element_parses_like_the_full_page(element_id):
+    strainer = SoupStrainer(id=element_id)
+    full = BeautifulSoup(PAGE, "html.parser", parse_only=strainer)
+    section = slice_element(PAGE.encode(), element_id)
+    assert section is not PAGE.encode()
+    sliced = BeautifulSoup(section, "html.parser", parse_only=strainer)
+    assert str(sliced) == str(full)
+
+
+def test_slice_element_returns_whole_markup_when_id_is_missing():
+    markup = DRIFT_PAGE.encode()
+    assert slice_element(markup, "quarters") is markup
+
+
+@pytest.mark.parametrize("element_id", sorted(FINGERPRINTS))
+def test_fingerprint_matches_synthetic_page(element_id):
+    assert fingerprint_problems(slice_element(PAGE.encode(), element_id), element_id) == []
+
+
+@pytest.mark.parametrize("element_id", sorted(FINGERPRINTS))
+def test_fingerprint_flags_drift_page(element_id):
+    markup = DRIFT_PAGE.encode()
+    section = slice_element(markup, element_id)
+    assert fingerprint_problems(None if section is markup else section, element_id)
+
+
+def test_fingerprint_flags_table_without_data_table_class():
+    section = slice_element(PAGE.encode(), "quarters").replace(b"data-table", b"grid-table")
+    assert fingerprint_problems(section, "quarters") == ["#quarters has no data-table"]
+
+
+def test_breaker_trips_after_limit_drifting_pages(tmp_path):
+    breaker = LayoutBreaker(limit=3, sample_limit=1, sample_dir=str(tmp_path))
+    markup = DRIFT_PAGE.encode()
+    for _ in range(2):
+        breaker.check(markup, None, "quarters")
+    with pytest.raises(LayoutDriftError):
+        breaker.check(markup, None, "quarters")
+    assert "quarters" in breaker.tripped()
+
+    # Once tripped, even a good page is refused, and other sections are unaffected
+    good = PAGE.encode()
+    with pytest.raises(LayoutDriftError):
+        breaker.check(good, slice_element(good, "quarters"), "quarters")
+    breaker.check(good, slice_element(good, "ratios"), "ratios")
+    assert len(list(tmp_path.rglob("quarters.*.html"))) == 1
+
+
+def test_breaker_resets_on_matching_page(tmp_path):
+    breaker = LayoutBreaker(limit=3, sample_limit=0, sample_dir=str(tmp_path))
+    drifted, good = DRIFT_PAGE.encode(), PAGE.encode()
+    for _ in range(2):
+        for _ in range(2):
+            breaker.check(drifted, None, "quarters")
+        breaker.check(good, slice_element(good, "quarters"), "quarters")
+    assert breaker.tripped() == {}
@@ -0,0 +1,33 @@
+# tests/test_maintenance.py - Index naming within Postgres' identifier limit
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from atts_nse500_maintenance import MAX_IDENTIFIER, _index_name  # noqa: E402
+
+
+def test_short_names_are_kept_readable():
+    assert _index_name("tcs_quarterly", "quarter", "btree") == "tcs_quarterly_quarter_idx"
+    assert _index_name("tcs_quarterly", "loaded_at", "brin") == "tcs_quarterly_loaded_at_brin"
+
+
+def test_long_names_fit_the_identifier_limit():
+    table = "stock_" + "x" * 80 + "_balance_sheet"
+    name = _index_name(table, "loaded_at", "brin")
+    assert len(name) <= MAX_IDENTIFIER
+    assert name.endswith("_loaded_at_brin")
+
+
+def test_truncated_names_stay_distinct():
+    prefix = "a" * MAX_IDENTIFIER
+    first = _index_name(prefix + "_quarterly", "quarter", "btree")
+    second = _index_name(prefix + "_shareholding", "quarter", "btree")
+    assert first != second
+    assert first == _index_name(prefix + "_quarterly", "quarter", "btree")
+
+
+def test_name_at_the_limit_is_not_hashed():
+    suffix = "_loaded_at_brin"
+    table = "t" * (MAX_IDENTIFIER - len(suffix))
+    assert _index_name(table, "loaded_at", "brin") == table + suffix
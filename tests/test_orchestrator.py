@@ -0,0 +1,35 @@
+# tests/test_orchestrator.py - Stage ordering for the load DAG
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("bs4")
+
+from atts_nse500_orchestrator import build_dag, topological_order  # noqa: E402
+
+
+def test_topological_order_respects_dependencies():
+    dag = {"maintenance": ["load:ratios", "load:quarterly"], "load:quarterly": ["schema"],
+           "load:ratios": ["schema"], "pdfs": ["load:quarterly"], "schema": []}
+    order = topological_order(dag)
+    assert sorted(order) == sorted(dag)
+    for stage, dependencies in dag.items():
+        assert all(order.index(dependency) < order.index(stage) for dependency in dependencies)
+
+
+def test_topological_order_is_deterministic():
+    dag = {"c": [], "a": [], "b": ["a"]}
+    assert topological_order(dag) == ["a", "c", "b"]
+
+
+def test_topological_order_rejects_cycles():
+    with pytest.raises(ValueError, match="cycle"):
+        topological_order({"schema": [], "a": ["b"], "b": ["a"]})
+
+
+@pytest.mark.parametrize("atomic", [False, True])
+def test_built_dag_has_an_order(atomic):
+    dag = build_dag(["fundamental", "quarterly", "ratios"], atomic=atomic)
+    order = topological_order(dag)
+    assert order[0] == "schema"
+    assert set(order) == set(dag)
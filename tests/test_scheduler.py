@@ -0,0 +1,30 @@
+# tests/test_scheduler.py - Deadline and period parsing for the job scheduler
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from atts_nse500_scheduler import parse_duration, period_month  # noqa: E402
+
+
+@pytest.mark.parametrize("text, seconds", [
+    ("90s", 90), ("90", 90), ("30m", 1800), ("2h", 7200), ("1.5h", 5400), (" 10 m ", 600),
+])
+def test_parse_duration(text, seconds):
+    assert parse_duration(text) == seconds
+
+
+@pytest.mark.parametrize("text", ["", "m", "30d", "-5m", "1h30m", "abc"])
+def test_parse_duration_rejects_invalid_text(text):
+    with pytest.raises(ValueError, match="Invalid duration"):
+        parse_duration(text)
+
+
+def test_period_month_orders_quarters():
+    assert period_month("Mar 2024") < period_month("Jun 2024") < period_month("Mar 2025")
+    assert period_month("Dec 2023") + 3 == period_month("Mar 2024")
+
+
+@pytest.mark.parametrize("label", [None, "", "TTM", "March 2024", "Mar", "Mar 24x"])
+def test_period_month_ignores_other_labels(label):
+    assert period_month(label) is None
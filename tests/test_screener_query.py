@@ -0,0 +1,30 @@
+# tests/test_screener_query.py - Parsing screen filters
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from atts_nse500_screener_query import parse_filter  # noqa: E402
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("ratios.roce>20", ("ratios.roce", ">", 20.0)),
+    (" ratios.roce >= 20.5 ", ("ratios.roce", ">=", 20.5)),
+    ("fundamental.stock_pe<=-1", ("fundamental.stock_pe", "<=", -1.0)),
+    ("quarterly.sales!=0", ("quarterly.sales", "!=", 0.0)),
+    ("debt_to_equity<1", ("debt_to_equity", "<", 1.0)),
+])
+def test_parse_filter(text, expected):
+    assert parse_filter(text) == expected
+
+
+@pytest.mark.parametrize("text", ["ratios.roce", "ratios.roce>>20", "ratios.roce>abc", "ratios.roce>20%", ""])
+def test_parse_filter_rejects_malformed_filters(text):
+    with pytest.raises(ValueError, match="Invalid filter"):
+        parse_filter(text)
+
+
+@pytest.mark.parametrize("text", ["ratios.nope>1", "nope.roce>1", "roce>1"])
+def test_parse_filter_rejects_unknown_metrics(text):
+    with pytest.raises(ValueError, match="Unknown metric"):
+        parse_filter(text)